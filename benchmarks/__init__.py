@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+igo-pythonのベンチマーク. リポジトリのトップディレクトリで実行する
+
+  $ python -m benchmarks.startup
+  $ python -m benchmarks.short_queries
+  $ python -m benchmarks.long_runs
+  $ python -m benchmarks.trie_lookups
+  $ python -m benchmarks.suite
+"""
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク用のテキスト. 同じseedからは常に同じテキストが作成される
+
+  short: 検索クエリ程度の短いテキスト(benchmarks.short_queries)
+  news: ニュース記事の段落程度(150〜400文字)のテキスト
+  latin: 英数字と記号が大半を占めるログの行(80〜200文字)
+  runs: 1つの文字種が長く続くテキスト. 未知語の検索で最も遅くなる入力
+"""
+from __future__ import unicode_literals
+import random
+
+from benchmarks.short_queries import make_queries
+
+SUBJECTS = ['政府', '東京都', '同社', '日本銀行', '研究チーム', '警視庁',
+            '首相', '国土交通省', 'トヨタ自動車', '市の担当者', '気象庁',
+            '専門家', '投資家', '外国人観光客', '地元の住民']
+OBJECTS = ['新たな経済対策', '来年度の予算案', '金融政策', 'サービス',
+           '調査の結果', '再発防止策', '新型のスマートフォン', '防災計画',
+           '事故の原因', '株価', '円相場', 'インフラの整備', 'AI技術',
+           'データセンター', '観光需要']
+VERBS = ['発表した', '明らかにした', '決定した', '検討している', '公表した',
+         '見直す方針だ', '強調した', '開始する', '導入すると述べた',
+         '懸念を示した', '注目している', '発表する見通しだ']
+ADVERBIALS = ['{m}月{d}日', '{y}年度に', '今後{n}年間で', '前年比{p}%増の',
+              '約{n}億円をかけて', '{h}時{mi}分ごろ', '午前中に', '先週',
+              '全国{n}か所で', '同日の記者会見で']
+CONNECTIVES = ['また、', 'これに対し、', '一方、', 'さらに、', 'ただ、',
+               '関係者によると、', '']
+
+
+def _adverbial(rnd):
+    return rnd.choice(ADVERBIALS).format(
+        y=rnd.randint(2000, 2030), m=rnd.randint(1, 12), d=rnd.randint(1, 28),
+        n=rnd.randint(2, 500), p=rnd.randint(1, 99), h=rnd.randint(0, 23),
+        mi=rnd.randint(0, 59))
+
+
+def make_sentence(rnd):
+    return '%s%sは%s%sを%s。' % (rnd.choice(CONNECTIVES), rnd.choice(SUBJECTS),
+                              _adverbial(rnd), rnd.choice(OBJECTS),
+                              rnd.choice(VERBS))
+
+
+def make_paragraphs(number, seed=0):
+    """
+    150〜400文字の段落をnumber個作成する
+    """
+    rnd = random.Random(seed)
+    paragraphs = []
+    for _ in range(number):
+        limit = rnd.randint(150, 400)
+        p = ''
+        while len(p) < limit:
+            p += make_sentence(rnd)
+        paragraphs.append(p)
+    return paragraphs
+
+
+LOG_LEVELS = ['INFO', 'WARN', 'ERROR', 'DEBUG']
+LOG_MESSAGES = ['request completed', 'connection reset by peer',
+                'ユーザーの取得に失敗しました', 'cache miss', 'タイムアウト',
+                'retrying in 5s', '設定を再読み込みしました', 'OK']
+
+
+def make_log_lines(number, seed=0):
+    """
+    英数字と記号が大半のログの行をnumber個作成する
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(number):
+        token = ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz0123456789')
+                        for _ in range(rnd.randint(8, 32)))
+        lines.append(
+            '2024-%02d-%02dT%02d:%02d:%02d.%03dZ %s [worker-%d] '
+            'GET /api/v%d/items/%d?token=%s&lang=ja %d %dms %s' % (
+                rnd.randint(1, 12), rnd.randint(1, 28), rnd.randint(0, 23),
+                rnd.randint(0, 59), rnd.randint(0, 59), rnd.randint(0, 999),
+                rnd.choice(LOG_LEVELS), rnd.randint(1, 16),
+                rnd.randint(1, 3), rnd.randint(1, 99999), token,
+                rnd.choice([200, 304, 404, 500]), rnd.randint(1, 3000),
+                rnd.choice(LOG_MESSAGES)))
+    return lines
+
+
+RUN_CHARS = [('hiragana', 'あ'), ('katakana', 'ア'), ('kanji', '漢'),
+             ('alpha', 'a'), ('numeric', '1'), ('fullwidth', 'Ａ'),
+             ('symbol', '!'), ('emoji', '😳')]
+""" (名前, 繰り返す文字) """
+
+
+def make_runs(length=1000):
+    """
+    @return (名前, 同じ文字をlength文字並べたテキスト)のリスト
+    """
+    return [(name, c * length) for name, c in RUN_CHARS]
+
+
+def corpora(scale=1.0):
+    """
+    @param scale テキストの量の倍率
+    @return 名前と, テキストのリストの辞書
+    """
+    n = max(1, int(scale * 1000))
+    result = {
+        'short': make_queries(n * 2),
+        'news': make_paragraphs(max(1, n // 10)),
+        'latin': make_log_lines(max(1, n // 5)),
+    }
+    for name, text in make_runs(max(10, int(scale * 1000))):
+        result['run-' + name] = [text]
+    return result
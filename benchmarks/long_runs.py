@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+1つの文字種が長く続くテキスト(ログ, base64, 圧縮されたスクリプト等)の
+解析時間のベンチマーク. 解析時間がテキストの長さに比例するかを確かめる
+
+  $ python -m benchmarks.long_runs [--lengths 1000,10000,50000]
+                                   [--max-unknown-length 0] [--engine python]
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import time
+
+import igo.tagger
+from benchmarks.corpora import RUN_CHARS
+
+
+def measure(tagger, text, repeat):
+    """
+    @return (最短の解析時間(秒), 形態素数)
+    """
+    t = None
+    for _ in range(repeat):
+        start = time.time()
+        n = len(tagger.wakati(text))
+        elapsed = time.time() - start
+        if t is None or elapsed < t:
+            t = elapsed
+    return t, n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure parse time of long runs of a character class')
+    parser.add_argument('--lengths', default='1000,10000,50000',
+                        help='comma separated lengths of the runs '
+                        '(default: 1000,10000,50000)')
+    parser.add_argument('--max-unknown-length', type=int, default=0,
+                        help='Tagger(max_unknown_length=...) (default: 0, '
+                        'unlimited)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='repeat and report the best (default: 3)')
+    parser.add_argument('--engine', default='python',
+                        choices=['python', 'numpy', 'array'])
+    parser.add_argument('--no-accel', action='store_true',
+                        help='do not use igo._accel')
+    args = parser.parse_args(argv)
+    lengths = [int(x) for x in args.lengths.split(',')]
+    tagger = igo.tagger.Tagger(engine=args.engine,
+                               accel=False if args.no_accel else None,
+                               max_unknown_length=args.max_unknown_length)
+    tagger.warmup()
+    print('%-10s %8s %10s %10s %10s' % ('class', 'length', 'ms',
+                                         'us/char', 'morphemes'))
+    for name, c in RUN_CHARS:
+        for length in lengths:
+            t, n = measure(tagger, c * length, args.repeat)
+            print('%-10s %8d %10.1f %10.2f %10d' %
+                  (name, length, t * 1000, t / length * 1e6, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+短いテキスト(検索クエリ程度, 5〜30文字)の解析速度のベンチマーク
+
+  $ python -m benchmarks.short_queries [-n 5000] [--engine python]
+                                        [--method parse] [--threads 1]
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import random
+import threading
+import time
+
+import igo.tagger
+
+WORDS = ['東京', '大阪', '天気', '明日', 'ラーメン', '美味しい', '店', '駅',
+         '近く', 'の', 'は', 'を', 'で', 'ホテル', '安い', '予約', 'iPhone',
+         '15', 'ケース', '手帳型', '赤ちゃん', '服', '新宿', '渋谷', 'カフェ',
+         '営業時間', 'とは', '意味', 'パスタ', '作り方', '簡単', '2024', '年',
+         '映画', 'ランキング', 'おすすめ', 'スニーカー', 'メンズ', 'ａｂｃ', '　']
+
+
+def make_queries(number, seed=0):
+    """
+    5〜30文字のクエリをnumber個作成する. 同じseedからは同じクエリが作成される
+    """
+    rnd = random.Random(seed)
+    queries = []
+    while len(queries) < number:
+        limit = rnd.randint(5, 30)
+        q = ''
+        while len(q) < limit:
+            q += rnd.choice(WORDS)
+        queries.append(q[:limit])
+    return queries
+
+
+def run(tagger, method, queries, threads):
+    fn = getattr(tagger, method)
+
+    def work(qs):
+        for q in qs:
+            fn(q)
+
+    if threads <= 1:
+        t = time.time()
+        work(queries)
+        return time.time() - t
+    workers = [threading.Thread(target=work, args=(queries[i::threads], ))
+               for i in range(threads)]
+    t = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.time() - t
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure parse throughput of short queries')
+    parser.add_argument('-n', '--number', type=int, default=5000,
+                        help='number of queries (default: 5000)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='repeat and report the best (default: 3)')
+    parser.add_argument('--engine', default='python',
+                        choices=['python', 'numpy', 'array'])
+    parser.add_argument('--method', default='parse',
+                        choices=['parse', 'wakati'])
+    parser.add_argument('--threads', type=int, default=1,
+                        help='number of threads sharing a Tagger')
+    parser.add_argument('--no-accel', action='store_true',
+                        help='do not use igo._accel')
+    args = parser.parse_args(argv)
+    tagger = igo.tagger.Tagger(engine=args.engine,
+                               accel=False if args.no_accel else None)
+    tagger.warmup()
+    queries = make_queries(args.number)
+    chars = sum(len(q) for q in queries)
+    t = min(run(tagger, args.method, queries, args.threads)
+            for _ in range(args.repeat))
+    print('%d queries, %d chars in %.3f s' % (len(queries), chars, t))
+    print('%.0f queries/s, %.0f chars/s, %.1f us/query' %
+          (len(queries) / t, chars / t, t / len(queries) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
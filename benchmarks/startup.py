@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+起動時間のベンチマーク
+
+新しいプロセスで以下の時間を計測し, 中央値を表示する
+
+  import: import igo.tagger
+  construct: Tagger()
+  warmup: Tagger.warmup() (--warmupを指定した場合)
+  first parse: 最初のparse
+
+  $ python -m benchmarks.startup [-n 20] [--dic ipadic] [--no-mmap] [--warmup]
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = r'''
+import json, sys, time
+t0 = time.time()
+import igo.tagger
+t1 = time.time()
+opts = json.loads(sys.argv[1])
+warmup = opts.pop('warmup')
+t = igo.tagger.Tagger(**opts)
+t2 = time.time()
+if warmup:
+    t.warmup()
+t3 = time.time()
+t.parse(u'すももももももももの'
+        u'うち')
+t4 = time.time()
+print(json.dumps([t1 - t0, t2 - t1, t3 - t2, t4 - t3]))
+'''
+
+STAGES = ['import', 'construct', 'warmup', 'first parse']
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    return (values[n // 2] + values[(n - 1) // 2]) / 2.0
+
+
+def run(options, number):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    results = []
+    for _ in range(number):
+        out = subprocess.check_output(
+            [sys.executable, '-c', CHILD, json.dumps(options)], env=env)
+        results.append(json.loads(out.decode('ascii')))
+    return [median(r) for r in zip(*results)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure import, construct and first parse time')
+    parser.add_argument('-n', '--number', type=int, default=20,
+                        help='number of processes (default: 20)')
+    parser.add_argument('--dic', default=None,
+                        help='dictionary (default: bundled ipadic)')
+    parser.add_argument('--no-mmap', action='store_true',
+                        help='read the dictionary without mmap')
+    parser.add_argument('--warmup', action='store_true',
+                        help='call Tagger.warmup() before the first parse')
+    args = parser.parse_args(argv)
+    options = dict(path=args.dic, warmup=args.warmup)
+    if args.no_mmap:
+        options['use_mmap'] = False
+    times = run(options, args.number)
+    for stage, t in zip(STAGES, times):
+        print('%-12s %8.2f ms' % (stage, t * 1000))
+    print('%-12s %8.2f ms' % ('total', sum(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+バンドルされたIPA辞書での総合的なベンチマーク
+
+以下を計測し, 結果を表示する. -oを指定するとJSONで保存する.
+  throughput: 各テキスト(benchmarks.corpora)のparse, wakatiの文字数/秒と形態素数/秒
+  stages: 段階毎の時間. parseをigo.statsで計測し, trie(単語辞書の検索),
+          unknown(未知語の検索), viterbi(連接コストと最適パスの連結),
+          decode(表層形と素性のデコード)の時間を求める. 段階の区分はigo.statsを参照
+  startup: 新しいプロセスでのimport, Tagger(), 最初のparseの時間(中央値)
+  peak_rss_kb: 最大常駐メモリ(KB). startupのプロセスとこのプロセス
+
+--baselineに以前の結果を指定すると比較し, いずれかの計測値が--max-slowdown%より
+遅くなっていれば終了コード1で終了する.
+
+  $ python -m benchmarks.suite -o result.json
+  $ python -m benchmarks.suite --baseline result.json --max-slowdown 10
+"""
+from __future__ import print_function, division
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import igo.tagger
+from igo.stats import Stats
+from benchmarks import corpora, startup
+
+STAGES = ['trie', 'unknown', 'viterbi', 'decode']
+_STAGE_TIMERS = ['search', 'unknown', 'viterbi', 'decode']
+
+
+def best(fn, repeat, min_time=0.05):
+    """
+    fnの1回あたりの時間をrepeat回計測し, 最短の時間を返す
+    短い処理は合計min_time秒以上になるまで繰り返して平均する
+    """
+    times = []
+    for _ in range(repeat):
+        n = 0
+        t = time.time()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.time() - t
+            if elapsed >= min_time:
+                break
+        times.append(elapsed / n)
+    return min(times)
+
+
+def throughput(tagger, texts, method, repeat):
+    fn = getattr(tagger, method)
+    chars = sum(len(s) for s in texts)
+    morphemes = sum(len(fn(s)) for s in texts)
+
+    def work():
+        for s in texts:
+            fn(s)
+
+    t = best(work, repeat)
+    return dict(seconds=t, chars_per_s=chars / t, morphemes_per_s=morphemes / t)
+
+
+def stages(tagger, texts, repeat, min_time=0.05):
+    """
+    段階毎の時間をigo.statsで計測する. 計測用のラッパーの負荷を含む
+    短いテキストは合計min_time秒以上になるまで繰り返して平均する
+
+    @return 段階名と時間(秒)の辞書. 段階毎にrepeat回の最短の時間
+    """
+    stats = Stats()
+    result = {}
+    saved = tagger.stats
+    tagger.stats = stats
+    try:
+        for _ in range(repeat):
+            stats.reset()
+            n = 0
+            t = time.time()
+            while True:
+                for s in texts:
+                    tagger.parse(s)
+                n += 1
+                if time.time() - t >= min_time:
+                    break
+            d = stats.as_dict()
+            for name, key in zip(STAGES, _STAGE_TIMERS):
+                v = d[key] / n
+                if name not in result or v < result[name]:
+                    result[name] = v
+    finally:
+        tagger.stats = saved
+    return result
+
+
+def peak_rss_kb(who):
+    if resource is None:
+        return None
+    kb = resource.getrusage(who).ru_maxrss
+    # bytes on macOS
+    return kb // 1024 if sys.platform == 'darwin' else kb
+
+
+def run(engine='python', accel=None, scale=1.0, repeat=3, processes=5):
+    """
+    ベンチマークを実行する
+
+    @return JSONに変換できる結果
+    """
+    texts = corpora.corpora(scale)
+    options = dict(path=None, warmup=False, engine=engine)
+    if accel is not None:
+        options['accel'] = accel
+    names = ['import', 'construct', 'warmup', 'first_parse']
+    startup_times = dict(zip(names, startup.run(options, processes)))
+    del startup_times['warmup']
+
+    t = time.time()
+    tagger = igo.tagger.Tagger(engine=engine, accel=accel)
+    tagger.warmup()
+    startup_times['construct_and_warmup'] = time.time() - t
+    result = dict(
+        meta=dict(python=platform.python_version(),
+                  implementation=platform.python_implementation(),
+                  platform=platform.platform(), engine=engine,
+                  accel=tagger.dictionary._accel is not None, scale=scale,
+                  repeat=repeat,
+                  date=datetime.datetime.now().isoformat()),
+        startup=startup_times, throughput={}, stages={})
+    for name in sorted(texts):
+        for method in ['parse', 'wakati']:
+            result['throughput']['%s/%s' % (method, name)] = throughput(
+                tagger, texts[name], method, repeat)
+        result['stages'][name] = stages(tagger, texts[name], repeat)
+    tagger.release()
+    result['peak_rss_kb'] = dict(
+        startup=peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+        suite=peak_rss_kb(resource.RUSAGE_SELF) if resource else None)
+    return result
+
+
+def metrics(result):
+    """
+    比較する計測値を取り出す
+
+    @return 名前と(値, 大きいほど良いか)の辞書
+    """
+    m = {}
+    for name, v in result.get('throughput', {}).items():
+        m['throughput/%s/chars_per_s' % name] = (v['chars_per_s'], True)
+        m['throughput/%s/morphemes_per_s' % name] = (v['morphemes_per_s'],
+                                                     True)
+    for name, v in result.get('stages', {}).items():
+        for stage, t in v.items():
+            m['stages/%s/%s' % (name, stage)] = (t, False)
+    for name, t in result.get('startup', {}).items():
+        m['startup/%s' % name] = (t, False)
+    for name, kb in result.get('peak_rss_kb', {}).items():
+        if kb:
+            m['peak_rss_kb/%s' % name] = (kb, False)
+    return m
+
+
+def compare(baseline, result, max_slowdown=10.0, min_time=0.001):
+    """
+    結果をbaselineと比較する
+
+    @param max_slowdown 許容する悪化の割合(%)
+    @param min_time これより短い時間は誤差が大きいため比較しない(秒)
+    @return (名前, baselineの値, 値, 悪化した割合(%))のリスト. 悪化した順
+    """
+    base = metrics(baseline)
+    regressions = []
+    for name, (value, higher) in sorted(metrics(result).items()):
+        if name not in base:
+            continue
+        b = base[name][0]
+        if not b or not value:
+            continue
+        if not higher and max(b, value) < min_time and \
+                not name.startswith('peak_rss_kb'):
+            continue
+        slowdown = (b / value - 1 if higher else value / b - 1) * 100
+        if slowdown > max_slowdown:
+            regressions.append((name, b, value, slowdown))
+    regressions.sort(key=lambda r: -r[3])
+    return regressions
+
+
+def report(result, out=sys.stdout):
+    print('engine=%(engine)s accel=%(accel)s python=%(python)s' %
+          result['meta'], file=out)
+    print('%-30s %12s %14s' % ('throughput', 'chars/s', 'morphemes/s'),
+          file=out)
+    for name, v in sorted(result['throughput'].items()):
+        print('%-30s %12.0f %14.0f' % (name, v['chars_per_s'],
+                                       v['morphemes_per_s']), file=out)
+    print('%-30s' % 'stages(ms)' + ''.join('%10s' % s for s in STAGES),
+          file=out)
+    for name, v in sorted(result['stages'].items()):
+        print('%-30s' % name + ''.join('%10.1f' % (v[s] * 1000)
+                                       for s in STAGES), file=out)
+    for name, t in sorted(result['startup'].items()):
+        print('%-30s %10.1f ms' % ('startup/' + name, t * 1000), file=out)
+    for name, kb in sorted(result['peak_rss_kb'].items()):
+        if kb:
+            print('%-30s %10d KB' % ('peak_rss/' + name, kb), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure throughput, stage timings, startup time and '
+        'memory of the bundled dictionary, and compare with a baseline')
+    parser.add_argument('-o', '--output', help='write the result as JSON')
+    parser.add_argument('--baseline', help='JSON result to compare with')
+    parser.add_argument('--max-slowdown', type=float, default=10.0,
+                        help='fail if a metric is slower than the baseline '
+                        'by this percentage (default: 10)')
+    parser.add_argument('--engine', default='python',
+                        choices=['python', 'numpy', 'array'])
+    parser.add_argument('--no-accel', action='store_true',
+                        help='do not use igo._accel')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='amount of the texts (default: 1.0)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='repeat and take the best (default: 3)')
+    parser.add_argument('--processes', type=int, default=5,
+                        help='number of processes for the startup time '
+                        '(default: 5)')
+    args = parser.parse_args(argv)
+    result = run(args.engine, False if args.no_accel else None, args.scale,
+                 args.repeat, args.processes)
+    report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.max_slowdown)
+        for name, b, value, slowdown in regressions:
+            print('REGRESSION %s: %.4g -> %.4g (%+.1f%%)' %
+                  (name, b, value, slowdown))
+        if regressions:
+            sys.exit(1)
+        print('no regression over %.1f%%' % args.max_slowdown)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+単語辞書のトライの共通接頭辞検索(Searcher.commonprefix_search,
+Searcher.commonprefix)の速度のベンチマーク. テキストの各位置から検索する
+
+  $ python -m benchmarks.trie_lookups [-n 20] [--paragraphs 20]
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import array
+import timeit
+
+import igo.accel
+import igo.tagger
+from igo.dictreader import UTF16Codec
+from benchmarks.corpora import make_paragraphs
+
+
+def search_all(trie, text):
+    """
+    commonprefix_searchでテキストの全ての位置から検索する
+    """
+    search = trie.commonprefix_search
+    result = []
+    for i in range(len(text)):
+        search(text, i, lambda *a: result.append(a))
+    return result
+
+
+def commonprefix_all(trie, text):
+    """
+    commonprefixでテキストの全ての位置から検索する
+    """
+    commonprefix = trie.commonprefix
+    return [commonprefix(text, i) for i in range(len(text))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='measure lookups/s of the trie of the word dictionary')
+    parser.add_argument('-n', '--number', type=int, default=20,
+                        help='number of searches of the text (default: 20)')
+    parser.add_argument('--paragraphs', type=int, default=20,
+                        help='number of paragraphs of the text (default: 20)')
+    args = parser.parse_args(argv)
+    tagger = igo.tagger.Tagger(accel=False)
+    trie = tagger.wdc.trie
+    text = array.array('H', UTF16Codec.encode(
+        ''.join(make_paragraphs(args.paragraphs)))[0])
+    cases = [('commonprefix_search', search_all),
+             ('commonprefix', commonprefix_all)]
+    for name, fn in cases:
+        t = timeit.timeit(lambda: fn(trie, text), number=args.number)
+        print('%-24s %12.0f lookups/s' % (name, args.number * len(text) / t))
+    if igo.accel.available():
+        trie.accelerate(igo.accel.load(True))
+        t = timeit.timeit(lambda: commonprefix_all(trie, text),
+                          number=args.number)
+        print('%-24s %12.0f lookups/s' % ('commonprefix(accel)',
+                                          args.number * len(text) / t))
+    tagger.release()
+
+
+if __name__ == '__main__':
+    main()
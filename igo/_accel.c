@@ -0,0 +1,620 @@
+/*
+ * Optional accelerator for the hot loops of igo.
+ *
+ * Every function here is a C port of a pure Python counterpart and must
+ * return exactly the same result:
+ *
+ *   Trie.commonprefix              <- igo.trie.Searcher.commonprefix
+ *   CharCategory.unknown_lengths   <- the scans of igo.dictionary.Unknown.search
+ *   CharCategory.run_ends          <- igo.dictionary.Unknown.run_ends
+ *   Viterbi.set_mincost_node       <- igo.tagger.Tagger.set_mincost_node
+ *   Viterbi.min_link               <- the inner loop of igo.lattice.Lattice._add
+ *
+ * The dictionary arrays are read through the buffer protocol, so mmap'ed
+ * memoryviews and array.array objects are used without copying.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+
+static PyObject *str_cost;
+static PyObject *str_prev;
+static PyObject *str_left_id;
+static PyObject *str_right_id;
+
+static int
+get_buffer(PyObject *obj, Py_buffer *view, Py_ssize_t itemsize,
+           const char *name)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+        return -1;
+    if (view->itemsize != itemsize) {
+        PyErr_Format(PyExc_ValueError, "%s: item size must be %zd, not %zd",
+                     name, itemsize, view->itemsize);
+        PyBuffer_Release(view);
+        return -1;
+    }
+    return 0;
+}
+
+static int
+append_ssize(PyObject *list, Py_ssize_t v)
+{
+    PyObject *o = PyLong_FromSsize_t(v);
+    int r;
+    if (o == NULL)
+        return -1;
+    r = PyList_Append(list, o);
+    Py_DECREF(o);
+    return r;
+}
+
+/* Trie ------------------------------------------------------------------ */
+
+typedef struct {
+    PyObject_HEAD
+    Py_buffer base;  /* int32 */
+    Py_buffer chck;  /* uint16 */
+    Py_buffer begs;  /* int32 */
+    Py_buffer lens;  /* int16 */
+    Py_buffer tail;  /* uint16 */
+    int initialized;
+} TrieObject;
+
+static int
+Trie_init(TrieObject *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *base, *chck, *begs, *lens, *tail;
+    if (self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "already initialized");
+        return -1;
+    }
+    if (!PyArg_ParseTuple(args, "OOOOO:Trie", &base, &chck, &begs, &lens,
+                          &tail))
+        return -1;
+    if (get_buffer(base, &self->base, 4, "base") < 0)
+        return -1;
+    if (get_buffer(chck, &self->chck, 2, "chck") < 0)
+        goto fail_chck;
+    if (get_buffer(begs, &self->begs, 4, "begs") < 0)
+        goto fail_begs;
+    if (get_buffer(lens, &self->lens, 2, "lens") < 0)
+        goto fail_lens;
+    if (get_buffer(tail, &self->tail, 2, "tail") < 0)
+        goto fail_tail;
+    self->initialized = 1;
+    return 0;
+fail_tail:
+    PyBuffer_Release(&self->lens);
+fail_lens:
+    PyBuffer_Release(&self->begs);
+fail_begs:
+    PyBuffer_Release(&self->chck);
+fail_chck:
+    PyBuffer_Release(&self->base);
+    return -1;
+}
+
+static void
+Trie_dealloc(TrieObject *self)
+{
+    if (self->initialized) {
+        PyBuffer_Release(&self->base);
+        PyBuffer_Release(&self->chck);
+        PyBuffer_Release(&self->begs);
+        PyBuffer_Release(&self->lens);
+        PyBuffer_Release(&self->tail);
+    }
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+Trie_commonprefix(TrieObject *self, PyObject *args)
+{
+    PyObject *keyobj, *result;
+    Py_ssize_t start, length, i, nnodes;
+    Py_buffer key;
+    const uint16_t *k, *chck, *tail;
+    const int32_t *base, *begs;
+    const int16_t *lens;
+    int32_t node, idx;
+
+    if (!self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "On:commonprefix", &keyobj, &start))
+        return NULL;
+    if (get_buffer(keyobj, &key, 2, "key") < 0)
+        return NULL;
+    result = PyList_New(0);
+    if (result == NULL)
+        goto done;
+
+    k = (const uint16_t *)key.buf;
+    length = key.len / 2;
+    base = (const int32_t *)self->base.buf;
+    chck = (const uint16_t *)self->chck.buf;
+    begs = (const int32_t *)self->begs.buf;
+    lens = (const int16_t *)self->lens.buf;
+    tail = (const uint16_t *)self->tail.buf;
+    nnodes = self->base.len / 4;
+
+    node = base[0];
+    i = start;
+    for (;;) {
+        uint16_t code;
+        if (node < 0 || node >= nnodes)
+            break;
+        if (chck[node] == 0) {
+            if (append_ssize(result, i - start) < 0 ||
+                append_ssize(result, -base[node] - 1) < 0)
+                goto error;
+        }
+        if (i >= length)
+            break;
+        code = k[i++];
+        idx = node + code;
+        if (idx >= nnodes)
+            break;
+        node = base[idx];
+        if (chck[idx] != code)
+            break;
+        if (node < 0) {
+            Py_ssize_t node_id = -node - 1, l, j;
+            const uint16_t *t;
+            l = lens[node_id];
+            t = tail + begs[node_id];
+            if (length - i < l)
+                break;
+            for (j = 0; j < l; j++) {
+                if (k[i + j] != t[j])
+                    break;
+            }
+            if (j == l) {
+                if (append_ssize(result, i - start + l) < 0 ||
+                    append_ssize(result, node_id) < 0)
+                    goto error;
+            }
+            break;
+        }
+    }
+    goto done;
+error:
+    Py_CLEAR(result);
+done:
+    PyBuffer_Release(&key);
+    return result;
+}
+
+static PyMethodDef Trie_methods[] = {
+    {"commonprefix", (PyCFunction)Trie_commonprefix, METH_VARARGS,
+     "commonprefix(key, start) -> [length, key_id, ...]"},
+    {NULL}
+};
+
+static PyTypeObject TrieType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "igo._accel.Trie",
+    sizeof(TrieObject),
+};
+
+/* CharCategory ---------------------------------------------------------- */
+
+typedef struct {
+    PyObject_HEAD
+    Py_buffer eql_masks;  /* int32 */
+    int initialized;
+} CharCategoryObject;
+
+static int
+CharCategory_init(CharCategoryObject *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *eql_masks;
+    if (self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "already initialized");
+        return -1;
+    }
+    if (!PyArg_ParseTuple(args, "O:CharCategory", &eql_masks))
+        return -1;
+    if (get_buffer(eql_masks, &self->eql_masks, 4, "eql_masks") < 0)
+        return -1;
+    if (self->eql_masks.len / 4 < 0x10000) {
+        PyErr_SetString(PyExc_ValueError, "eql_masks is too short");
+        PyBuffer_Release(&self->eql_masks);
+        return -1;
+    }
+    self->initialized = 1;
+    return 0;
+}
+
+static void
+CharCategory_dealloc(CharCategoryObject *self)
+{
+    if (self->initialized)
+        PyBuffer_Release(&self->eql_masks);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+CharCategory_unknown_lengths(CharCategoryObject *self, PyObject *args)
+{
+    PyObject *textobj, *result;
+    Py_ssize_t start, maxlen, length, limit, i;
+    int group;
+    Py_buffer text;
+    const uint16_t *t;
+    const int32_t *eql;
+    int32_t mask;
+
+    if (!self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "Onnp:unknown_lengths", &textobj, &start,
+                          &maxlen, &group))
+        return NULL;
+    if (get_buffer(textobj, &text, 2, "text") < 0)
+        return NULL;
+    t = (const uint16_t *)text.buf;
+    length = text.len / 2;
+    if (start < 0 || start >= length) {
+        PyBuffer_Release(&text);
+        PyErr_SetString(PyExc_IndexError, "start out of range");
+        return NULL;
+    }
+    result = PyList_New(0);
+    if (result == NULL)
+        goto done;
+
+    eql = (const int32_t *)self->eql_masks.buf;
+    mask = eql[t[start]];
+    limit = maxlen + start < length ? maxlen + start : length;
+    for (i = start + 1; i < limit; i++) {
+        if (append_ssize(result, i - start) < 0)
+            goto error;
+        if (!(mask & eql[t[i]]))
+            goto done;
+    }
+    /* a node of length 0 never be on a path */
+    if (limit > start && append_ssize(result, limit - start) < 0)
+        goto error;
+    if (group && limit < length) {
+        for (i = limit; i < length; i++) {
+            if (!(mask & eql[t[i]]))
+                break;
+        }
+        if (append_ssize(result, i - start) < 0)
+            goto error;
+    }
+    goto done;
+error:
+    Py_CLEAR(result);
+done:
+    PyBuffer_Release(&text);
+    return result;
+}
+
+static PyObject *
+CharCategory_run_ends(CharCategoryObject *self, PyObject *args)
+{
+    PyObject *textobj, *outobj;
+    Py_ssize_t maxlen, length, i, j;
+    Py_buffer text, out;
+    const uint16_t *t;
+    const int32_t *eql;
+    int32_t *e, mask, m;
+
+    if (!self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "OOn:run_ends", &textobj, &outobj, &maxlen))
+        return NULL;
+    if (get_buffer(textobj, &text, 2, "text") < 0)
+        return NULL;
+    if (PyObject_GetBuffer(outobj, &out, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT |
+                           PyBUF_WRITABLE) < 0) {
+        PyBuffer_Release(&text);
+        return NULL;
+    }
+    length = text.len / 2;
+    if (out.itemsize != 4 || out.len / 4 < length) {
+        PyErr_SetString(PyExc_ValueError, "out must be int32[len(text)]");
+        goto error;
+    }
+    t = (const uint16_t *)text.buf;
+    e = (int32_t *)out.buf;
+    eql = (const int32_t *)self->eql_masks.buf;
+    /* backwards, a run ends where the run of the next character of the same
+       mask ends */
+    for (i = length - 1; i >= 0; i--) {
+        mask = eql[t[i]];
+        for (j = i + 1; j < length; j++) {
+            m = eql[t[j]];
+            if (!(mask & m))
+                break;
+            if (m == mask) {
+                j = e[j];
+                break;
+            }
+        }
+        e[i] = (int32_t)j;
+    }
+    if (maxlen > 0) {
+        for (i = 0; i < length; i++) {
+            if (e[i] - i > maxlen)
+                e[i] = (int32_t)(i + maxlen);
+        }
+    }
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&text);
+    Py_RETURN_NONE;
+error:
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&text);
+    return NULL;
+}
+
+static PyMethodDef CharCategory_methods[] = {
+    {"unknown_lengths", (PyCFunction)CharCategory_unknown_lengths,
+     METH_VARARGS,
+     "unknown_lengths(text, start, length, group) -> [length, ...]"},
+    {"run_ends", (PyCFunction)CharCategory_run_ends, METH_VARARGS,
+     "run_ends(text, out, max_length) -> None, see Unknown.run_ends"},
+    {NULL}
+};
+
+static PyTypeObject CharCategoryType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "igo._accel.CharCategory",
+    sizeof(CharCategoryObject),
+};
+
+/* Viterbi --------------------------------------------------------------- */
+
+typedef struct {
+    PyObject_HEAD
+    Py_buffer matrix;  /* int16 */
+    Py_ssize_t left_size;
+    int initialized;
+} ViterbiObject;
+
+static int
+Viterbi_init(ViterbiObject *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *matrix;
+    if (self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "already initialized");
+        return -1;
+    }
+    if (!PyArg_ParseTuple(args, "On:Viterbi", &matrix, &self->left_size))
+        return -1;
+    if (get_buffer(matrix, &self->matrix, 2, "matrix") < 0)
+        return -1;
+    self->initialized = 1;
+    return 0;
+}
+
+static void
+Viterbi_dealloc(ViterbiObject *self)
+{
+    if (self->initialized)
+        PyBuffer_Release(&self->matrix);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int
+get_long(PyObject *obj, PyObject *name, long long *v)
+{
+    PyObject *o = PyObject_GetAttr(obj, name);
+    if (o == NULL)
+        return -1;
+    *v = PyLong_AsLongLong(o);
+    Py_DECREF(o);
+    if (*v == -1 && PyErr_Occurred())
+        return -1;
+    return 0;
+}
+
+static PyObject *
+Viterbi_set_mincost_node(ViterbiObject *self, PyObject *args)
+{
+    PyObject *vn, *prevs, *seq, *best, *cost;
+    Py_ssize_t n, i, size;
+    long long left_id, vn_cost, mincost = 0, c, p_cost, right_id;
+    const int16_t *matrix;
+
+    if (!self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "OO:set_mincost_node", &vn, &prevs))
+        return NULL;
+    if (get_long(vn, str_left_id, &left_id) < 0)
+        return NULL;
+    seq = PySequence_Fast(prevs, "prevs must be a sequence");
+    if (seq == NULL)
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    if (n == 0) {
+        Py_DECREF(seq);
+        PyErr_SetString(PyExc_IndexError, "prevs is empty");
+        return NULL;
+    }
+    matrix = (const int16_t *)self->matrix.buf;
+    size = self->matrix.len / 2;
+    best = NULL;
+    for (i = 0; i < n; i++) {
+        PyObject *p = PySequence_Fast_GET_ITEM(seq, i);
+        Py_ssize_t idx;
+        if (get_long(p, str_cost, &p_cost) < 0 ||
+            get_long(p, str_right_id, &right_id) < 0) {
+            Py_DECREF(seq);
+            return NULL;
+        }
+        idx = (Py_ssize_t)(left_id * self->left_size + right_id);
+        if (idx < 0 || idx >= size) {
+            Py_DECREF(seq);
+            PyErr_SetString(PyExc_IndexError, "context id out of range");
+            return NULL;
+        }
+        c = p_cost + matrix[idx];
+        if (best == NULL || c < mincost) {
+            mincost = c;
+            best = p;
+        }
+    }
+    if (PyObject_SetAttr(vn, str_prev, best) < 0 ||
+        get_long(vn, str_cost, &vn_cost) < 0) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    Py_DECREF(seq);
+    cost = PyLong_FromLongLong(vn_cost + mincost);
+    if (cost == NULL)
+        return NULL;
+    if (PyObject_SetAttr(vn, str_cost, cost) < 0) {
+        Py_DECREF(cost);
+        return NULL;
+    }
+    Py_DECREF(cost);
+    Py_INCREF(vn);
+    return vn;
+}
+
+static PyObject *
+Viterbi_min_link(ViterbiObject *self, PyObject *args)
+{
+    PyObject *costs, *rights, *cseq, *rseq;
+    Py_ssize_t n, i, best = 0, size, idx;
+    long long left_id, mincost = 0, c, cost, right_id;
+    const int16_t *matrix;
+
+    if (!self->initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "LOO:min_link", &left_id, &costs, &rights))
+        return NULL;
+    cseq = PySequence_Fast(costs, "costs must be a sequence");
+    if (cseq == NULL)
+        return NULL;
+    rseq = PySequence_Fast(rights, "rights must be a sequence");
+    if (rseq == NULL) {
+        Py_DECREF(cseq);
+        return NULL;
+    }
+    n = PySequence_Fast_GET_SIZE(cseq);
+    if (n == 0 || n != PySequence_Fast_GET_SIZE(rseq)) {
+        PyErr_SetString(PyExc_IndexError, "invalid length of costs");
+        goto error;
+    }
+    matrix = (const int16_t *)self->matrix.buf;
+    size = self->matrix.len / 2;
+    for (i = 0; i < n; i++) {
+        cost = PyLong_AsLongLong(PySequence_Fast_GET_ITEM(cseq, i));
+        if (cost == -1 && PyErr_Occurred())
+            goto error;
+        right_id = PyLong_AsLongLong(PySequence_Fast_GET_ITEM(rseq, i));
+        if (right_id == -1 && PyErr_Occurred())
+            goto error;
+        idx = (Py_ssize_t)(left_id * self->left_size + right_id);
+        if (idx < 0 || idx >= size) {
+            PyErr_SetString(PyExc_IndexError, "context id out of range");
+            goto error;
+        }
+        c = cost + matrix[idx];
+        if (i == 0 || c < mincost) {
+            mincost = c;
+            best = i;
+        }
+    }
+    Py_DECREF(cseq);
+    Py_DECREF(rseq);
+    return Py_BuildValue("nL", best, mincost);
+error:
+    Py_DECREF(cseq);
+    Py_DECREF(rseq);
+    return NULL;
+}
+
+static PyMethodDef Viterbi_methods[] = {
+    {"set_mincost_node", (PyCFunction)Viterbi_set_mincost_node,
+     METH_VARARGS, "set_mincost_node(vn, prevs) -> vn"},
+    {"min_link", (PyCFunction)Viterbi_min_link, METH_VARARGS,
+     "min_link(left_id, costs, right_ids) -> (index, mincost)"},
+    {NULL}
+};
+
+static PyTypeObject ViterbiType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "igo._accel.Viterbi",
+    sizeof(ViterbiObject),
+};
+
+/* module ---------------------------------------------------------------- */
+
+static struct PyModuleDef accelmodule = {
+    PyModuleDef_HEAD_INIT,
+    "igo._accel",
+    "C implementation of the hot loops of igo",
+    -1,
+    NULL,
+};
+
+static int
+ready_type(PyObject *m, PyTypeObject *type, const char *name,
+           initproc init, destructor dealloc, PyMethodDef *methods,
+           const char *doc)
+{
+    type->tp_flags = Py_TPFLAGS_DEFAULT;
+    type->tp_new = PyType_GenericNew;
+    type->tp_init = init;
+    type->tp_dealloc = dealloc;
+    type->tp_methods = methods;
+    type->tp_doc = doc;
+    if (PyType_Ready(type) < 0)
+        return -1;
+    Py_INCREF(type);
+    if (PyModule_AddObject(m, name, (PyObject *)type) < 0) {
+        Py_DECREF(type);
+        return -1;
+    }
+    return 0;
+}
+
+PyMODINIT_FUNC
+PyInit__accel(void)
+{
+    PyObject *m;
+
+    str_cost = PyUnicode_InternFromString("cost");
+    str_prev = PyUnicode_InternFromString("prev");
+    str_left_id = PyUnicode_InternFromString("left_id");
+    str_right_id = PyUnicode_InternFromString("right_id");
+    if (!str_cost || !str_prev || !str_left_id || !str_right_id)
+        return NULL;
+
+    m = PyModule_Create(&accelmodule);
+    if (m == NULL)
+        return NULL;
+    if (ready_type(m, &TrieType, "Trie", (initproc)Trie_init,
+                   (destructor)Trie_dealloc, Trie_methods,
+                   "Trie(base, chck, begs, lens, tail)") < 0 ||
+        ready_type(m, &CharCategoryType, "CharCategory",
+                   (initproc)CharCategory_init,
+                   (destructor)CharCategory_dealloc, CharCategory_methods,
+                   "CharCategory(eql_masks)") < 0 ||
+        ready_type(m, &ViterbiType, "Viterbi", (initproc)Viterbi_init,
+                   (destructor)Viterbi_dealloc, Viterbi_methods,
+                   "Viterbi(matrix, left_size)") < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+#ifdef Py_GIL_DISABLED
+    /* the objects only read their buffers after initialization */
+    PyUnstable_Module_SetGIL(m, Py_MOD_GIL_NOT_USED);
+#endif
+    return m;
+}
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Cで実装された高速化モジュール(igo._accel)の読み込み
+
+igo._accelはCPythonでのインストール時にビルドされる.
+ビルドされていない環境(PyPy, IronPython等)ではPythonの実装が使われる.
+環境変数IGO_ACCEL=0で高速化モジュールを無効にできる.
+"""
+import os
+
+try:
+    from igo import _accel
+except ImportError:
+    _accel = None
+
+
+def available():
+    """
+    @return 高速化モジュールが利用可能かどうか
+    """
+    return _accel is not None
+
+
+def load(accel=None):
+    """
+    高速化モジュールを返す
+
+    @param accel None: 利用可能であれば使用する(IGO_ACCEL=0の場合は使用しない),
+                 True: 必ず使用する, False: 使用しない
+    @return igo._accelモジュール. 使用しない場合はNone
+    """
+    if accel is None:
+        return _accel if os.getenv('IGO_ACCEL', '1') != '0' else None
+    if accel:
+        if _accel is None:
+            raise ImportError('igo._accel is not available')
+        return _accel
+    return None
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+asyncioから形態素解析を行うためのラッパー (Python 3.6以降)
+
+解析はスレッドプールまたはプロセスプールで実行され, イベントループをブロックしない.
+
+  >>> tagger = AsyncTagger(max_concurrency=4)
+  >>> ms = await tagger.parse(text)
+  >>> async for m in tagger.iter_parse(chunks):
+  ...     print(m.surface)
+"""
+import asyncio
+import collections
+import concurrent.futures
+import os
+import sys
+import time
+
+import igo.tagger
+from igo.tagger import Morpheme, Tagger, split_sentences
+
+Metrics = collections.namedtuple(
+    'Metrics', ['count', 'errors', 'cancelled', 'inflight', 'p50', 'p90',
+                'p99', 'max'])
+""" AsyncTagger.metrics()の結果. 遅延の単位は秒 """
+
+if sys.version_info >= (3, 7):
+    _get_running_loop = asyncio.get_running_loop
+else:
+    _get_running_loop = asyncio.get_event_loop
+
+
+def _call_in_worker(options, method, *args):
+    tagger = igo.tagger._worker_tagger
+    if tagger is None:
+        # for executors without an initializer (Python < 3.7)
+        _init_worker(options)
+        tagger = igo.tagger._worker_tagger
+    return getattr(tagger, method)(*args)
+
+
+def _init_worker(options):
+    igo.tagger._init_worker(options)
+    igo.tagger._worker_tagger.warmup()
+
+
+def _utf16_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _percentile(values, p):
+    k = (len(values) - 1) * p / 100.0
+    i = int(k)
+    if i + 1 < len(values):
+        return values[i] + (values[i + 1] - values[i]) * (k - i)
+    return values[i]
+
+
+class AsyncTagger(object):
+    """
+    asyncioから使用するTagger
+
+    parse, wakatiはexecutorで実行される. executor='thread'の場合は1つのTaggerを
+    スレッド間で共有し, executor='process'の場合は各ワーカープロセスが辞書を
+    読み込んで保持する.
+    同時に実行される解析の数はmax_concurrencyで制限され, 上限に達すると
+    parse等の呼び出し側が待たされる. 待っている間や実行中に呼び出し側が
+    キャンセルされた場合, 開始前の解析は取り消される. 開始済みの解析は最後まで
+    実行され, 終了するまで同時実行数に数えられる.
+    1つのAsyncTaggerは1つのイベントループから使用すること.
+    """
+
+    def __init__(self, path=None, executor='thread', workers=None,
+                 max_concurrency=None, warmup=True, latency_samples=1024,
+                 **options):
+        """
+        @param path 辞書. Taggerと同じ
+        @param executor 'thread', 'process', またはconcurrent.futures.Executor.
+                        Executorを指定した場合はスレッドプールとして扱う
+        @param workers ワーカー数. None指定時はCPU数
+        @param max_concurrency 同時に実行される解析の数の上限. None指定時はworkers
+        @param warmup 辞書を事前に読み込むかどうか
+        @param latency_samples 遅延の統計に使用する直近の解析の数
+        @param options Taggerに渡される引数
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or workers
+        """ 同時に実行される解析の数の上限 """
+        self.tagger = None
+        """ executor='process'以外の場合に使用されるTagger """
+        self._owns_executor = not isinstance(executor,
+                                             concurrent.futures.Executor)
+        if executor == 'process':
+            # normalize the options, the dictionary is loaded by the workers
+            tagger = Tagger(path, **options)
+            options = tagger.options
+            tagger.release()
+            kwargs = {}
+            if sys.version_info >= (3, 7):
+                kwargs = dict(initializer=_init_worker, initargs=(options, ))
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                workers, **kwargs)
+            self._options = options
+        elif executor == 'thread' or not self._owns_executor:
+            self.tagger = Tagger(path, **options)
+            if warmup:
+                self.tagger.warmup()
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers) \
+                if self._owns_executor else executor
+            self._options = None
+        else:
+            raise ValueError('unknown executor: %r' % (executor, ))
+        self._semaphore = None
+        self._latencies = collections.deque(maxlen=latency_samples)
+        self._count = 0
+        self._errors = 0
+        self._cancelled = 0
+        self._inflight = 0
+
+    async def parse(self, text):
+        """
+        形態素解析を行う
+
+        @param text 解析対象テキスト
+        @return 解析結果の形態素リスト
+        """
+        return await self._submit('parse', text)
+
+    async def wakati(self, text):
+        """
+        分かち書きを行う
+
+        @param text 分かち書きされるテキスト
+        @return 分かち書きされた文字列のリスト
+        """
+        return await self._submit('wakati', text)
+
+    async def iter_parse(self, stream, max_length=65536):
+        """
+        テキストのストリームを文毎に形態素解析し, 形態素を順に返す
+        文はigo.tagger.split_sentencesで区切られる
+
+        @param stream テキストの断片を返すasync iterableまたはiterable
+        @param max_length 一度に解析する文字数の上限
+        @return 形態素のasync iterator. 形態素の開始位置はストリームの先頭からの位置
+        """
+        offset = 0
+        async for sentence in _iter_sentences(stream, max_length):
+            for m in await self.parse(sentence):
+                yield Morpheme(m.surface, m.feature, m.start + offset)
+            offset += _utf16_length(sentence)
+
+    async def _submit(self, method, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = _get_running_loop()
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        try:
+            if self.tagger is not None:
+                future = self.executor.submit(getattr(self.tagger, method),
+                                              *args)
+            else:
+                future = self.executor.submit(_call_in_worker, self._options,
+                                              method, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self._inflight += 1
+        # the slot is held until the work finishes, even if cancelled
+        future.add_done_callback(
+            lambda f: _call_soon(loop, self._done))
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        except Exception:
+            self._errors += 1
+            raise
+        self._count += 1
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def _done(self):
+        self._inflight -= 1
+        self._semaphore.release()
+
+    def metrics(self):
+        """
+        解析の統計情報を返す. 遅延は呼び出しから結果が返されるまでの時間で,
+        同時実行数の上限による待ち時間を含む
+
+        @return Metrics(count, errors, cancelled, inflight, p50, p90, p99, max).
+                遅延は直近のlatency_samples件から求める. 解析がない場合はNone
+        """
+        values = sorted(self._latencies)
+        if values:
+            p = [_percentile(values, x) for x in (50, 90, 99)] + [values[-1]]
+        else:
+            p = [None] * 4
+        return Metrics(self._count, self._errors, self._cancelled,
+                       self._inflight, *p)
+
+    def close(self, wait=True):
+        """
+        executorを終了し, Taggerを解放する
+        """
+        if self._owns_executor:
+            self.executor.shutdown(wait)
+        if self.tagger is not None:
+            self.tagger.release()
+            self.tagger = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, et, ev, tb):
+        await _get_running_loop().run_in_executor(None, self.close)
+
+
+def _call_soon(loop, fn):
+    try:
+        loop.call_soon_threadsafe(fn)
+    except RuntimeError:
+        # the loop is closed
+        pass
+
+
+async def _aiter(stream):
+    if hasattr(stream, '__aiter__'):
+        async for chunk in stream:
+            yield chunk
+    else:
+        for chunk in stream:
+            yield chunk
+
+
+async def _iter_sentences(stream, max_length):
+    buf = ''
+    async for chunk in _aiter(stream):
+        sentences, buf = split_sentences(buf + chunk, max_length, False)
+        for sentence in sentences:
+            yield sentence
+    sentences, _ = split_sentences(buf, max_length)
+    for sentence in sentences:
+        yield sentence
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""
+MeCab形式の辞書のソースからバイナリ辞書を作成する
+
+  $ python -m igo.build ipadic mecab-ipadic-2.7.0-20070801 -e euc-jp
+
+ソースのディレクトリには次のファイルを置く.
+  *.csv      単語の定義. 表層形,左文脈ID,右文脈ID,コスト,素性
+  unk.def    未知語の定義. 表層形の代わりに文字カテゴリ名を書く
+  matrix.def 連接コスト表. 1行目は左文脈IDの数と右文脈IDの数,
+             以降は 左の形態素の右文脈ID 右の形態素の左文脈ID コスト
+  char.def   文字カテゴリの定義と, 文字コード(範囲)と文字カテゴリの対応
+
+出力はIgo(Java版)の辞書作成コマンドと同じ形式で, Tagger(path)で読み込める.
+単語の素性は一時ファイルに書き出されるため, 使用するメモリは主に表層形の種類数に比例する.
+"""
+from __future__ import print_function
+import argparse
+import array
+from binascii import hexlify, unhexlify
+import glob
+import io
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+import igo.features
+from igo.dictreader import LE
+from igo.trie import chck_TERMINATE_CODE, chck_VACANT_CODE, base_id
+
+if sys.version_info[0] > 2:
+    unichr = chr
+
+    def _from_bytes(b):
+        return int.from_bytes(b, 'big')
+
+    def _to_bytes(n, length):
+        return n.to_bytes(length, 'big')
+else:
+    def _from_bytes(b):
+        return int(hexlify(b), 16)
+
+    def _to_bytes(n, length):
+        return unhexlify('%0*x' % (length * 2, n))
+
+UNKNOWN_KEY_PREFIX = u'\x02'
+""" 未知語の文字カテゴリ名をキーにする際の接頭辞. 単語の表層形と区別するため """
+
+_VACANT_BASE = -2147483648
+_MAX_CODE = 0xFFFF
+_SEARCH_WINDOW = 1 << 15
+_CHUNK = 2048
+_PROBES = 16
+
+
+def to_key(s):
+    """
+    文字列をUTF-16のコード単位毎の文字列に変換する
+    BMP外の文字はサロゲートペアになり, キーの比較はUTF-16の順序になる
+    """
+    if all(c <= u'\uffff' for c in s):
+        return s
+    a = array.array('H', s.encode('utf-16-le'))
+    if not LE:
+        a.byteswap()
+    return u''.join(unichr(c) for c in a)
+
+
+class DoubleArrayBuilder(object):
+    """
+    TAIL付きのダブル配列(igo.trie.Searcherが読む形式)を作成する
+
+    キーはソート済みで重複がないこと. キーIDはキーの順番になる.
+    あるノードの下のキーが1つになった時点で葉にし, 残りの文字列をTAILに格納する.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.base = array.array('i')
+        self.chck = array.array('H')
+        self.used = bytearray()
+        """ used[位置] = 位置が使用済みかどうか """
+        self.bases = set()
+        """ 使用済みのbaseの値. baseが同じノードの子は区別できないため重複させない """
+        self.first = 1
+        """ 未使用の位置の下限 """
+        self.last = 0
+        """ 使用済みのbaseの最大値 """
+        self.tails = [u''] * len(keys)
+
+    def _reserve(self, n):
+        if n > len(self.used):
+            grow = max(n - len(self.used), len(self.used), 65536)
+            self.used.extend(b'\x00' * grow)
+            self.base.extend(array.array('i', [_VACANT_BASE]) * grow)
+            self.chck.extend(array.array('H', [chck_VACANT_CODE]) * grow)
+
+    def _find_base(self, codes):
+        """
+        codesの全ての子を配置できるbaseを探す
+        """
+        used = self.used
+        bases = self.bases
+        c0 = codes[0]
+        # holes far behind the last node are given up, to bound the search
+        x = max(self.first - c0, self.last - _SEARCH_WINDOW, 1)
+        # most nodes fit in the first few holes
+        rest = codes[1:]
+        for _ in range(_PROBES):
+            p = used.find(b'\x00', x + c0)
+            if p == -1:
+                p = len(used)
+            x = p - c0
+            self._reserve(x + codes[-1] + 1)
+            if x not in bases:
+                for c in rest:
+                    if used[x + c]:
+                        break
+                else:
+                    return x
+            x += 1
+        # OR the used flags of the children over a chunk of candidates at once
+        while True:
+            self._reserve(x + codes[-1] + _CHUNK)
+            m = 0
+            for c in codes:
+                m |= _from_bytes(used[x + c:x + c + _CHUNK])
+            free = _to_bytes(m, _CHUNK)
+            i = free.find(b'\x00')
+            while i != -1:
+                if x + i not in bases:
+                    return x + i
+                i = free.find(b'\x00', i + 1)
+            x += _CHUNK
+
+    def build(self):
+        """
+        @return (begs, base, lens, chck, tail)
+        """
+        keys = self.keys
+        self._reserve(1)
+        self.used[0] = 1
+        # (first key, end of keys, depth, position of the node)
+        stack = [(0, len(keys), 0, 0)]
+        while stack:
+            lo, hi, depth, pos = stack.pop()
+            # children: (code, first key, end of keys)
+            children = []
+            i = lo
+            while i < hi:
+                key = keys[i]
+                if len(key) == depth:
+                    children.append((chck_TERMINATE_CODE, i, i + 1))
+                    i += 1
+                    continue
+                ch = key[depth]
+                j = i + 1
+                while j < hi and keys[j][depth] == ch:
+                    j += 1
+                children.append((ord(ch), i, j))
+                i = j
+            codes = [c for c, _, _ in children]
+            x = self._find_base(codes)
+            self.bases.add(x)
+            self.base[pos] = x
+            self.last = max(self.last, x)
+            for c, i, j in children:
+                p = x + c
+                self.used[p] = 1
+                self.chck[p] = c
+                if j - i == 1:
+                    self.base[p] = base_id(i)
+                    self.tails[i] = keys[i][depth + 1:]
+                else:
+                    stack.append((i, j, depth + 1, p))
+            while self.first < len(self.used) and self.used[self.first]:
+                self.first += 1
+        return self._finish()
+
+    def _finish(self):
+        # codes of the input text are not checked against the size
+        size = max(self.bases) + _MAX_CODE + 1
+        self._reserve(size)
+        del self.base[size:]
+        del self.chck[size:]
+        begs, lens, tail = build_tail(self.tails)
+        return begs, self.base, lens, self.chck, tail
+
+
+def build_tail(tails):
+    """
+    TAIL文字列を連結する. 他のTAIL文字列の接尾辞になっているものは共有する
+
+    @return (begs, lens, tail). begs[キーID]は開始位置, lens[キーID]は長さ
+    """
+    n = len(tails)
+    begs = array.array('i', [0]) * n
+    lens = array.array('h', [len(t) for t in tails])
+    tail = array.array('H')
+    order = sorted((i for i in range(n) if tails[i]),
+                   key=lambda i: tails[i][::-1], reverse=True)
+    prev = None
+    for i in order:
+        t = tails[i]
+        if prev is not None and tails[prev].endswith(t):
+            begs[i] = begs[prev] + len(tails[prev]) - len(t)
+            continue
+        begs[i] = len(tail)
+        tail.extend(ord(c) for c in t)
+        prev = i
+    for i in range(n):
+        if not tails[i]:
+            begs[i] = len(tail)
+    return begs, lens, tail
+
+
+class Writer(object):
+    """
+    配列をバイナリ辞書のバイトオーダーで書き出す
+    """
+
+    def __init__(self, bigendian=False):
+        self.swap = bigendian and LE
+        self.codec = 'utf-16-be' if bigendian or not LE else 'utf-16-le'
+
+    def write(self, path, *arrays):
+        with open(path, 'wb') as f:
+            for a in arrays:
+                if self.swap:
+                    a = array.array(a.typecode, a)
+                    a.byteswap()
+                a.tofile(f)
+
+
+def parse_entry(line, delimiter=u','):
+    """
+    辞書のCSVの行を分割する. 表層形は"で囲まれていてもよい("は""と書く)
+
+    @return (表層形, 左文脈ID, 右文脈ID, コスト, 素性)
+    """
+    if line.startswith(u'"'):
+        i = 1
+        chars = []
+        while True:
+            j = line.index(u'"', i)
+            chars.append(line[i:j])
+            if line.startswith(u'"', j + 1):
+                chars.append(u'"')
+                i = j + 2
+                continue
+            break
+        surface = u''.join(chars)
+        if not line.startswith(delimiter, j + 1):
+            raise ValueError('invalid surface')
+        rest = line[j + 1 + len(delimiter):]
+    else:
+        surface, rest = line.split(delimiter, 1)
+    left, right, cost, feature = rest.split(delimiter, 3)
+    return surface, int(left), int(right), int(cost), feature
+
+
+def iter_entries(path, encoding, delimiter=u',', prefix=u''):
+    """
+    @return (表層形のキー, 左文脈ID, 右文脈ID, コスト, 素性)のイテレータ
+    """
+    with io.open(path, encoding=encoding) as f:
+        for n, line in enumerate(f, 1):
+            line = line.rstrip(u'\r\n')
+            if not line:
+                continue
+            try:
+                surface, left, right, cost, feature = parse_entry(line,
+                                                                  delimiter)
+            except ValueError:
+                raise ValueError('%s:%d: invalid entry: %r' % (path, n, line))
+            yield to_key(prefix + surface), left, right, cost, feature
+
+
+def read_char_def(path, encoding):
+    """
+    char.defを読み込む
+
+    @return (カテゴリ名の順の[(名前, invoke, group, length)],
+             [(開始コード, 終了コード, [カテゴリ名, 互換カテゴリ名...])])
+    """
+    categories = []
+    mappings = []
+    with io.open(path, encoding=encoding) as f:
+        for n, line in enumerate(f, 1):
+            fields = line.split(u'#', 1)[0].split()
+            if not fields:
+                continue
+            try:
+                if fields[0].startswith(u'0x'):
+                    r = fields[0].split(u'..')
+                    start = int(r[0], 16)
+                    end = int(r[-1], 16)
+                    if len(fields) < 2:
+                        raise ValueError
+                    mappings.append((start, min(end, _MAX_CODE), fields[1:]))
+                else:
+                    categories.append((fields[0], int(fields[1]),
+                                       int(fields[2]), int(fields[3])))
+            except (ValueError, IndexError):
+                raise ValueError('%s:%d: invalid line: %r' % (path, n, line))
+    return categories, mappings
+
+
+class Timer(object):
+    def __init__(self, verbose):
+        self.verbose = verbose
+        self.start = time.time()
+
+    def __call__(self, msg):
+        if self.verbose:
+            now = time.time()
+            print('%s: %.1fs' % (msg, now - self.start), file=sys.stderr)
+            self.start = now
+
+
+def build(src, dst, encoding='euc-jp', delimiter=u',', bigendian=False,
+          verbose=False, compress_features=False):
+    """
+    MeCab形式の辞書のソースからバイナリ辞書を作成する
+
+    @param src ソースのディレクトリ
+    @param dst 出力するディレクトリ. なければ作成される
+    @param encoding ソースの文字コード
+    @param delimiter CSVの区切り文字
+    @param bigendian ビッグエンディアンの辞書(gae=True用)を作成するかどうか
+    @param verbose 各段階の所要時間を標準エラー出力に表示する
+    @param compress_features 圧縮された素性データ(word.feat)も作成する
+    """
+    timer = Timer(verbose)
+    writer = Writer(bigendian)
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+    inputs = [(os.path.join(src, 'unk.def'), UNKNOWN_KEY_PREFIX)] + \
+        [(p, u'') for p in sorted(glob.glob(os.path.join(src, '*.csv')))]
+
+    # keys
+    keys = set()
+    for path, prefix in inputs:
+        for e in iter_entries(path, encoding, delimiter, prefix):
+            keys.add(e[0])
+    keys = sorted(keys)
+    timer('read %d keys' % len(keys))
+    begs, base, lens, chck, tail = DoubleArrayBuilder(keys).build()
+    writer.write(os.path.join(dst, 'word2id'),
+                 array.array('i', [len(base), len(begs), len(tail)]),
+                 begs, base, lens, chck, tail)
+    timer('build double array of %d nodes' % len(base))
+    key_ids = dict((k, i) for i, k in enumerate(keys))
+    del keys
+
+    _build_words(inputs, encoding, delimiter, key_ids, dst, writer)
+    timer('build words')
+    _build_categories(os.path.join(src, 'char.def'), encoding, key_ids, dst,
+                      writer)
+    del key_ids
+    _build_matrix(os.path.join(src, 'matrix.def'), dst, writer)
+    timer('build matrix')
+    if compress_features:
+        igo.features.compress(dst, bigendian)
+        timer('compress features')
+
+
+def _build_words(inputs, encoding, delimiter, key_ids, dst, writer):
+    key_id = array.array('i')
+    left_ids = array.array('h')
+    right_ids = array.array('h')
+    costs = array.array('h')
+    offsets = array.array('i', [0])
+    # features are written in input order, then reordered by word id
+    with tempfile.TemporaryFile() as spill:
+        for path, prefix in inputs:
+            for key, left, right, cost, feature in iter_entries(
+                    path, encoding, delimiter, prefix):
+                key_id.append(key_ids[key])
+                left_ids.append(left)
+                right_ids.append(right)
+                costs.append(cost)
+                data = feature.encode(writer.codec)
+                spill.write(data)
+                offsets.append(offsets[-1] + len(data) // 2)
+        spill.flush()
+        # words of a key are ordered by left context id and cost
+        order = sorted(range(len(key_id)),
+                       key=lambda i: (key_id[i], left_ids[i], costs[i]))
+        n = len(order)
+        indices = array.array('i', [0]) * (len(key_ids) + 1)
+        for i in key_id:
+            indices[i + 1] += 1
+        for k in range(len(key_ids)):
+            indices[k + 1] += indices[k]
+        data_offsets = array.array('i', [0]) * (n + 1)
+        with open(os.path.join(dst, 'word.dat'), 'wb') as out:
+            m = mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ) \
+                if offsets[-1] else None
+            try:
+                pos = 0
+                for w, i in enumerate(order):
+                    data_offsets[w] = pos
+                    a, b = offsets[i], offsets[i + 1]
+                    out.write(m[a * 2:b * 2])
+                    pos += b - a
+                data_offsets[n] = pos
+            finally:
+                if m is not None:
+                    m.close()
+    sentinel = array.array('h', [0])
+    writer.write(os.path.join(dst, 'word.ary.idx'), indices)
+    writer.write(os.path.join(dst, 'word.inf'), data_offsets,
+                 array.array('h', (left_ids[i] for i in order)) + sentinel,
+                 array.array('h', (right_ids[i] for i in order)) + sentinel,
+                 array.array('h', (costs[i] for i in order)) + sentinel)
+
+
+def _build_categories(path, encoding, key_ids, dst, writer):
+    categories, mappings = read_char_def(path, encoding)
+    ids = {}
+    for name, _, _, _ in categories:
+        k = key_ids.get(UNKNOWN_KEY_PREFIX + name)
+        if k is None:
+            raise ValueError('category %s is not defined in unk.def' % name)
+        ids[name] = k
+    if 'DEFAULT' not in ids or 'SPACE' not in ids:
+        raise ValueError('DEFAULT and SPACE categories are required')
+    if max(ids.values()) >= 32:
+        raise ValueError('too many categories')
+    categories.sort(key=lambda c: ids[c[0]])
+    index = dict((c[0], i) for i, c in enumerate(categories))
+    data = array.array('i')
+    for name, invoke, group, length in categories:
+        data.extend([ids[name], length, invoke, group])
+    writer.write(os.path.join(dst, 'char.category'), data)
+
+    char2id = array.array('i', [index['DEFAULT']]) * (_MAX_CODE + 1)
+    masks = array.array('i', [1 << ids['DEFAULT']]) * (_MAX_CODE + 1)
+    for start, end, names in mappings:
+        try:
+            mask = 0
+            for name in names:
+                mask |= 1 << ids[name]
+            c = index[names[0]]
+        except KeyError as e:
+            raise ValueError('%s: unknown category %s' % (path, e))
+        n = end - start + 1
+        char2id[start:end + 1] = array.array('i', [c]) * n
+        masks[start:end + 1] = array.array('i', [mask]) * n
+    writer.write(os.path.join(dst, 'code2category'), char2id, masks)
+
+
+def _build_matrix(path, dst, writer):
+    with io.open(path, encoding='ascii') as f:
+        left_size, right_size = [int(x) for x in f.readline().split()]
+        matrix = array.array('h', [0]) * (left_size * right_size)
+        for line in f:
+            fields = line.split()
+            if fields:
+                left, right, cost = fields
+                matrix[int(right) * left_size + int(left)] = int(cost)
+    writer.write(os.path.join(dst, 'matrix.bin'),
+                 array.array('i', [left_size, right_size]), matrix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m igo.build',
+        description='build a binary dictionary from MeCab dictionary sources')
+    parser.add_argument('dst', help='output directory')
+    parser.add_argument('src', help='directory of *.csv, unk.def, '
+                        'matrix.def and char.def')
+    parser.add_argument('-e', '--encoding', default='euc-jp',
+                        help='encoding of the sources (default: euc-jp)')
+    parser.add_argument('-d', '--delimiter', default=',',
+                        help='delimiter of the csv files (default: ,)')
+    parser.add_argument('--bigendian', action='store_true',
+                        help='build a big endian dictionary, for gae=True')
+    parser.add_argument('-z', '--compress-features', action='store_true',
+                        help='also create a compressed feature store, '
+                        'see igo.features')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show the elapsed time of each step')
+    args = parser.parse_args(argv)
+    delimiter = args.delimiter
+    if not isinstance(delimiter, type(u'')):
+        delimiter = delimiter.decode(sys.getfilesystemencoding())
+    build(args.src, args.dst, args.encoding, delimiter, args.bigendian,
+          args.verbose, args.compress_features)
+
+
+if __name__ == '__main__':
+    main()
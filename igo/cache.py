@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple, OrderedDict
+import threading
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    LRU方式で要素を破棄するサイズ上限付きのキャッシュ
+    要素のサイズはsizeofで求められる. sizeofがNoneの場合は要素数を上限とする.
+    pinで追加された要素は破棄されず, サイズにも数えられない
+    """
+    __slots__ = ['maxsize', 'sizeof', 'size', 'data', 'pinned', 'hits',
+                 'misses', 'lock']
+
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        self.data = OrderedDict()
+        """ data[key] = (value, size) """
+        self.pinned = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            v = self.pinned.get(key)
+            if v is None:
+                e = self.data.pop(key, None)
+                if e is None:
+                    self.misses += 1
+                    return default
+                # move to the most recently used position
+                self.data[key] = e
+                v = e[0]
+            self.hits += 1
+            return v
+
+    def put(self, key, value):
+        n = 1 if self.sizeof is None else self.sizeof(key, value)
+        with self.lock:
+            if n > self.maxsize or key in self.pinned:
+                return
+            data = self.data
+            e = data.pop(key, None)
+            if e is not None:
+                self.size -= e[1]
+            data[key] = (value, n)
+            self.size += n
+            while self.size > self.maxsize:
+                self.size -= data.popitem(last=False)[1][1]
+
+    def pin(self, key, value):
+        with self.lock:
+            e = self.data.pop(key, None)
+            if e is not None:
+                self.size -= e[1]
+            self.pinned[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.pinned.clear()
+            self.size = 0
+            self.hits = self.misses = 0
+
+    def info(self):
+        """
+        @return キャッシュの統計情報
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         self.size + len(self.pinned))
+
+
+def result_sizeof(key, value):
+    """
+    解析結果のキャッシュ1件あたりのおおよそのメモリ使用量(バイト)を求める
+
+    @param key (種別, テキスト)
+    @param value 形態素の(表層形, 素性, 開始位置)のタプル, または表層形のタプル
+    """
+    n = 64 + len(key[1]) * 2
+    for v in value:
+        if isinstance(v, tuple):
+            n += 64 + (len(v[0]) + len(v[1])) * 2
+        else:
+            n += 48 + len(v) * 2
+    return n
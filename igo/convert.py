@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+ネイティブバイトオーダーの辞書のキャッシュ
+
+ビッグエンディアンの辞書(gae=True用)はmmapできず, プロセス毎に全体を読み込んで
+バイトスワップする必要がある. ここでは一度だけネイティブバイトオーダーに変換して
+1ファイルにまとめた辞書(igo.pack参照)をキャッシュディレクトリに書き出し,
+以降はそれをmmapで読み込む.
+
+キャッシュファイルの名前には変換形式のバージョンと, 元の辞書の構成ファイルの
+名前, サイズ, 更新日時から求めたチェックサムが含まれる. 元の辞書が更新されると
+別のキャッシュファイルが作成される.
+"""
+import array
+import glob
+import hashlib
+import os
+import sys
+
+import igo.pack
+from igo.dictreader import LE, StandardReader, get_chararray_multi
+from igo.features import FILENAME as FEATURE_STORE
+
+CONVERT_VERSION = 2
+""" 変換形式のバージョン. 変換処理を変更したら上げる """
+
+
+def default_cache_dir():
+    """
+    @return 環境変数IGO_CACHE_DIR, なければ$XDG_CACHE_HOME/igo(~/.cache/igo)
+    """
+    d = os.getenv('IGO_CACHE_DIR')
+    if d:
+        return d
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'igo')
+
+
+def _source_files(src):
+    paths = []
+    for name in igo.pack.files(src):
+        paths.extend(igo.pack._sources(src, name))
+    return paths
+
+
+def stamp(src, bigendian=True, splitted=False):
+    """
+    辞書の変換結果を識別するためのチェックサムを求める
+
+    @return 16進数の文字列
+    """
+    h = hashlib.sha1()
+    h.update(('%d %d %d %d %s\n' % (CONVERT_VERSION, igo.pack.PACK_VERSION,
+                                    bigendian, splitted, sys.byteorder))
+             .encode('ascii'))
+    h.update(os.path.abspath(src).encode('utf-8', 'surrogateescape')
+             if sys.version_info[0] > 2 else os.path.abspath(src))
+    for path in _source_files(src):
+        st = os.stat(path)
+        h.update(('\n%s %d %d' % (os.path.basename(path), st.st_size,
+                                  int(st.st_mtime * 1000000)))
+                 .encode('ascii'))
+    return h.hexdigest()
+
+
+def _write_arrays(arrays):
+    def write(out):
+        for a in arrays:
+            a.tofile(out)
+    return write
+
+
+def native_sections(src, bigendian=True, splitted=False):
+    """
+    辞書の構成ファイルをネイティブバイトオーダーの配列として読み込む
+
+    @return (構成ファイルの名前, 配列のリスト)のリスト
+    """
+    def reader(name):
+        return StandardReader(os.path.join(src, name), bigendian)
+
+    sections = []
+    with reader('word2id') as r:
+        header = array.array('i', [r.get_int() for _ in range(3)])
+        node_size, tind_size, tail_size = header
+        sections.append(('word2id', [
+            header, r.get_intarray(tind_size), r.get_intarray(node_size),
+            r.get_shortarray(tind_size), r.get_chararray(node_size),
+            r.get_chararray(tail_size)]))
+    if splitted:
+        paths = sorted(glob.glob(os.path.join(src, 'word.dat.*')))
+        sections.append(('word.dat', [get_chararray_multi(paths, bigendian)]))
+    else:
+        with reader('word.dat') as r:
+            sections.append(('word.dat', [r.get_chararray()]))
+    with reader('word.ary.idx') as r:
+        sections.append(('word.ary.idx', [r.get_intarray()]))
+    with reader('word.inf') as r:
+        wc = r.size() // (4 + 2 + 2 + 2)
+        sections.append(('word.inf', [
+            r.get_intarray(wc), r.get_shortarray(wc), r.get_shortarray(wc),
+            r.get_shortarray(wc)]))
+    with reader('matrix.bin') as r:
+        left_size = r.get_int()
+        right_size = r.get_int()
+        sections.append(('matrix.bin', [
+            array.array('i', [left_size, right_size]),
+            r.get_shortarray(left_size * right_size)]))
+    with reader('char.category') as r:
+        sections.append(('char.category', [r.get_intarray()]))
+    with reader('code2category') as r:
+        sections.append(('code2category', [r.get_intarray()]))
+    if os.path.exists(os.path.join(src, FEATURE_STORE)):
+        with reader(FEATURE_STORE) as r:
+            header = array.array('i', [r.get_int() for _ in range(4)])
+            count, block_size, prefix_size, data_size = header
+            blocks = (count + block_size - 1) // block_size
+            sections.append((FEATURE_STORE, [
+                header, r.get_intarray(blocks + 1),
+                r.get_bytearray(prefix_size), r.get_bytearray(data_size)]))
+    return sections
+
+
+def native_copy(src, bigendian=True, splitted=False, cache_dir=None):
+    """
+    辞書をネイティブバイトオーダーに変換してキャッシュディレクトリに書き出す
+    既に変換済みの場合はそれを返す
+
+    @param src バイナリ辞書のディレクトリ
+    @param bigendian srcがビッグエンディアンの辞書かどうか
+    @param splitted word.datが分割されているかどうか
+    @param cache_dir キャッシュディレクトリ. Noneの場合はdefault_cache_dir()
+    @return 変換された辞書(1ファイルにまとめられた辞書)のパス
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    name = '%s-%s.igo' % (os.path.basename(os.path.abspath(src)),
+                          stamp(src, bigendian, splitted))
+    dst = os.path.join(cache_dir, name)
+    if os.path.exists(dst):
+        return dst
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+    tmp = '%s.%d.tmp' % (dst, os.getpid())
+    try:
+        sections = [(n, sum(a.itemsize * len(a) for a in arrays),
+                     _write_arrays(arrays))
+                    for n, arrays in native_sections(src, bigendian,
+                                                     splitted)]
+        igo.pack.write_packed(tmp, sections, not LE)
+        try:
+            os.rename(tmp, dst)
+        except OSError:
+            # another process has created it
+            if not os.path.exists(dst):
+                raise
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return dst
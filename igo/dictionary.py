@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
-import glob
+import array
+import os
 import sys
+import threading
+import igo.accel
 import igo.dictreader as util
-from igo.dictreader import DictReader
+from igo.cache import LRUCache
+from igo.dictreader import open_reader, PackedDictionary, UTF16Codec
 from igo.trie import Searcher
 
 if sys.version_info[0] > 2:
@@ -54,14 +58,18 @@ class CharCategory:
     __slots__ = ['cc_rd', 'cat', 'c2c_rd', 'char2id', 'eql_masks']
 
     def __init__(self, path, bigendian=False, use_mmap=None):
-        self.cc_rd = DictReader(path + "/char.category", bigendian, use_mmap)
+        self.cc_rd = open_reader(path, "char.category", bigendian, use_mmap)
         with self.cc_rd as r:
             self.cat = self.convert_categories(r.get_intarray())
-        self.c2c_rd = DictReader(path + "/code2category", bigendian, use_mmap)
+        self.c2c_rd = open_reader(path, "code2category", bigendian, use_mmap)
         with self.c2c_rd as r:
             self.char2id = r.get_intarray(r.size() // 4 // 2)
             self.eql_masks = r.get_intarray(r.size() // 4 // 2)
 
+    def prefetch(self):
+        self.cc_rd.prefetch()
+        self.c2c_rd.prefetch()
+
     def release(self):
         del self.cat
         del self.char2id
@@ -98,14 +106,17 @@ class Matrix:
     """
     形態素の連接コスト表を扱うクラス
     """
-    __slots__ = ['rd', 'left_size', 'matrix']
+    __slots__ = ['rd', 'left_size', 'right_size', 'matrix']
 
     def __init__(self, path, bigendian=False, use_mmap=None):
-        self.rd = DictReader(path + "/matrix.bin", bigendian, use_mmap)
+        self.rd = open_reader(path, "matrix.bin", bigendian, use_mmap)
         with self.rd as r:
             self.left_size = r.get_int()
-            right_size = r.get_int()
-            self.matrix = r.get_shortarray(self.left_size * right_size)
+            self.right_size = r.get_int()
+            self.matrix = r.get_shortarray(self.left_size * self.right_size)
+
+    def prefetch(self):
+        self.rd.prefetch()
 
     def release(self):
         del self.matrix
@@ -117,12 +128,54 @@ class Matrix:
         """
         return self.matrix[right_id * self.left_size + left_id]
 
+    def set_mincost_node(self, vn, prevs):
+        """
+        前方のノードの中から, vnへの総コストが最小となるものをvn.prevに設定する
+
+        @param vn ノード. costに総コストが加算される
+        @param prevs 前方のノードのリスト
+        @return vn
+        """
+        matrix = self.matrix
+        # linkcost(p.right_id, vn.left_id)
+        row = vn.left_id * self.left_size
+        f = vn.prev = prevs[0]
+        mincost = f.cost + matrix[row + f.right_id]
+
+        for i in range(1, len(prevs)):
+            p = prevs[i]
+            cost = p.cost + matrix[row + p.right_id]
+            if cost < mincost:
+                mincost = cost
+                vn.prev = p
+
+        vn.cost += mincost
+        return vn
+
+
+class CharColumns(object):
+    """
+    テキストの位置毎の文字カテゴリと, 同じ文字カテゴリの文字が続く範囲の終了位置.
+    Unknown.classifyで作成し, Unknown.searchに渡す
+    """
+    __slots__ = ['categories', 'ends']
+
+    def __init__(self, categories, ends):
+        self.categories = categories
+        """ categories[位置] = Category """
+        self.ends = ends
+        """ ends[位置] = 終了位置 (Unknown.run_ends) """
+
 
 class Unknown:
     """
     未知語の検索を行うクラス
     """
-    __slots__ = ['category', 'space_id']
+    __slots__ = ['category', 'space_id', 'accel', 'numpy_tables']
+
+    NUMPY_MIN_LENGTH = 128
+    """ classifyでNumPyを使用するテキストの長さの下限. 短いテキストでは
+    配列の作成の負荷の方が大きい """
 
     def __init__(self, path, bigendian=False, use_mmap=None):
         self.category = CharCategory(path, bigendian, use_mmap)
@@ -130,27 +183,150 @@ class Unknown:
         # NOTE: ' 'の文字カテゴリはSPACEに予約されている
         self.space_id = self.category.category(0x20).id
         """文字カテゴリがSPACEの文字のID"""
+        self.accel = None
+        self.numpy_tables = None
+        """ classifyで使用する文字カテゴリの表. NumPyが利用できない場合はFalse """
+
+    def accelerate(self, mod):
+        """
+        未知語の長さの走査に高速化モジュールを使用する
+
+        @param mod igo._accelモジュール. Noneの場合はPythonの実装を使用する
+        """
+        self.accel = None if mod is None else mod.CharCategory(
+            self.category.eql_masks)
+
+    def prefetch(self):
+        self.category.prefetch()
 
     def release(self):
+        self.accel = None
+        self.numpy_tables = None
         self.category.release()
 
-    def search(self, text, start, wdic, callback):
-        category = self.category
-        ch = text[start]
-        ct = category.category(ch)
+    def _numpy(self):
+        """
+        @return igo.numpy_engineと文字カテゴリの表. NumPyが利用できない場合はNone
+        """
+        tables = self.numpy_tables
+        if tables is False:
+            return None
+        try:
+            from igo import numpy_engine
+        except ImportError:
+            self.numpy_tables = False
+            return None
+        if tables is None:
+            tables = self.numpy_tables = numpy_engine.category_tables(
+                self.category)
+        return numpy_engine, tables
+
+    def classify(self, text, max_length=0):
+        """
+        テキスト全体の文字カテゴリとrun_endsを1度に求める.
+        searchは文字毎の表の参照の代わりに結果の配列を参照する.
+        NumPyが利用可能で, テキストがNUMPY_MIN_LENGTH以上の場合は
+        NumPyでまとめて変換する
+
+        @param max_length run_endsを参照
+        @return CharColumns
+        """
+        np = self._numpy() if len(text) >= Unknown.NUMPY_MIN_LENGTH \
+            else None
+        if np is None:
+            cat = self.category.cat
+            char2id = self.category.char2id
+            return CharColumns([cat[char2id[c]] for c in text],
+                               self.run_ends(text, max_length))
+        numpy_engine, tables = np
+        categories, masks = numpy_engine.classify(text, tables)
+        if self.accel is not None:
+            ends = self.run_ends(text, max_length)
+        else:
+            ends = numpy_engine.run_ends(masks, max_length)
+        return CharColumns(categories, ends)
+
+    def run_ends(self, text, max_length=0):
+        """
+        テキストの各位置について, その位置の文字と同じ文字カテゴリに属する
+        文字が続く範囲の終了位置を求める. searchのgroupの走査の代わりに使用し,
+        長い同じ文字種の並びでも解析がテキストの長さに比例する時間で済むようにする
+
+        後ろから1度だけ走査し, 後続の同じカテゴリの組の文字の終了位置を再利用する
+
+        @param max_length 0より大きい場合, 範囲の長さ(未知語の長さ)の上限.
+                          上限より長い並びは上限以下の未知語に分けられる
+        @return ends[位置] = 終了位置. searchのendsに渡す
+        """
         length = len(text)
+        ends = array.array('i', [length]) * length
+        if self.accel is not None:
+            self.accel.run_ends(text, ends, max_length)
+            return ends
+        masks = self.category.eql_masks
+        for i in range(length - 2, -1, -1):
+            mask = masks[text[i]]
+            j = i + 1
+            while j < length:
+                m = masks[text[j]]
+                if not mask & m:
+                    break
+                if m == mask:
+                    j = ends[j]
+                    break
+                j += 1
+            ends[i] = j
+        if max_length > 0:
+            for i in range(length):
+                if ends[i] - i > max_length:
+                    ends[i] = i + max_length
+        return ends
+
+    def search(self, text, start, wdic, callback, columns=None):
+        """
+        text[start]から始まる未知語を検索する
+
+        @param columns classify(text)の結果. 指定された場合, 文字カテゴリを
+                       表から求めず, 文字カテゴリが続く範囲を走査しない
+        """
+        if columns is not None:
+            ct = columns.categories[start]
+        else:
+            ct = self.category.category(text[start])
 
         if not callback.isempty() and not ct.invoke:
             return
 
         cid = ct.id
         isspace = cid == self.space_id
+        length = len(text)
+        if columns is not None:
+            run = columns.ends[start] - start
+            n = min(ct.length, length - start)
+            if run < n:
+                n = run
+            for l in range(1, n + 1):
+                wdic.search_from_trie(cid, start, l, isspace, callback)
+            if ct.group and run >= ct.length and start + ct.length < length:
+                wdic.search_from_trie(cid, start, run, isspace, callback)
+            return
+        if self.accel is not None:
+            for l in self.accel.unknown_lengths(text, start, ct.length,
+                                                ct.group):
+                wdic.search_from_trie(cid, start, l, isspace, callback)
+            return
+        category = self.category
+        ch = text[start]
         limit = min(length, ct.length + start)
         for i in range(start + 1, limit):
             wdic.search_from_trie(cid, start, i - start, isspace, callback)
             if not category.is_compatible(ch, text[i]):
                 return
-        wdic.search_from_trie(cid, start, limit - start, isspace, callback)
+        if limit > start:
+            # the length of a category can be 0, such nodes end where they
+            # start and never be on a path
+            wdic.search_from_trie(cid, start, limit - start, isspace,
+                                  callback)
 
         if ct.group and limit < length:
             for i in range(limit, length):
@@ -161,25 +337,58 @@ class Unknown:
             wdic.search_from_trie(cid, start, length - start, isspace,
                                   callback)
 
+    def search_fixed(self, text, start, length, wdic, callback):
+        """
+        text[start]の文字カテゴリの未知語を, 長さlengthの形態素として追加する
+        制約付きの解析で, 指定された区間に一致する単語がない場合に使用する
+        """
+        ct = self.category.category(text[start])
+        wdic.search_from_trie(ct.id, start, length, ct.id == self.space_id,
+                              callback)
+
 
 class WordDic:
     __slots__ = ['splitted', 'trie', 'data', 'wd_rd', 'wa_rd', 'indices',
-                 'wi_rd', 'offsets', 'left_ids', 'right_ids', 'costs']
+                 'wi_rd', 'offsets', 'left_ids', 'right_ids', 'costs',
+                 'feature_cache', 'store']
 
-    def __init__(self, path, bigendian=False, splitted=False, use_mmap=None):
+    def __init__(self, path, bigendian=False, splitted=False, use_mmap=None,
+                 feature_cache_size=0, feature_store=None):
+        """
+        @param feature_cache_size デコード済みの素性をキャッシュする単語数. 0の場合はキャッシュしない
+        @param feature_store 圧縮された素性データ(word.feat, igo.features参照)を
+                             使用するかどうか. None指定時はあれば使用する
+        """
+        # imported here, python -m igo.features imports igo first
+        from igo.features import FILENAME as FEATURE_STORE, FeatureStore
         self.splitted = splitted
-        self.trie = Searcher(path + "/word2id", bigendian, use_mmap)
-        if splitted:
+        self.feature_cache = LRUCache(feature_cache_size) \
+            if feature_cache_size > 0 else None
+        self.trie = Searcher(open_reader(path, "word2id", bigendian, use_mmap))
+        if isinstance(path, PackedDictionary):
+            # word.dat.* are concatenated into word.dat when packed
+            splitted = self.splitted = False
+            has_store = FEATURE_STORE in path
+        else:
+            has_store = os.path.exists(os.path.join(path, FEATURE_STORE))
+        self.store = None
+        self.data = None
+        if has_store and feature_store is not False:
+            # word.dat is not read at all
+            self.store = FeatureStore(open_reader(path, FEATURE_STORE,
+                                                  bigendian, use_mmap))
+        elif splitted:
+            import glob
             paths = sorted(glob.glob(path + "/word.dat.*"))
             self.data = util.get_chararray_multi(paths, bigendian)
         else:
-            self.wd_rd = DictReader(path + "/word.dat", bigendian, use_mmap)
+            self.wd_rd = open_reader(path, "word.dat", bigendian, use_mmap)
             with self.wd_rd as r:
                 self.data = r.get_chararray()
-        self.wa_rd = DictReader(path + "/word.ary.idx", bigendian, use_mmap)
+        self.wa_rd = open_reader(path, "word.ary.idx", bigendian, use_mmap)
         with self.wa_rd as r:
             self.indices = r.get_intarray()
-        self.wi_rd = DictReader(path + "/word.inf", bigendian, use_mmap)
+        self.wi_rd = open_reader(path, "word.inf", bigendian, use_mmap)
         with self.wi_rd as r:
             wc = r.size() // (4 + 2 + 2 + 2)
             self.offsets = r.get_intarray(wc)
@@ -191,7 +400,20 @@ class WordDic:
             self.costs = r.get_shortarray(wc)
             """ consts[単語ID] = 単語のコスト """
 
+    def prefetch(self):
+        """
+        mmapされた構成ファイルを先読みさせる
+        """
+        self.trie.prefetch()
+        if self.store is not None:
+            self.store.prefetch()
+        elif not self.splitted:
+            self.wd_rd.prefetch()
+        self.wa_rd.prefetch()
+        self.wi_rd.prefetch()
+
     def release(self):
+        self.feature_cache = None
         del self.data
         del self.indices
         del self.offsets
@@ -200,7 +422,10 @@ class WordDic:
         del self.costs
         self.trie.release()
         del self.trie
-        if not self.splitted:
+        if self.store is not None:
+            self.store.release()
+            self.store = None
+        elif not self.splitted:
             self.wd_rd.release()
             del self.wd_rd
         self.wa_rd.release()
@@ -213,15 +438,14 @@ class WordDic:
         left_ids = self.left_ids
         right_ids = self.right_ids
         indices = self.indices
-
-        def fn(start, offset, trieId):
-            end = indices[trieId + 1]
-            for i in range(indices[trieId], end):
-                callback(ViterbiNode(i, start, offset, costs[i], left_ids[i],
+        m = self.trie.commonprefix(text, start)
+        for k in range(0, len(m), 2):
+            length = m[k]
+            trie_id = m[k + 1]
+            for i in range(indices[trie_id], indices[trie_id + 1]):
+                callback(ViterbiNode(i, start, length, costs[i], left_ids[i],
                                      right_ids[i], False))
 
-        self.trie.commonprefix_search(text, start, fn)
-
     def search_from_trie(self, trie_id, start, length, isspace, callback):
         costs = self.costs
         left_ids = self.left_ids
@@ -232,5 +456,210 @@ class WordDic:
                                  right_ids[i], isspace))
 
     def word_data(self, word_id):
+        if self.store is not None:
+            return self.store.word_data(word_id)
         return tobytes(self.data[self.offsets[word_id]:self.offsets[word_id +
                                                                     1]])
+
+    def decode(self, word_id):
+        """
+        単語の素性をキャッシュを使用せずにデコードして返す
+        """
+        if self.store is not None:
+            return self.store.feature(word_id)
+        return UTF16Codec.decode(self.word_data(word_id))[0]
+
+    def feature(self, word_id):
+        """
+        単語の素性をデコードして返す. キャッシュが有効な場合はキャッシュを使用する
+        """
+        cache = self.feature_cache
+        if cache is None:
+            return self.decode(word_id)
+        f = cache.get(word_id)
+        if f is None:
+            f = self.decode(word_id)
+            cache.put(word_id, f)
+        return f
+
+    def preload_features(self, word_ids):
+        """
+        指定した単語の素性をデコードしてキャッシュに固定する
+        固定された素性はキャッシュから破棄されない
+
+        @param word_ids 単語IDのiterable. 出現頻度の高い単語を指定する
+        """
+        if self.feature_cache is None:
+            self.feature_cache = LRUCache(0)
+        cache = self.feature_cache
+        for word_id in word_ids:
+            cache.pin(word_id, self.decode(word_id))
+
+
+class Dictionary(object):
+    """
+    形態素解析に使用する辞書一式(単語辞書, 未知語辞書, 連接コスト表)
+
+    各構成要素は最初に参照された時に読み込まれ, その後は変更されない.
+    読み込みはロックで保護されるため, 1つのDictionaryを複数のスレッド,
+    複数のTaggerから共有できる.
+    """
+    __slots__ = ['options', 'packed', '_path', '_accel', '_wdc', '_unk',
+                 '_mtx', '_viterbi', '_matrix2d', '_lock']
+
+    @staticmethod
+    def lookup():
+        """
+        モジュールが置いてある場所から辞書を探す
+        @return: モジュール内で見つかった辞書のパス
+        """
+        path = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                            'ipadic')
+        if (os.path.exists(path)):
+            return path
+        return None
+
+    def __init__(self, path=None, gae=False, use_mmap=None,
+                 feature_cache_size=0, preload_word_ids=None, accel=None,
+                 native_cache=None, feature_store=None):
+        """
+        引数はTaggerと同じ
+        """
+        if not path:
+            path = Dictionary.lookup()
+        self.options = dict(path=path, gae=gae, use_mmap=use_mmap,
+                            feature_cache_size=feature_cache_size,
+                            preload_word_ids=preload_word_ids,
+                            accel=accel, native_cache=native_cache,
+                            feature_store=feature_store)
+        """ コンストラクタの引数 """
+        self.packed = None
+        if gae and native_cache and not PackedDictionary.is_packed(path):
+            from igo.convert import native_copy
+            path = native_copy(
+                path, gae, gae,
+                None if native_cache is True else native_cache)
+        if PackedDictionary.is_packed(path):
+            path = self.packed = PackedDictionary(path, use_mmap)
+        elif not os.path.isdir(path):
+            raise IOError('dictionary not found: %s' % path)
+        self._path = path
+        self._accel = igo.accel.load(accel)
+        self._wdc = None
+        self._unk = None
+        self._mtx = None
+        self._viterbi = None
+        self._matrix2d = None
+        self._lock = threading.RLock()
+
+    def __check(self):
+        if self._path is None:
+            raise ValueError('dictionary is already released')
+
+    @property
+    def wdc(self):
+        """ 単語辞書. 最初に参照された時に読み込まれる """
+        wdc = self._wdc
+        if wdc is None:
+            with self._lock:
+                if self._wdc is None:
+                    self.__check()
+                    o = self.options
+                    gae = o['gae']
+                    wdc = WordDic(self._path, gae, gae, o['use_mmap'],
+                                  o['feature_cache_size'],
+                                  o['feature_store'])
+                    if o['preload_word_ids']:
+                        wdc.preload_features(o['preload_word_ids'])
+                    wdc.trie.accelerate(self._accel)
+                    self._wdc = wdc
+                wdc = self._wdc
+        return wdc
+
+    @property
+    def unk(self):
+        """ 未知語辞書. 最初に参照された時に読み込まれる """
+        unk = self._unk
+        if unk is None:
+            with self._lock:
+                if self._unk is None:
+                    self.__check()
+                    o = self.options
+                    unk = Unknown(self._path, o['gae'], o['use_mmap'])
+                    unk.accelerate(self._accel)
+                    self._unk = unk
+                unk = self._unk
+        return unk
+
+    @property
+    def mtx(self):
+        """ 連接コスト表. 最初に参照された時に読み込まれる """
+        mtx = self._mtx
+        if mtx is None:
+            with self._lock:
+                if self._mtx is None:
+                    self.__check()
+                    o = self.options
+                    mtx = Matrix(self._path, o['gae'], o['use_mmap'])
+                    if self._accel is not None:
+                        self._viterbi = self._accel.Viterbi(mtx.matrix,
+                                                            mtx.left_size)
+                    self._mtx = mtx
+                mtx = self._mtx
+        return mtx
+
+    @property
+    def viterbi(self):
+        """ igo._accel.Viterbi. 高速化モジュールを使用しない場合はNone """
+        self.mtx
+        return self._viterbi
+
+    @property
+    def matrix2d(self):
+        """ engine='numpy'で使用する2次元の連接コスト表. NumPyが必要 """
+        m = self._matrix2d
+        if m is None:
+            mtx = self.mtx
+            with self._lock:
+                if self._matrix2d is None:
+                    from igo.numpy_engine import as_ndarray
+                    self._matrix2d = as_ndarray(mtx)
+                m = self._matrix2d
+        return m
+
+    def warmup(self, prefetch=True):
+        """
+        全ての構成要素を読み込む
+
+        @param prefetch Trueの場合, mmapされた辞書をmadvise(MADV_WILLNEED)で
+                        先読みさせる
+        @return self
+        """
+        wdc, unk, mtx = self.wdc, self.unk, self.mtx
+        if prefetch:
+            if self.packed is not None:
+                self.packed.prefetch()
+            else:
+                wdc.prefetch()
+                unk.prefetch()
+                mtx.prefetch()
+        return self
+
+    def release(self):
+        with self._lock:
+            self._viterbi = None
+            self._matrix2d = None
+            for c in (self._wdc, self._unk, self._mtx):
+                if c is not None:
+                    c.release()
+            self._wdc = self._unk = self._mtx = None
+            if self.packed is not None:
+                self.packed.release()
+                self.packed = None
+            self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, et, ev, tb):
+        self.release()
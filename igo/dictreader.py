@@ -9,9 +9,10 @@ import sys
 LE, UTF16Codec = (True, codecs.lookup('UTF-16-LE')) \
     if sys.byteorder == 'little' else (False, codecs.lookup('UTF-16-LE'))
 
+sizemap = {t: struct.calcsize(t) for t in 'ihHB'}
+
 try:
     import mmap
-    sizemap = {t: struct.calcsize(t) for t in 'ihH'}
     allow_mmap = hasattr(memoryview, 'cast') and LE
 except:
     allow_mmap = False
@@ -34,6 +35,16 @@ def swap(a):
     a.byteswap()
 
 
+def prefetch(m):
+    """
+    mmapされた領域をmadvise(MADV_WILLNEED)で先読みさせる
+    madviseが利用できない環境では何もしない
+    """
+    if m is not None and hasattr(m, 'madvise') and \
+            hasattr(mmap, 'MADV_WILLNEED'):
+        m.madvise(mmap.MADV_WILLNEED)
+
+
 class StandardReader:
     """
     reader for dictionary files using normal file io
@@ -87,6 +98,11 @@ class StandardReader:
         self.byteswap(ary)
         return ary
 
+    def get_bytearray(self, count):
+        ary = array.array('B')
+        ary.fromfile(self.f, count)
+        return ary
+
     def size(self):
         return size(self.f)
 
@@ -98,6 +114,10 @@ class StandardReader:
     def release(self):
         self.close()
 
+    def prefetch(self):
+        # everything has been read into memory
+        pass
+
 
 class MMapedReader:
     """
@@ -141,6 +161,9 @@ class MMapedReader:
         c = count if count is not None else (self.size() // 2)
         return self._get('H', c)
 
+    def get_bytearray(self, count):
+        return self._get('B', count)
+
     def size(self):
         return len(self.mmap)
 
@@ -153,15 +176,175 @@ class MMapedReader:
         self.mmap.close()
         os.close(self.fd)
 
+    def prefetch(self):
+        prefetch(self.mmap)
+
+
+class SectionReader:
+    """
+    reader for a section of a packed dictionary.
+    arrays are views of the packed dictionary if its byte order is native,
+    otherwise they are copied and byteswapped.
+    """
+    __slots__ = ['view', 'pos', 'swap', 'copy']
+
+    def __init__(self, view, swap=False):
+        self.view = view
+        self.pos = 0
+        self.swap = swap
+        self.copy = swap or not hasattr(memoryview, 'cast')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, et, ev, t):
+        self.close()
+
+    def _get(self, fmt, cnt):
+        t = self.pos + sizemap[fmt] * cnt
+        v = self.view[self.pos:t]
+        self.pos = t
+        if self.copy:
+            ary = array.array(fmt)
+            if hasattr(ary, 'frombytes'):
+                ary.frombytes(v.tobytes())
+            else:
+                ary.fromstring(v.tobytes())
+            if self.swap:
+                ary.byteswap()
+            return ary
+        return memoryview(v).cast(fmt)
+
+    def get_int(self):
+        return self._get('i', 1)[0]
+
+    def get_intarray(self, count=None):
+        c = count if count is not None else (self.size() // 4)
+        return self._get('i', c)
+
+    def get_shortarray(self, count):
+        return self._get('h', count)
+
+    def get_chararray(self, count=None):
+        c = count if count is not None else (self.size() // 2)
+        return self._get('H', c)
+
+    def get_bytearray(self, count):
+        return self._get('B', count)
+
+    def size(self):
+        return len(self.view)
+
+    def close(self):
+        pass
+
+    def release(self):
+        self.view = None
+
+    def prefetch(self):
+        # the whole file is prefetched by PackedDictionary
+        pass
+
+
+PACK_MAGIC = b'IGODIC\x00\x00'
+PACK_VERSION = 1
+PACK_ALIGN = 4096
+""" 各セクションの開始位置のアライメント. madviseできるようにページサイズに揃える """
+PACK_HEADER = struct.Struct('<8sIII')
+""" magic, version, flags(bit0: bigendian), 件数 """
+PACK_ENTRY = struct.Struct('<16sQQ')
+""" 名前, 開始位置, サイズ """
+
+
+class PackedDictionary:
+    """
+    1ファイルにまとめられたバイナリ辞書 (igo.packで作成する)
+    ファイルは一度だけmmapされ, 各構成ファイルはそのビューとして読み込まれる
+    """
+    __slots__ = ['path', 'bigendian', 'sections', 'fd', 'mmap', 'view']
+
+    def __init__(self, path, use_mmap=None):
+        self.path = path
+        self.fd = None
+        self.mmap = None
+        with open(path, 'rb') as f:
+            magic, version, flags, count = PACK_HEADER.unpack(
+                f.read(PACK_HEADER.size))
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise ValueError('not a packed igo dictionary: %s' % path)
+            self.bigendian = bool(flags & 1)
+            self.sections = {}
+            for _ in range(count):
+                name, offset, sz = PACK_ENTRY.unpack(f.read(PACK_ENTRY.size))
+                self.sections[name.rstrip(b'\x00').decode('ascii')] = (offset,
+                                                                       sz)
+            m = allow_mmap if use_mmap is None else use_mmap
+            if m and hasattr(memoryview, 'cast'):
+                self.fd = os.open(path, os.O_RDONLY)
+                self.mmap = mmap.mmap(self.fd, length=0,
+                                      access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mmap)
+            else:
+                f.seek(0)
+                self.view = memoryview(f.read())
+
+    @staticmethod
+    def is_packed(path):
+        """
+        pathが1ファイルにまとめられた辞書かどうか
+        """
+        if not os.path.isfile(path):
+            return False
+        with open(path, 'rb') as f:
+            return f.read(len(PACK_MAGIC)) == PACK_MAGIC
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def reader(self, name):
+        """
+        @param name 構成ファイルの名前 (例: 'word2id')
+        @return 構成ファイルのreader
+        """
+        offset, sz = self.sections[name]
+        return SectionReader(self.view[offset:offset + sz],
+                             self.bigendian == LE)
+
+    def prefetch(self):
+        """
+        mmapされている場合, ファイル全体を先読みさせる
+        """
+        prefetch(self.mmap)
+
+    def release(self):
+        self.view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+            os.close(self.fd)
+            self.mmap = None
+
 
 def DictReader(f, b=False, use_mmap=None):
     m = allow_mmap if use_mmap is None else use_mmap
-    if m:
+    # MMapedReader cannot convert byte order
+    if m and not (b and LE):
         return MMapedReader(f, b)
     else:
         return StandardReader(f, b)
 
 
+def open_reader(path, name, bigendian=False, use_mmap=None):
+    """
+    辞書の構成ファイルを開く
+
+    @param path 辞書のディレクトリ, またはPackedDictionary
+    @param name 構成ファイルの名前
+    """
+    if isinstance(path, PackedDictionary):
+        return path.reader(name)
+    return DictReader(path + "/" + name, bigendian, use_mmap)
+
+
 # this is only used for splitted dictionary mode
 # no mmap version provided for now
 def get_chararray_multi(filepaths, bigendian=False):
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+ラティスの出力と周辺確率
+
+Tagger.lattice(text)は全ての候補を保持したラティス(ExportedLattice)を返す.
+ノードの属性はarray.arrayの列に格納される. ノード0はBOS, 最後のノードはEOSで,
+その他のノードは開始位置の順に並ぶ. 位置iから始まるノードの前方のノードは,
+位置iで終わるノード(空白を挟む場合は空白の前で終わるノード)で, prevs(i)で得られる.
+辺のコストはMatrix.linkcostで求められる.
+
+周辺確率は, 経路の確率がexp(-総コスト / temperature)に比例するものとして
+前向き・後ろ向きアルゴリズムで求める. 同じ位置から始まるノードと, その前方の
+ノードの組み合わせをまとめて計算する. NumPyが利用できる場合は行列演算で行う.
+"""
+import array
+import math
+
+from igo.dictreader import UTF16Codec
+
+DEFAULT_TEMPERATURE = 700 / 0.75
+""" MeCabの周辺確率のデフォルト(theta=0.75, ipadicのcost-factor=700)に相当する温度 """
+
+_NEG_INF = float('-inf')
+
+
+def _logsumexp(values):
+    m = max(values)
+    if m == _NEG_INF:
+        return m
+    return m + math.log(sum(math.exp(v - m) for v in values))
+
+
+class ExportedLattice(object):
+    """
+    全ての候補を保持したラティス
+
+    ノードの属性: word_id, start, length, left_id, right_id,
+    word_cost(単語のコスト), cost(始点からの最小コスト), prev(最適な前方のノード).
+    BOS, EOSのword_idは-1.
+    """
+    __slots__ = ['text', 'word_id', 'start', 'length', 'left_id', 'right_id',
+                 'word_cost', 'cost', 'prev', 'node_begin', 'prev_begin',
+                 'prev_nodes', 'marginal', 'temperature', 'wdc', 'mtx']
+
+    def __init__(self, nb, text, wdc, mtx):
+        """
+        @param nb igo.nbest.build_latticeで作成したラティス
+        @param text 解析したテキスト(UTF-16の配列)
+        """
+        self.text = text
+        self.wdc = wdc
+        self.mtx = mtx
+        ends = nb.ends
+        vns = nb.nodes
+        length = len(text)
+        bos = ends[0][0]
+        n = len(vns) + 2
+        index = {id(bos): 0}
+        for k, vn in enumerate(vns, 1):
+            index[id(vn)] = k
+
+        self.word_id = array.array('i', [-1] + [vn.word_id for vn in vns] +
+                                   [-1])
+        self.start = array.array('i', [0] + [vn.start for vn in vns] +
+                                 [length])
+        self.length = array.array('i', [0] + [vn.length for vn in vns] + [0])
+        self.left_id = array.array('i', [0] + [vn.left_id for vn in vns] +
+                                   [0])
+        self.right_id = array.array('i', [0] + [vn.right_id for vn in vns] +
+                                    [0])
+        costs = wdc.costs
+        self.word_cost = array.array('i', [0] +
+                                     [costs[vn.word_id] for vn in vns] + [0])
+        self.cost = array.array('d', [0] + [vn.cost for vn in vns] + [0])
+        self.prev = array.array('i', [-1] +
+                                [index[id(vn.prev)] for vn in vns] + [-1])
+
+        # node_begin[i]..node_begin[i + 1]: nodes starting at i
+        self.node_begin = array.array('i', [0]) * (length + 2)
+        k = 1
+        for i in range(length):
+            self.node_begin[i] = k
+            while k < n - 1 and self.start[k] == i:
+                k += 1
+        self.node_begin[length] = n - 1
+        self.node_begin[length + 1] = n
+
+        # prev_nodes[prev_begin[i]:prev_begin[i + 1]]: nodes ending at i
+        self.prev_begin = array.array('i', [0]) * (length + 2)
+        self.prev_nodes = array.array('i')
+        for i in range(length + 1):
+            self.prev_begin[i] = len(self.prev_nodes)
+            if ends[i] is not None:
+                self.prev_nodes.extend(index[id(p)] for p in ends[i])
+        self.prev_begin[length + 1] = len(self.prev_nodes)
+
+        # EOS
+        eos = n - 1
+        best = None
+        for p in self.prevs(length):
+            c = self.cost[p] + mtx.linkcost(self.right_id[p], 0)
+            if best is None or c < self.cost[eos]:
+                best = p
+                self.cost[eos] = c
+        self.prev[eos] = best
+        self.marginal = None
+        """ 周辺確率. compute_marginalsで計算される """
+        self.temperature = None
+
+    def __len__(self):
+        return len(self.word_id)
+
+    def nodes(self, i):
+        """
+        @return 位置iから始まるノードのrange. 位置len(text)にはEOSのみが含まれる
+        """
+        return range(self.node_begin[i], self.node_begin[i + 1])
+
+    def prevs(self, i):
+        """
+        @return 位置iから始まるノードの前方のノードのリスト
+        """
+        return self.prev_nodes[self.prev_begin[i]:self.prev_begin[i + 1]]
+
+    def edges(self, n):
+        """
+        @return ノードnに入る辺の(前方のノード, 連接コスト)のリスト
+        """
+        left_id = self.left_id[n]
+        linkcost = self.mtx.linkcost
+        return [(p, linkcost(self.right_id[p], left_id))
+                for p in self.prevs(self.start[n])] if n else []
+
+    def surface(self, n):
+        s = self.start[n]
+        return UTF16Codec.decode(self.text[s:s + self.length[n]])[0]
+
+    def feature(self, n):
+        return self.wdc.feature(self.word_id[n]) if self.word_id[n] >= 0 \
+            else u'BOS/EOS'
+
+    def best_path(self):
+        """
+        @return 最適パスのノードのリスト. BOS, EOSを含まない
+        """
+        path = []
+        n = self.prev[len(self) - 1]
+        while n > 0:
+            path.append(n)
+            n = self.prev[n]
+        path.reverse()
+        return path
+
+    def compute_marginals(self, temperature=DEFAULT_TEMPERATURE,
+                          use_numpy=None):
+        """
+        各ノードの周辺確率を求める
+
+        @param temperature 温度. 小さいほど最適パスに確率が集中する
+        @param use_numpy NumPyを使用するかどうか. None指定時は利用可能であれば使用する
+        @return 周辺確率の配列. marginalにも格納される
+        """
+        if use_numpy is None or use_numpy:
+            try:
+                import numpy
+            except ImportError:
+                if use_numpy:
+                    raise
+                numpy = None
+        if use_numpy is False or numpy is None:
+            alpha, beta = self.__forward_backward(temperature)
+            z = alpha[-1]
+            self.marginal = array.array(
+                'd', [math.exp(a + b - z) if a + b > _NEG_INF else 0.0
+                      for a, b in zip(alpha, beta)])
+        else:
+            self.marginal = array.array(
+                'd', self.__forward_backward_numpy(numpy, temperature))
+        self.temperature = temperature
+        return self.marginal
+
+    def __forward_backward(self, t):
+        n = len(self)
+        matrix = self.mtx.matrix
+        left_size = self.mtx.left_size
+        left_id, right_id = self.left_id, self.right_id
+        word_cost = self.word_cost
+        positions = range(len(self.text) + 1)
+
+        alpha = [_NEG_INF] * n
+        alpha[0] = 0.0
+        for i in positions:
+            ps = self.prevs(i)
+            for k in self.nodes(i):
+                row = left_id[k] * left_size
+                alpha[k] = _logsumexp(
+                    [alpha[p] - matrix[row + right_id[p]] / t for p in ps]) \
+                    - word_cost[k] / t
+
+        beta = [_NEG_INF] * n
+        beta[n - 1] = 0.0
+        for i in reversed(positions):
+            ss = self.nodes(i)
+            if not ss:
+                continue
+            for p in self.prevs(i):
+                r = right_id[p]
+                v = _logsumexp([beta[s] - (matrix[left_id[s] * left_size + r] +
+                                           word_cost[s]) / t for s in ss])
+                beta[p] = _logsumexp([beta[p], v])
+        return alpha, beta
+
+    def __forward_backward_numpy(self, numpy, t):
+        from igo.numpy_engine import as_ndarray
+        m2d = as_ndarray(self.mtx)
+        n = len(self)
+        left_id = numpy.frombuffer(self.left_id, numpy.int32).astype(numpy.intp)
+        right_id = numpy.frombuffer(self.right_id,
+                                    numpy.int32).astype(numpy.intp)
+        word_cost = numpy.frombuffer(self.word_cost, numpy.int32) / t
+        prev_nodes = numpy.frombuffer(self.prev_nodes, numpy.int32).astype(
+            numpy.intp)
+        node_begin = self.node_begin
+        prev_begin = self.prev_begin
+        positions = range(len(self.text) + 1)
+
+        logsumexp = numpy.logaddexp.reduce
+
+        # (nodes, prevs, link costs) of each position, reused by beta
+        columns = []
+        alpha = numpy.full(n, -numpy.inf)
+        alpha[0] = 0.0
+        for i in positions:
+            b, e = node_begin[i], node_begin[i + 1]
+            if b == e:
+                continue
+            ps = prev_nodes[prev_begin[i]:prev_begin[i + 1]]
+            links = m2d[left_id[b:e, None], right_id[ps]] / t
+            alpha[b:e] = logsumexp(alpha[ps] - links, 1) - word_cost[b:e]
+            columns.append((b, e, ps, links))
+
+        beta = numpy.full(n, -numpy.inf)
+        beta[n - 1] = 0.0
+        for b, e, ps, links in reversed(columns):
+            v = logsumexp((beta[b:e] - word_cost[b:e])[:, None] - links, 0)
+            beta[ps] = numpy.logaddexp(beta[ps], v)
+
+        with numpy.errstate(invalid='ignore'):
+            marginal = numpy.exp(alpha + beta - alpha[-1])
+        return numpy.nan_to_num(marginal).tolist()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+圧縮された素性データ(word.feat)
+
+word.datは全ての単語の素性をUTF-16のまま並べたもので, 辞書で最も大きな
+構成ファイルになる. word.featは素性を先頭の列(品詞から活用形まで)と残りの列
+(原形, 読み, 発音)に分け, 先頭の列は重複を除いた表に, 残りの列は
+単語ID順に一定数毎のブロックにまとめてzlibで圧縮して格納する.
+素性は参照された単語を含むブロックだけを展開して求める.
+
+  $ python -m igo.features ipadic
+
+辞書のディレクトリにword.featがあれば, word.datの代わりに使用される.
+解析結果の素性はword.datを使用した場合と同じ.
+
+ファイルの形式 (整数は辞書のバイトオーダー, 文字列はUTF-16-LE):
+  int 単語数, int ブロックの単語数, int 表のバイト数, int データのバイト数
+  int[ブロック数+1] 各ブロックのデータ内の開始位置
+  byte[表のバイト数] 先頭の列を'\\x00'区切りで並べたもの
+  byte[データのバイト数] 圧縮されたブロック
+ブロックを展開すると'\\x00'区切りの単語毎の文字列になる. 各文字列の1文字目は
+表の添字+1, 残りは素性の残りの列.
+"""
+from __future__ import print_function
+import argparse
+import array
+import os
+import sys
+import zlib
+
+from igo.dictreader import LE, UTF16Codec
+
+if sys.version_info[0] > 2:
+    unichr = chr
+
+    def tobytes(x):
+        return x.tobytes()
+else:
+
+    def tobytes(x):
+        return x.tostring()
+
+FILENAME = 'word.feat'
+PREFIX_FIELDS = 6
+""" 表に格納する先頭の列の数. IPADICでは品詞, 品詞細分類1-3, 活用型, 活用形 """
+BLOCK_SIZE = 16
+""" 1ブロックの単語数. 大きいほど圧縮率は上がるが, 素性の展開は遅くなる """
+_MAX_PREFIXES = 0xD7FF - 1
+""" 表の添字+1をサロゲートでない1文字で表せる数 """
+
+
+def split_feature(feature, fields=PREFIX_FIELDS):
+    """
+    素性を先頭のfields列(区切りの','を含む)と残りの列に分ける
+    """
+    i = -1
+    for _ in range(fields):
+        i = feature.find(u',', i + 1)
+        if i == -1:
+            return feature, u''
+    return feature[:i + 1], feature[i + 1:]
+
+
+class FeatureStore(object):
+    """
+    圧縮された素性データを読み込む
+
+    直前に展開したブロックを1つだけ保持する. 同じ表層形の単語は
+    単語IDが連続しているため, 続けて参照されることが多い.
+    """
+    __slots__ = ['rd', 'count', 'block_size', 'offsets', 'prefixes', 'data',
+                 'last']
+
+    def __init__(self, rd):
+        """
+        @param rd word.featのreader (igo.dictreader.open_reader)
+        """
+        self.rd = rd
+        with rd as r:
+            self.count = r.get_int()
+            self.block_size = r.get_int()
+            prefix_size = r.get_int()
+            data_size = r.get_int()
+            blocks = (self.count + self.block_size - 1) // self.block_size
+            self.offsets = r.get_intarray(blocks + 1)
+            prefixes = r.get_bytearray(prefix_size)
+            self.data = r.get_bytearray(data_size)
+        self.prefixes = tobytes(prefixes).decode('utf-16-le').split(u'\x00')
+        self.last = None
+
+    def block(self, b):
+        """
+        @return b番目のブロックの単語毎の文字列のリスト
+        """
+        last = self.last
+        if last is not None and last[0] == b:
+            return last[1]
+        entries = zlib.decompress(tobytes(
+            self.data[self.offsets[b]:self.offsets[b + 1]])) \
+            .decode('utf-16-le').split(u'\x00')
+        # a tuple is replaced at once, for other threads
+        self.last = (b, entries)
+        return entries
+
+    def feature(self, word_id):
+        b, i = divmod(word_id, self.block_size)
+        e = self.block(b)[i]
+        return self.prefixes[ord(e[0]) - 1] + e[1:]
+
+    def word_data(self, word_id):
+        """
+        WordDic.word_dataと同じく素性をUTF-16でエンコードしたバイト列を返す
+        """
+        return UTF16Codec.encode(self.feature(word_id))[0]
+
+    def prefetch(self):
+        self.rd.prefetch()
+
+    def release(self):
+        self.last = None
+        del self.offsets
+        del self.data
+        self.rd.release()
+
+
+def write(path, features, bigendian=False, block_size=BLOCK_SIZE,
+          fields=PREFIX_FIELDS):
+    """
+    素性をword.featの形式で書き出す
+
+    @param path 出力するファイル
+    @param features 単語ID順の素性のiterable
+    @param bigendian ビッグエンディアンの辞書(gae=True用)かどうか
+    @param block_size 1ブロックの単語数
+    @param fields 表に格納する先頭の列の数
+    """
+    prefix_ids = {}
+    offsets = array.array('i', [0])
+    data = []
+    count = 0
+    entries = []
+
+    def flush():
+        c = zlib.compress(u'\x00'.join(entries).encode('utf-16-le'), 9)
+        data.append(c)
+        del entries[:]
+        offsets.append(offsets[-1] + len(c))
+
+    for feature in features:
+        prefix, rest = split_feature(feature, fields)
+        k = prefix_ids.get(prefix)
+        if k is None:
+            k = prefix_ids[prefix] = len(prefix_ids)
+            if k >= _MAX_PREFIXES:
+                raise ValueError('too many feature prefixes, '
+                                 'use smaller fields')
+        entries.append(unichr(k + 1) + rest)
+        count += 1
+        if len(entries) == block_size:
+            flush()
+    if entries:
+        flush()
+    prefixes = [None] * len(prefix_ids)
+    for prefix, k in prefix_ids.items():
+        prefixes[k] = prefix
+    table = u'\x00'.join(prefixes).encode('utf-16-le')
+    size = offsets[-1]
+    header = array.array('i', [count, block_size, len(table), size])
+    if bigendian == LE:
+        header.byteswap()
+        offsets.byteswap()
+    with open(path, 'wb') as f:
+        header.tofile(f)
+        offsets.tofile(f)
+        f.write(table)
+        for c in data:
+            f.write(c)
+
+
+def compress(path, bigendian=False, block_size=BLOCK_SIZE,
+             fields=PREFIX_FIELDS):
+    """
+    バイナリ辞書のword.dat(word.dat.*)からword.featを作成する
+
+    @param path バイナリ辞書のディレクトリ
+    @param bigendian ビッグエンディアンの辞書(gae=True用)かどうか
+    @return 作成したファイルのパス
+    """
+    from igo.dictionary import WordDic
+    splitted = not os.path.exists(os.path.join(path, 'word.dat'))
+    wdc = WordDic(path, bigendian, splitted, use_mmap=False,
+                  feature_store=False)
+    try:
+        dst = os.path.join(path, FILENAME)
+        write(dst, (wdc.feature(i) for i in range(len(wdc.costs) - 1)),
+              bigendian, block_size, fields)
+    finally:
+        wdc.release()
+    return dst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m igo.features',
+        description='create a compressed feature store(word.feat) '
+        'of a binary dictionary')
+    parser.add_argument('path', help='directory of a binary dictionary')
+    parser.add_argument('--bigendian', action='store_true',
+                        help='path is a big endian dictionary')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                        help='number of words in a compressed block '
+                        '(default: %d)' % BLOCK_SIZE)
+    parser.add_argument('--fields', type=int, default=PREFIX_FIELDS,
+                        help='number of leading fields stored in the shared '
+                        'table (default: %d)' % PREFIX_FIELDS)
+    args = parser.parse_args(argv)
+    dst = compress(args.path, args.bigendian, args.block_size, args.fields)
+    print('%s: %d bytes' % (dst, os.path.getsize(dst)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+配列ベースのラティス
+
+形態素の候補毎にViterbiNodeを作成する代わりに, 候補の情報を
+array.arrayの列(struct of arrays)に格納する. 列は必要に応じて倍々に拡張され,
+同じLatticeを使う限り解析をまたいで再利用される.
+ViterbiNodeは要求された場合(最適パスの取り出し等)にのみ作成される.
+"""
+import array
+from igo.dictionary import ViterbiNode
+
+_INITIAL_CAPACITY = 1024
+
+try:
+    _COST_TYPE = 'q'
+    array.array(_COST_TYPE)
+except ValueError:
+    # for python2
+    _COST_TYPE = 'l'
+
+
+def _grow(col, n):
+    col.extend(array.array(col.typecode, [0]) * n)
+
+
+class Lattice(object):
+    """
+    配列ベースのラティス
+
+    ノード0はBOSノード.
+    ノードの終了位置毎のリストは, エントリ(ent_node, ent_next)の連結リストで表現する.
+    同じLatticeを複数のスレッドから同時に使用してはならない.
+    """
+    __slots__ = ['costs', 'left_ids', 'right_ids', 'indices', 'matrix',
+                 'left_size', 'word_id', 'start', 'length', 'cost', 'left_id',
+                 'right_id', 'prev', 'size', 'head', 'tail', 'ent_node',
+                 'ent_next', 'nents', 'i', 'empty', 'prev_nodes',
+                 'prev_costs', 'prev_rights', 'min_link']
+
+    def __init__(self, wdc, mtx, viterbi=None):
+        """
+        @param viterbi igo._accel.Viterbi. 指定された場合は最小コストの計算に使用する
+        """
+        self.costs = wdc.costs
+        self.left_ids = wdc.left_ids
+        self.right_ids = wdc.right_ids
+        self.indices = wdc.indices
+        self.matrix = mtx.matrix
+        self.left_size = mtx.left_size
+        self.min_link = None if viterbi is None else viterbi.min_link
+
+        z = array.array('i', [0]) * _INITIAL_CAPACITY
+        self.word_id = array.array('i', z)
+        """ word_id[ノード] = 単語ID """
+        self.start = array.array('i', z)
+        """ start[ノード] = 入力テキスト内での形態素の開始位置 """
+        self.length = array.array('i', z)
+        """ length[ノード] = 形態素の表層形の長さ """
+        self.cost = array.array(_COST_TYPE, z)
+        """ cost[ノード] = 始点からノードまでの総コスト """
+        self.left_id = array.array('i', z)
+        """ left_id[ノード] = 左文脈ID """
+        self.right_id = array.array('i', z)
+        """ right_id[ノード] = 右文脈ID """
+        self.prev = array.array('i', z)
+        """ prev[ノード] = コスト最小の前方のノード """
+        self.size = 0
+
+        self.head = array.array('i', z)
+        """ head[位置] = その位置で終わるノードのリストの最初のエントリ """
+        self.tail = array.array('i', z)
+        """ tail[位置] = その位置で終わるノードのリストの最後のエントリ """
+        self.ent_node = array.array('i', z)
+        self.ent_next = array.array('i', z)
+        self.nents = 0
+
+        self.i = 0
+        self.empty = True
+        self.prev_nodes = []
+        self.prev_costs = []
+        self.prev_rights = []
+
+    def reset(self, length):
+        """
+        長さlengthのテキストを解析するためにラティスを初期化する
+        BOSノードが位置0に置かれる
+        """
+        n = len(self.head)
+        if n <= length:
+            while n <= length:
+                n *= 2
+            _grow(self.head, n - len(self.head))
+            _grow(self.tail, n - len(self.tail))
+        self.head[0:length + 1] = array.array('i', [-1]) * (length + 1)
+        self.size = 0
+        self.nents = 0
+        bos = self._new_node(0, 0, 0, 0, 0, 0)
+        self.prev[bos] = -1
+        self._append_end(0, bos)
+
+    def has_ends(self, i):
+        return self.head[i] != -1
+
+    def set(self, i):
+        """
+        位置iから始まる形態素を追加する準備をする
+        """
+        self.i = i
+        self.empty = True
+        cost = self.cost
+        right_id = self.right_id
+        ent_node = self.ent_node
+        ent_next = self.ent_next
+        nodes = self.prev_nodes = []
+        costs = self.prev_costs = []
+        rights = self.prev_rights = []
+        e = self.head[i]
+        while e != -1:
+            p = ent_node[e]
+            nodes.append(p)
+            costs.append(cost[p])
+            rights.append(right_id[p])
+            e = ent_next[e]
+
+    def isempty(self):
+        return self.empty
+
+    def add_word(self, start, length, trie_id):
+        """
+        単語辞書の検索結果を追加する. Searcher.commonprefix_searchのコールバック
+        """
+        indices = self.indices
+        costs = self.costs
+        left_ids = self.left_ids
+        right_ids = self.right_ids
+        for i in range(indices[trie_id], indices[trie_id + 1]):
+            self._add(i, length, costs[i], left_ids[i], right_ids[i])
+
+    def add_node(self, word_id, length, cost, left_id, right_id):
+        """
+        位置iから始まる形態素を追加する. ユーザー辞書の単語の追加に使用する
+        """
+        self._add(word_id, length, cost, left_id, right_id)
+
+    def search_from_trie(self, trie_id, start, length, isspace, callback):
+        """
+        未知語の検索結果を追加する. Unknown.searchから呼び出される
+        """
+        indices = self.indices
+        end = indices[trie_id + 1]
+        if isspace:
+            for _ in range(indices[trie_id], end):
+                self.empty = False
+                for p in self.prev_nodes:
+                    self._append_end(self.i + length, p)
+            return
+        costs = self.costs
+        left_ids = self.left_ids
+        right_ids = self.right_ids
+        for i in range(indices[trie_id], end):
+            self._add(i, length, costs[i], left_ids[i], right_ids[i])
+
+    def _add(self, word_id, length, cost, left_id, right_id):
+        self.empty = False
+        if self.min_link is not None:
+            best, mincost = self.min_link(left_id, self.prev_costs,
+                                          self.prev_rights)
+            n = self._new_node(word_id, self.i, length, cost + mincost,
+                               left_id, right_id)
+            self.prev[n] = self.prev_nodes[best]
+            self._append_end(self.i + length, n)
+            return
+        matrix = self.matrix
+        base = left_id * self.left_size
+        prev_costs = self.prev_costs
+        prev_rights = self.prev_rights
+        best = 0
+        mincost = prev_costs[0] + matrix[base + prev_rights[0]]
+        for k in range(1, len(prev_costs)):
+            c = prev_costs[k] + matrix[base + prev_rights[k]]
+            if c < mincost:
+                mincost = c
+                best = k
+        n = self._new_node(word_id, self.i, length, cost + mincost, left_id,
+                           right_id)
+        self.prev[n] = self.prev_nodes[best]
+        self._append_end(self.i + length, n)
+
+    def _new_node(self, word_id, start, length, cost, left_id, right_id):
+        n = self.size
+        if n == len(self.word_id):
+            for col in (self.word_id, self.start, self.length, self.cost,
+                        self.left_id, self.right_id, self.prev):
+                _grow(col, n)
+        self.word_id[n] = word_id
+        self.start[n] = start
+        self.length[n] = length
+        self.cost[n] = cost
+        self.left_id[n] = left_id
+        self.right_id[n] = right_id
+        self.size = n + 1
+        return n
+
+    def _append_end(self, pos, node):
+        e = self.nents
+        if e == len(self.ent_node):
+            _grow(self.ent_node, e)
+            _grow(self.ent_next, e)
+        self.ent_node[e] = node
+        self.ent_next[e] = -1
+        if self.head[pos] == -1:
+            self.head[pos] = e
+        else:
+            self.ent_next[self.tail[pos]] = e
+        self.tail[pos] = e
+        self.nents = e + 1
+
+    def finish(self, length):
+        """
+        EOSノードに至るコスト最小のノードを求める
+
+        @return 最適パスの最後のノード
+        """
+        self.set(length)
+        if self.min_link is not None:
+            return self.prev_nodes[self.min_link(0, self.prev_costs,
+                                                 self.prev_rights)[0]]
+        matrix = self.matrix
+        prev_costs = self.prev_costs
+        prev_rights = self.prev_rights
+        best = 0
+        mincost = prev_costs[0] + matrix[prev_rights[0]]
+        for k in range(1, len(prev_costs)):
+            c = prev_costs[k] + matrix[prev_rights[k]]
+            if c < mincost:
+                mincost = c
+                best = k
+        return self.prev_nodes[best]
+
+    def node(self, n):
+        """
+        ノードnをViterbiNodeとして取り出す. prevは設定されない
+        """
+        return ViterbiNode(self.word_id[n], self.start[n], self.length[n],
+                           self.cost[n], self.left_id[n], self.right_id[n],
+                           False)
+
+    def backtrace(self, n):
+        """
+        ノードnまでの最適パスをViterbiNodeのリストとして取り出す
+        リストの先頭ノードから順にprevで次のノードを辿ることができる
+
+        @return 最適パスの最初のノード. 空の場合はNone
+        """
+        head = None
+        prev = self.prev
+        while n > 0:
+            vn = self.node(n)
+            vn.prev = head
+            head = vn
+            n = prev[n]
+        return head
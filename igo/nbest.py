@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+N-best解
+
+前向きのViterbiで各ノードまでの最小コストを求めた後, EOSから後ろ向きにA*探索を
+行い, 総コストの小さい順に経路を取り出す. 前向きの最小コストは残りの経路の
+コストそのものなので, 取り出された経路は常に総コスト順になる.
+
+探索キューは必要な経路の数nに比例する大きさに保たれる. キューの要素はそれぞれ
+異なる経路に対応し, その総コストは優先度に等しいため, 優先度の小さいn個の要素を
+残せば上位n個の経路は失われない.
+"""
+import heapq
+import itertools
+
+from igo.dictionary import ViterbiNode
+
+
+class NBestLattice(object):
+    """
+    全ての候補を保持するラティス. WordDic.search, Unknown.searchのcallbackとして使用する
+
+    ends[位置]はその位置で終わるノードのリストで, 位置iから始まるノードの前方の
+    ノードはends[i]である. nodesには空白以外のノードが開始位置の順に格納される.
+    """
+    __slots__ = ['ends', 'nodes', 'i', 'prevs', 'empty', 'set_mincost_node',
+                 'spaced']
+
+    def __init__(self, length, set_mincost_node):
+        self.ends = [None] * (length + 1)
+        self.ends[0] = [ViterbiNode.makeBOSEOS()]
+        self.nodes = []
+        self.i = 0
+        self.prevs = None
+        self.empty = True
+        self.set_mincost_node = set_mincost_node
+        self.spaced = set()
+        """ 空白を挟んで前方のノードが追加された位置 """
+
+    def set(self, i):
+        ends = self.ends
+        if i in self.spaced:
+            # the same node can be added via spaces of different lengths
+            seen = set()
+            prevs = []
+            for p in ends[i]:
+                if id(p) not in seen:
+                    seen.add(id(p))
+                    prevs.append(p)
+            ends[i] = prevs
+        self.i = i
+        self.prevs = ends[i]
+        self.empty = True
+
+    def __call__(self, vn):
+        self.empty = False
+        ends = self.ends
+        end = self.i + vn.length
+        if ends[end] is None:
+            ends[end] = []
+        if vn.isspace:
+            ends[end].extend(self.prevs)
+            self.spaced.add(end)
+        else:
+            ends[end].append(self.set_mincost_node(vn, self.prevs))
+            self.nodes.append(vn)
+
+    def isempty(self):
+        return self.empty
+
+
+def build_lattice(text, wdc, unk, set_mincost_node, max_unknown_length=0):
+    """
+    前向きのViterbiを行い, 全ての候補を保持したラティスを作成する
+
+    @param max_unknown_length 未知語の長さの上限(Unknown.run_ends参照)
+    @return NBestLattice. 各ノードのcostは始点からの最小コスト
+    """
+    length = len(text)
+    lattice = NBestLattice(length, set_mincost_node)
+    ends = lattice.ends
+    columns = unk.classify(text, max_unknown_length)
+    for i in range(0, length):
+        if ends[i] is not None:
+            lattice.set(i)
+            wdc.search(text, i, lattice)
+            unk.search(text, i, wdc, lattice, columns)
+    if length in lattice.spaced:
+        lattice.set(length)
+    return lattice
+
+
+def iter_paths(lattice, mtx, costs, n):
+    """
+    総コストの小さい順に経路を返す
+
+    @param lattice build_latticeで作成したラティス
+    @param mtx 連接コスト表
+    @param costs 単語のコスト. costs[単語ID]
+    @param n 必要な経路の数の上限. キューの大きさの制限に使われる
+    @return (総コスト, ノードのリスト)のイテレータ
+    """
+    ends = lattice.ends
+    bos = ends[0][0]
+    matrix = mtx.matrix
+    left_size = mtx.left_size
+    counter = itertools.count()
+    limit = max(n * 2, 1024)
+    # (priority, order, node, cost from the node to EOS, following nodes)
+    queue = [(p.cost + matrix[p.right_id], next(counter), p,
+              matrix[p.right_id], None) for p in ends[-1]]
+    heapq.heapify(queue)
+    while queue:
+        f, _, v, g, tail = heapq.heappop(queue)
+        if v is bos:
+            nodes = []
+            while tail is not None:
+                nodes.append(tail[0])
+                tail = tail[1]
+            yield f, nodes
+            continue
+        g += costs[v.word_id]
+        row = v.left_id * left_size
+        tail = (v, tail)
+        for p in ends[v.start]:
+            g2 = g + matrix[row + p.right_id]
+            heapq.heappush(queue, (p.cost + g2, next(counter), p, g2, tail))
+        if len(queue) > limit:
+            queue = heapq.nsmallest(n, queue)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+NumPyを用いたViterbiエンジン
+
+ある位置から始まる形態素の最小コストの前方ノードを,
+連接コスト表を2次元配列として扱うことでまとめて求める.
+また, 未知語の検索に使用する文字カテゴリをテキスト全体についてまとめて求める
+(igo.dictionary.Unknown.classify).
+"""
+import numpy
+from igo.tagger import MakeLattice
+
+
+def as_ndarray(mtx):
+    """
+    連接コスト表をコピーせずに2次元配列として参照する
+
+    @param mtx Matrix
+    @return matrix2d[右側の形態素の左文脈ID, 左側の形態素の右文脈ID] = 連接コスト
+    """
+    return numpy.frombuffer(mtx.matrix, dtype=numpy.int16).reshape(
+        mtx.right_size, mtx.left_size)
+
+
+def set_mincost_nodes(matrix2d, vns, prevs):
+    """
+    vnsの各ノードについて, prevsの中からコスト最小の前方ノードを設定する
+    """
+    n = len(prevs)
+    prev_costs = numpy.fromiter((p.cost for p in prevs), numpy.int64, n)
+    right_ids = numpy.fromiter((p.right_id for p in prevs), numpy.intp, n)
+    left_ids = numpy.fromiter((vn.left_id for vn in vns), numpy.intp,
+                              len(vns))
+    costs = matrix2d[left_ids[:, None], right_ids] + prev_costs
+    best = costs.argmin(axis=1)
+    mincosts = costs[numpy.arange(len(vns)), best]
+    for vn, b, c in zip(vns, best.tolist(), mincosts.tolist()):
+        vn.prev = prevs[b]
+        vn.cost += c
+
+
+def category_tables(category):
+    """
+    文字カテゴリの表をコピーせずに配列として参照する
+
+    @param category CharCategory
+    @return (char2id, eql_masks, カテゴリのオブジェクト配列)
+    """
+    cats = numpy.empty(len(category.cat), dtype=object)
+    cats[:] = category.cat
+    return (numpy.frombuffer(category.char2id, dtype=numpy.int32),
+            numpy.frombuffer(category.eql_masks, dtype=numpy.int32), cats)
+
+
+def classify(text, tables):
+    """
+    テキストの各文字の文字カテゴリと, 同じ組の文字カテゴリを表すマスクを求める
+
+    @param text UTF-16でエンコードされたテキスト(array('H'))
+    @param tables category_tablesの結果
+    @return (Categoryのリスト, マスクの配列)
+    """
+    char2id, eql_masks, cats = tables
+    codes = numpy.frombuffer(text, dtype=numpy.uint16)
+    return cats.take(char2id.take(codes)).tolist(), eql_masks.take(codes)
+
+
+def run_ends(masks, max_length=0):
+    """
+    Unknown.run_endsと同じ結果をマスクの配列から求める
+
+    同じマスクの文字が続く区間毎にまとめ, 区間単位で後ろから走査する
+    """
+    length = len(masks)
+    if length == 0:
+        return []
+    starts = numpy.flatnonzero(numpy.concatenate(
+        ([True], masks[1:] != masks[:-1])))
+    block_masks = masks[starts].tolist()
+    block_starts = starts.tolist()
+    nblocks = len(block_starts)
+    block_ends = [length] * nblocks
+    for k in range(nblocks - 2, -1, -1):
+        mask = block_masks[k]
+        j = k + 1
+        end = length
+        while j < nblocks:
+            m = block_masks[j]
+            if not mask & m:
+                end = block_starts[j]
+                break
+            if m == mask:
+                end = block_ends[j]
+                break
+            j += 1
+        block_ends[k] = end
+    sizes = numpy.diff(numpy.append(starts, length))
+    ends = numpy.repeat(numpy.array(block_ends, dtype=numpy.intp), sizes)
+    positions = numpy.arange(length)
+    # a character of no category is incompatible even with itself
+    alone = masks == 0
+    if alone.any():
+        ends[alone] = positions[alone] + 1
+    if max_length > 0:
+        numpy.minimum(ends, positions + max_length, out=ends)
+    return ends.tolist()
+
+
+class NumpyMakeLattice(MakeLattice):
+    """
+    形態素を位置毎に溜めておき, flush時にまとめて最小コストを計算する
+    """
+    __slots__ = ['matrix2d', 'pending']
+
+    def __init__(self, nodes, set_mincost_node, matrix2d):
+        MakeLattice.__init__(self, nodes, set_mincost_node)
+        self.matrix2d = matrix2d
+        self.pending = []
+
+    def set(self, i):
+        MakeLattice.set(self, i)
+        self.pending = []
+
+    def __call__(self, vn):
+        self.empty = False
+        nodes = self.nodes
+        end = self.i + vn.length
+        if nodes[end] is None:
+            nodes[end] = []
+        ends = nodes[end]
+        if vn.isspace:
+            ends.extend(self.prevs)
+        else:
+            ends.append(vn)
+            self.pending.append(vn)
+
+    def flush(self):
+        if self.pending:
+            set_mincost_nodes(self.matrix2d, self.pending, self.prevs)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+バイナリ辞書の構成ファイルを1ファイルにまとめる
+
+  $ python -m igo.pack ipadic ipadic.igo
+
+まとめられた辞書はTagger('ipadic.igo')で読み込める.
+"""
+from __future__ import print_function
+import argparse
+import glob
+import os
+import shutil
+
+from igo.dictreader import (PACK_MAGIC, PACK_VERSION, PACK_ALIGN,
+                            PACK_HEADER, PACK_ENTRY)
+
+FILES = ['word2id', 'word.dat', 'word.ary.idx', 'word.inf', 'matrix.bin',
+         'char.category', 'code2category']
+""" 辞書の構成ファイル """
+OPTIONAL_FILES = ['word.feat']
+""" あればまとめる構成ファイル """
+
+
+def _sources(src, name):
+    if name == 'word.dat' and not os.path.exists(os.path.join(src, name)):
+        # splitted dictionary
+        paths = sorted(glob.glob(os.path.join(src, 'word.dat.*')))
+        if paths:
+            return paths
+    return [os.path.join(src, name)]
+
+
+def files(src):
+    """
+    @return 辞書ディレクトリsrcにある構成ファイルの名前のリスト
+    """
+    return FILES + [name for name in OPTIONAL_FILES
+                    if os.path.exists(os.path.join(src, name))]
+
+
+def _align(n):
+    return (n + PACK_ALIGN - 1) // PACK_ALIGN * PACK_ALIGN
+
+
+def pack(src, dst, bigendian=False):
+    """
+    辞書ディレクトリsrcの構成ファイルをdstにまとめる
+    構成ファイルの内容はそのままコピーされる
+
+    @param src バイナリ辞書のディレクトリ
+    @param dst 出力するファイル
+    @param bigendian srcがビッグエンディアンの辞書(gae=True用)かどうか
+    """
+    sections = []
+    for name in files(src):
+        paths = _sources(src, name)
+        sections.append((name, sum(os.path.getsize(p) for p in paths),
+                         _copy_files(paths)))
+    write_packed(dst, sections, bigendian)
+
+
+def _copy_files(paths):
+    def write(out):
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out)
+    return write
+
+
+def write_packed(dst, sections, bigendian=False):
+    """
+    1ファイルにまとめられた辞書を書き出す
+
+    @param dst 出力するファイル
+    @param sections (名前, サイズ, 内容をファイルに書き込む関数)のリスト
+    @param bigendian 内容がビッグエンディアンかどうか
+    """
+    offset = _align(PACK_HEADER.size + PACK_ENTRY.size * len(sections))
+    entries = []
+    for name, size, _ in sections:
+        entries.append((name, offset, size))
+        offset = _align(offset + size)
+
+    with open(dst, 'wb') as out:
+        out.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION,
+                                   1 if bigendian else 0, len(entries)))
+        for name, offset, size in entries:
+            out.write(PACK_ENTRY.pack(name.encode('ascii'), offset, size))
+        for (_, _, write), (name, offset, size) in zip(sections, entries):
+            out.write(b'\x00' * (offset - out.tell()))
+            write(out)
+            if out.tell() != offset + size:
+                raise ValueError('unexpected size of %s' % name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m igo.pack',
+        description='pack files of a binary dictionary into a single file')
+    parser.add_argument('src', help='directory of a binary dictionary')
+    parser.add_argument('dst', help='output file')
+    parser.add_argument('--bigendian', action='store_true',
+                        help='src is a big endian dictionary')
+    args = parser.parse_args(argv)
+    pack(args.src, args.dst, args.bigendian)
+
+
+if __name__ == '__main__':
+    main()
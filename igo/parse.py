@@ -1,12 +1,44 @@
 from __future__ import unicode_literals, print_function
+import argparse
 import sys
 import locale
 import io
 import os
-from .tagger import Tagger
+from .dictionary import Dictionary
+from .stats import Stats
+from .tagger import Tagger, iter_sentences
+from .userdic import UserDictionary
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='igo', description='Japanese morphological analyzer')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='number of worker processes (default: 1)')
+    parser.add_argument(
+        '--chunksize', type=int, default=64,
+        help='number of lines sent to a worker at once (default: 64)')
+    parser.add_argument(
+        '-u', '--userdic', metavar='FILE',
+        help='user dictionary, UTF-8 lines of "surface<TAB>like[<TAB>feature]"'
+        ', see igo.userdic')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='print per-stage timings and counters to stderr at the end, '
+        'see igo.stats')
+    return parser.parse_args(argv)
+
+
+def load_userdic(dic, path):
+    if not path:
+        return None
+    with io.open(path, encoding='utf-8') as f:
+        return UserDictionary(dic).load(f)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     if sys.platform == 'cli':
         i = sys.stdin
         o = sys.stdout
@@ -19,11 +51,38 @@ def main():
         i = io.TextIOWrapper(sys.stdin.buffer)
         o = sys.stdout
 
-    with Tagger(os.getenv('IGO_DICT')) as tagger:
-        for l in i:
-            for m in tagger.parse(l):
+    stats = Stats() if args.stats else None
+    with Dictionary(os.getenv('IGO_DICT')) as dic, \
+            Tagger(dic, user_dictionary=load_userdic(dic, args.userdic),
+                   stats=stats) as tagger:
+        try:
+            run(tagger, args, i, o)
+        finally:
+            if stats is not None:
+                print(stats.report(), file=sys.stderr)
+
+
+def run(tagger, args, i, o):
+    if args.jobs > 1:
+        if tagger.stats is not None:
+            print('igo: --stats does not measure worker processes',
+                  file=sys.stderr)
+        for ms in tagger.parse_many(i, args.jobs, args.chunksize):
+            for m in ms:
                 print(m.fmt('{surface}\t{feature}'), file=o)
             print('EOS', file=o)
+        return
+    # parse line by line(very long lines are split) in constant memory
+    eol = True
+    for s in iter_sentences(i):
+        for m in tagger.iter_parse(s):
+            print(m.fmt('{surface}\t{feature}'), file=o)
+        eol = s.endswith('\n')
+        if eol:
+            print('EOS', file=o)
+    if not eol:
+        print('EOS', file=o)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+解析の計測
+
+Taggerにstatsを指定すると, 解析毎に段階別の時間と件数を計測して集計する.
+指定しない場合, 解析の処理は計測用のラッパーを経由せず, 追加の負荷はない.
+
+  >>> stats = Stats()
+  >>> t = Tagger(stats=stats)
+  >>> t.parse(u'すもももももももものうち')
+  >>> print(stats.report())
+
+段階:
+  search: 単語辞書(とユーザー辞書)の検索
+  unknown: 未知語の検索. テキスト全体の文字カテゴリの分類(Unknown.classify)を含む
+  viterbi: 前方のノードから最小コストのノードを求める処理と, 最適パスの連結.
+           engine='array'では候補の追加と一体のため, searchとunknownに含まれ,
+           EOSの計算と最適パスの取り出しのみ
+  decode: 表層形と素性のデコード. lazy=Trueの場合は計測されない
+"""
+import threading
+import time
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+COUNTERS = ['texts', 'chars', 'trie_probes', 'word_nodes', 'unknown_nodes',
+            'edges', 'morphemes', 'decoded_bytes']
+""" 件数. texts: 解析したテキスト, chars: 文字数(UTF-16),
+trie_probes: 単語辞書のcommon-prefix検索, word_nodes: 単語辞書の候補,
+unknown_nodes: 未知語の候補, edges: 最小コストの計算で比較した前方のノード,
+morphemes: 解析結果の形態素, decoded_bytes: デコードした表層形と素性(UTF-16) """
+TIMERS = ['search', 'unknown', 'viterbi', 'decode', 'total']
+""" 段階毎の時間(秒). totalは解析全体 """
+
+
+class Record(object):
+    """
+    1回の解析の計測値
+    """
+    __slots__ = COUNTERS + TIMERS
+
+    def __init__(self):
+        for k in Record.__slots__:
+            setattr(self, k, 0)
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in Record.__slots__)
+
+
+class Stats(object):
+    """
+    解析の計測値を集計する. 複数のスレッドのTaggerから共有できる
+    """
+
+    def __init__(self, callback=None):
+        """
+        @param callback 解析毎に計測値(Record)を渡して呼び出す関数.
+                        解析したスレッドで呼び出される
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.total = Record()
+            """ 計測値の合計 """
+            self.max_total = 0
+            """ 1回の解析の時間の最大値 """
+
+    def add(self, record):
+        """
+        解析の計測値を合計に加える. Taggerから呼び出される
+        """
+        with self._lock:
+            total = self.total
+            for k in Record.__slots__:
+                setattr(total, k, getattr(total, k) + getattr(record, k))
+            if record.total > self.max_total:
+                self.max_total = record.total
+        if self.callback is not None:
+            self.callback(record)
+
+    def as_dict(self):
+        """
+        @return 合計と, 最大の解析時間の辞書
+        """
+        with self._lock:
+            d = self.total.as_dict()
+            d['max_total'] = self.max_total
+        return d
+
+    def report(self):
+        """
+        @return 集計結果を表にした文字列
+        """
+        d = self.as_dict()
+        texts = d['texts'] or 1
+        lines = ['%-14s %14s %12s' % ('counter', 'total', 'per text')]
+        for k in COUNTERS:
+            lines.append('%-14s %14d %12.1f' % (k, d[k], d[k] / float(texts)))
+        lines.append('%-14s %14s %12s' % ('time', 'total(ms)', 'share(%)'))
+        total = d['total'] or 1
+        for k in TIMERS:
+            lines.append('%-14s %14.1f %12.1f' % (k, d[k] * 1000,
+                                                   d[k] * 100.0 / total))
+        lines.append('%-14s %14.1f' % ('max_total', d['max_total'] * 1000))
+        return '\n'.join(lines)
+
+
+class ProfiledLattice(object):
+    """
+    MakeLattice(NumpyMakeLatticeを含む)の計測用ラッパー
+    最小コストの計算をviterbiとして計測し, ノードと比較した前方ノードを数える
+    """
+    __slots__ = ['fn', 'rec', 'nodes', 'nprevs']
+
+    def __init__(self, fn, rec, nodes):
+        self.fn = fn
+        self.rec = rec
+        self.nodes = nodes
+        self.nprevs = 0
+
+    def set(self, i):
+        prevs = self.nodes[i]
+        self.nprevs = 0 if prevs is None else len(prevs)
+        self.fn.set(i)
+
+    def __call__(self, vn):
+        rec = self.rec
+        if not vn.isspace:
+            rec.edges += self.nprevs
+        t = _timer()
+        self.fn(vn)
+        rec.viterbi += _timer() - t
+
+    def flush(self):
+        t = _timer()
+        self.fn.flush()
+        self.rec.viterbi += _timer() - t
+
+    def isempty(self):
+        return self.fn.isempty()
+
+    def set_mincost_node(self, vn, prevs):
+        rec = self.rec
+        rec.edges += len(prevs)
+        t = _timer()
+        vn = self.fn.set_mincost_node(vn, prevs)
+        rec.viterbi += _timer() - t
+        return vn
+
+
+class _Counter(object):
+    """
+    コールバックに渡されたノードを数える. 空白はノードにならないため数えない
+    """
+    __slots__ = ['callback', 'count']
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.count = 0
+
+    def __call__(self, vn):
+        if not vn.isspace:
+            self.count += 1
+        self.callback(vn)
+
+    def isempty(self):
+        return self.callback.isempty()
+
+    def set(self, i):
+        self.callback.set(i)
+
+    def flush(self):
+        self.callback.flush()
+
+
+class ProfiledWordDic(object):
+    """
+    WordDic(UserWordDicを含む)の計測用ラッパー
+    """
+    __slots__ = ['wdc', 'rec']
+
+    def __init__(self, wdc, rec):
+        self.wdc = wdc
+        self.rec = rec
+
+    def __getattr__(self, name):
+        return getattr(self.wdc, name)
+
+    def search(self, text, start, callback):
+        rec = self.rec
+        rec.trie_probes += 1
+        cb = _Counter(callback)
+        v = rec.viterbi
+        t = _timer()
+        self.wdc.search(text, start, cb)
+        rec.search += _timer() - t - (rec.viterbi - v)
+        rec.word_nodes += cb.count
+
+    def search_from_trie(self, trie_id, start, length, isspace, callback):
+        self.wdc.search_from_trie(trie_id, start, length, isspace, callback)
+
+
+class ProfiledUnknown(object):
+    """
+    Unknownの計測用ラッパー. wdicにはProfiledWordDicを渡すこと
+    """
+    __slots__ = ['unk', 'rec']
+
+    def __init__(self, unk, rec):
+        self.unk = unk
+        self.rec = rec
+
+    def __getattr__(self, name):
+        return getattr(self.unk, name)
+
+    def classify(self, text, max_length=0):
+        t = _timer()
+        columns = self.unk.classify(text, max_length)
+        self.rec.unknown += _timer() - t
+        return columns
+
+    def search(self, text, start, wdic, callback, columns=None):
+        rec = self.rec
+        cb = _Counter(callback)
+        v = rec.viterbi
+        t = _timer()
+        self.unk.search(text, start, wdic, cb, columns)
+        rec.unknown += _timer() - t - (rec.viterbi - v)
+        rec.unknown_nodes += cb.count
+
+    def search_fixed(self, text, start, length, wdic, callback):
+        rec = self.rec
+        cb = _Counter(callback)
+        v = rec.viterbi
+        t = _timer()
+        self.unk.search_fixed(text, start, length, wdic, cb)
+        rec.unknown += _timer() - t - (rec.viterbi - v)
+        rec.unknown_nodes += cb.count
+
+
+def profile(rec, fn, wdc, unk, nodes):
+    """
+    engine='python', 'numpy'の解析に使用する構成要素を計測用のラッパーで包む
+
+    @return (fn, wdc, unk)
+    """
+    return ProfiledLattice(fn, rec, nodes), ProfiledWordDic(wdc, rec), \
+        ProfiledUnknown(unk, rec)
+
+
+class _ArrayProfiler(object):
+    """
+    engine='array'の検索の計測用ラッパーの基底クラス
+    ノードの数はLattice.sizeの増分から求める
+    """
+    __slots__ = ['target', 'rec', 'lattice']
+
+    def __init__(self, target, rec, lattice):
+        self.target = target
+        self.rec = rec
+        self.lattice = lattice
+
+    def _run(self, fn, args, unknown):
+        rec = self.rec
+        lattice = self.lattice
+        size = lattice.size
+        t = _timer()
+        fn(*args)
+        t = _timer() - t
+        n = lattice.size - size
+        rec.edges += n * len(lattice.prev_costs)
+        if unknown:
+            rec.unknown += t
+            rec.unknown_nodes += n
+        else:
+            rec.search += t
+            rec.word_nodes += n
+
+
+class ProfiledArraySearch(_ArrayProfiler):
+    """ Searcher.commonprefix_searchの計測用ラッパー """
+    __slots__ = []
+
+    def __call__(self, text, start, fn):
+        self.rec.trie_probes += 1
+        self._run(self.target, (text, start, fn), False)
+
+
+class ProfiledArrayUser(_ArrayProfiler):
+    """ UserDictionaryの計測用ラッパー """
+    __slots__ = []
+
+    def search_lattice(self, text, start, lattice, exact=0):
+        self._run(self.target.search_lattice, (text, start, lattice, exact),
+                  False)
+
+
+class ProfiledArrayUnknown(_ArrayProfiler):
+    """ Unknownの計測用ラッパー """
+    __slots__ = []
+
+    def classify(self, text, max_length=0):
+        t = _timer()
+        columns = self.target.classify(text, max_length)
+        self.rec.unknown += _timer() - t
+        return columns
+
+    def search(self, text, start, wdic, callback, columns=None):
+        self._run(self.target.search,
+                  (text, start, wdic, callback, columns), True)
+
+    def search_fixed(self, text, start, length, wdic, callback):
+        self._run(self.target.search_fixed,
+                  (text, start, length, wdic, callback), True)
+
+
+def profile_array(rec, lattice, search, user, unk):
+    """
+    engine='array'の解析に使用する検索を計測用のラッパーで包む
+
+    @return (search, user, unk)
+    """
+    return ProfiledArraySearch(search, rec, lattice), \
+        None if user is None else ProfiledArrayUser(user, rec, lattice), \
+        ProfiledArrayUnknown(unk, rec, lattice)
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-from igo.dictionary import Matrix, WordDic, Unknown, ViterbiNode
+from igo.cache import LRUCache, result_sizeof
+from igo.dictionary import Dictionary, ViterbiNode
 from igo.dictreader import UTF16Codec
-import os.path
-from os.path import dirname, abspath
+from igo.export import DEFAULT_TEMPERATURE, ExportedLattice
+from igo.lattice import Lattice
+from igo.nbest import build_lattice, iter_paths
+from igo.stats import Record, _timer, profile, profile_array
+from igo.userdic import UserWordDic
 import array
+import itertools
+import threading
 
 decodeUTF16b = UTF16Codec.decode
 try:
@@ -19,6 +25,180 @@ except:
         return UTF16Codec.decode(a.tostring())
 
 
+SENTENCE_TERMINATORS = u'。．！？!?'
+""" 長い行を区切る際に文末とみなす文字 """
+_CUT_CODES = frozenset(ord(c) for c in SENTENCE_TERMINATORS + u'\n')
+_BATCHES_PER_CHUNK = 4
+""" Tagger.parse_manyが一度にプールへ渡すテキストの数(ワーカー数*chunksizeに掛ける) """
+
+
+def split_sentences(buf, max_length=65536, final=True):
+    """
+    文字列を改行毎に区切る. 改行を含まずmax_lengthより長い部分は,
+    max_length以内の最後の文末記号の直後で区切る.
+    文末記号が見つからない場合はmax_length文字で区切る
+
+    @param buf 区切る文字列
+    @param max_length 区切られた文字列の長さの上限
+    @param final Falseの場合, 続きがあるものとして末尾の改行で終わらない
+                 max_length未満の部分を区切らずに返す
+    @return (区切られた文字列のリスト, 残りの文字列)
+    """
+    result = []
+    pos = 0
+    while pos < len(buf):
+        nl = buf.find(u'\n', pos, pos + max_length)
+        if nl != -1:
+            result.append(buf[pos:nl + 1])
+            pos = nl + 1
+            continue
+        if not final and len(buf) - pos < max_length:
+            # 続きを待つ
+            break
+        end = min(pos + max_length, len(buf))
+        cut = end
+        if end - pos == max_length:
+            cut = max(buf.rfind(c, pos, end)
+                      for c in SENTENCE_TERMINATORS) + 1
+            if cut <= pos:
+                cut = end
+                # do not split a surrogate pair
+                if (cut - 1 > pos and
+                        u'\ud800' <= buf[cut - 1] <= u'\udbff'):
+                    cut -= 1
+        result.append(buf[pos:cut])
+        pos = cut
+    return result, buf[pos:]
+
+
+def find_cut(text, start, end, trie, unk, user=None, max_unknown_length=0):
+    """
+    長いテキストを分けて解析するために, text[start:]をend以前で区切る位置を求める.
+    以下の順に探す
+      1. end以前の最後の改行か文末記号の直後
+      2. 単語辞書, ユーザー辞書, 未知語のどの候補もまたがない最後の位置.
+         単語はendより後ろまで含めて探す. ラティスの全ての経路がこの位置を
+         通るため, テキスト全体の解析でも形態素の境界になる
+         (区間ごとの解析は文頭, 文末の連接コストのため全体の解析と異なることがある)
+      3. end. サロゲートペアは分けない(区間が1文字の場合はend+1)
+
+    @param text UTF-16でエンコードされたテキスト(array('H'))
+    @param trie 単語辞書のSearcher
+    @param unk 未知語辞書
+    @param user ユーザー辞書(igo.userdic.UserDictionary)
+    @param max_unknown_length Tagger(max_unknown_length)と同じ値
+    @return 区切る位置. endがテキストの長さ以上の場合はテキストの長さ
+    """
+    length = len(text)
+    if end >= length:
+        return length
+    for i in range(end - 1, start - 1, -1):
+        if text[i] in _CUT_CODES:
+            return i + 1
+    # unknown words crossing the window end also cross any cut in it
+    window = text[start:end]
+    columns = unk.classify(window, max_unknown_length)
+    categories = columns.categories
+    runs = columns.ends
+    commonprefix = trie.commonprefix
+    reach = 0
+    cut = 0
+    for i in range(end - start):
+        if reach <= i and i > 0 and not 0xD800 <= window[i - 1] <= 0xDBFF:
+            cut = i
+        # the longest candidates. words are searched in the whole text, they
+        # may end after the window
+        found = commonprefix(text, start + i)
+        words = bool(found)
+        if found and i + found[-2] > reach:
+            reach = i + found[-2]
+        if user is not None:
+            found = user.commonprefix(text, start + i)
+            if found:
+                words = True
+                if i + found[-1][0] > reach:
+                    reach = i + found[-1][0]
+        ct = categories[i]
+        if words and not ct.invoke:
+            # Unknown.search adds no unknown words
+            continue
+        r = runs[i] if ct.group else min(runs[i], i + max(ct.length, 1))
+        if r > reach:
+            reach = r
+    if cut > 0:
+        return start + cut
+    if 0xD800 <= text[end - 1] <= 0xDBFF:
+        return end - 1 if end - 1 > start else end + 1
+    return end
+
+
+def _segments(text, length, constraints):
+    """
+    制約を区間のリストに変換する
+
+    @param text 解析対象テキスト
+    @param length UTF-16でのテキストの長さ
+    @param constraints Tagger.parseを参照
+    @return (開始位置, 終了位置, 形態素の長さ)のリスト. 位置はUTF-16での位置.
+            形態素の長さが0以外の区間は1つの形態素になる
+    """
+    pos = None
+    if len(text) != length:
+        # surrogate pairs
+        pos = [0]
+        for c in text:
+            pos.append(pos[-1] + (2 if c > u'\uffff' else 1))
+
+    def u16(i):
+        if not 0 <= i <= len(text):
+            raise ValueError('constraint out of range: %r' % (i, ))
+        return i if pos is None else pos[i]
+
+    bounds = set([0, length])
+    spans = {}
+    for c in constraints:
+        if isinstance(c, (tuple, list)):
+            start, end = u16(c[0]), u16(c[1])
+            if start >= end or spans.get(start, end) != end:
+                raise ValueError('invalid constraint: %r' % (c, ))
+            spans[start] = end
+            bounds.add(start)
+            bounds.add(end)
+        else:
+            bounds.add(u16(c))
+    bounds = sorted(bounds)
+    result = []
+    for start, end in zip(bounds, bounds[1:]):
+        if start in spans:
+            if spans[start] != end:
+                raise ValueError('constraints overlap: %r' % (
+                    (start, spans[start]), ))
+            result.append((start, end, end - start))
+        else:
+            result.append((start, end, 0))
+    return result
+
+
+def iter_sentences(fileobj, max_length=65536):
+    """
+    テキストストリームを改行毎に区切って返す.
+    改行を含まずmax_lengthより長い部分は, max_length以内の最後の文末記号の直後で区切る.
+    文末記号が見つからない場合はmax_length文字で区切る
+
+    @param fileobj テキストストリーム. readメソッドを持つこと
+    @param max_length 返される文字列の長さの上限
+    @return 区切られた文字列のイテレータ. 改行や文末記号は直前の文字列に含まれる
+    """
+    buf = u''
+    while True:
+        chunk = fileobj.read(max_length)
+        sentences, buf = split_sentences(buf + chunk, max_length, not chunk)
+        for sentence in sentences:
+            yield sentence
+        if not chunk:
+            return
+
+
 class Morpheme:
     """
     形態素クラス
@@ -41,12 +221,110 @@ class Morpheme:
             surface=self.surface, feature=self.feature, start=self.start)
 
 
+class LazyMorpheme(object):
+    """
+    表層形と素性を参照されるまでデコードしない形態素クラス
+    素性の各項目はIPADICの素性の形式
+    (品詞,品詞細分類1,品詞細分類2,品詞細分類3,活用型,活用形,原形,読み,発音)を前提とする
+    """
+    __slots__ = ['word_id', 'start', 'length', '_pos', '_text', '_wdc',
+                 '_surface', '_feature', '_fields']
+
+    def __init__(self, word_id, start, length, text, wdc, offset=0):
+        self.word_id = word_id
+        """ 単語ID """
+        self.start = start + offset
+        """ テキスト内での形態素の出現開始位置 """
+        self.length = length
+        """ 形態素の表層形の長さ(UTF-16) """
+        self._pos = start
+        self._text = text
+        self._wdc = wdc
+        self._surface = None
+        self._feature = None
+        self._fields = None
+
+    @property
+    def surface(self):
+        """ 形態素の表層形 """
+        if self._surface is None:
+            p = self._pos
+            self._surface = decodeUTF16a(self._text[p:p + self.length])[0]
+        return self._surface
+
+    @property
+    def feature(self):
+        """ 形態素の素性 """
+        if self._feature is None:
+            self._feature = self._wdc.feature(self.word_id)
+        return self._feature
+
+    @property
+    def fields(self):
+        """ 素性をカンマで分割したタプル """
+        if self._fields is None:
+            self._fields = tuple(self.feature.split(','))
+        return self._fields
+
+    def _field(self, i):
+        fields = self.fields
+        return fields[i] if i < len(fields) else None
+
+    @property
+    def pos(self):
+        """ 品詞 """
+        return self._field(0)
+
+    @property
+    def pos_detail(self):
+        """ 品詞細分類1-3のタプル """
+        return self.fields[1:4]
+
+    @property
+    def conjugation_type(self):
+        """ 活用型 """
+        return self._field(4)
+
+    @property
+    def conjugation_form(self):
+        """ 活用形 """
+        return self._field(5)
+
+    @property
+    def base_form(self):
+        """ 原形 """
+        return self._field(6)
+
+    @property
+    def reading(self):
+        """ 読み. 未知語の場合はNone """
+        return self._field(7)
+
+    @property
+    def pronunciation(self):
+        """ 発音. 未知語の場合はNone """
+        return self._field(8)
+
+    def __str__(self):
+        return self.fmt()
+
+    def fmt(self, fmt="surface: {surface}, feature: {feature}, start={start}"):
+        return fmt.format(
+            surface=self.surface, feature=self.feature, start=self.start)
+
+
 class Tagger:
     """
     形態素解析を行うクラス
+
+    辞書(Dictionary)は読み込み後に変更されず, 複数のTaggerやスレッドから共有
+    できる. 解析中の状態(Workspace)はスレッド毎に作成され, 解析をまたいで
+    再利用される. そのため同じTaggerのparse, wakati等を複数のスレッドから
+    同時に呼び出してよい. 素性と解析結果のキャッシュはロックで保護される.
     """
-    __slots__ = ['wdc', 'unk', 'mtx']
-    __BOS_NODES = [ViterbiNode.makeBOSEOS()]
+    __slots__ = ['dictionary', 'options', 'engine', 'result_cache',
+                 'user_dictionary', 'stats', 'max_unknown_length', '_local',
+                 '_owner']
 
     @staticmethod
     def lookup():
@@ -54,42 +332,284 @@ class Tagger:
         モジュールが置いてある場所から辞書を探す
         @return: モジュール内で見つかった辞書のパス
         """
-        path = os.path.join(abspath(dirname(__file__)), 'ipadic')
-        if (os.path.exists(path)):
-            return path
-        return None
+        return Dictionary.lookup()
 
-    def __init__(self, path=None, gae=False, use_mmap=None):
+    def __init__(self, path=None, gae=False, use_mmap=None, engine='python',
+                 feature_cache_size=0, preload_word_ids=None,
+                 result_cache_size=0, accel=None, native_cache=None,
+                 user_dictionary=None, feature_store=None, stats=None,
+                 max_unknown_length=0):
         """
         バイナリ辞書を読み込んで、形態素解析器のインスタンスを作成する
+        辞書の各構成要素は最初に使用された時に読み込まれる. warmup()で事前に読み込める
 
-        @param path directory of a binary dictionary
+        @param path directory of a binary dictionary,
+                    or a file created by igo.pack, or a Dictionary to share.
+                    Dictionaryを指定した場合, 辞書に関する引数
+                    (gae, use_mmap, feature_cache_size, preload_word_ids,
+                    accel, native_cache, feature_store)は無視される
+        @param engine Viterbi engine. 'python', 'numpy'(requires NumPy) or
+                      'array'(reusable array based lattice, see igo.lattice)
+        @param feature_cache_size デコード済みの素性をキャッシュする単語数
+        @param preload_word_ids 起動時に素性をデコードしてキャッシュに固定する単語IDのリスト
+        @param result_cache_size parse, wakatiの結果をキャッシュするメモリ量の上限(バイト).
+                                 0の場合はキャッシュしない
+        @param accel C実装の高速化モジュール(igo._accel)を使用するかどうか.
+                     None: 利用可能であれば使用, True: 必ず使用, False: 使用しない
+        @param native_cache gae=Trueの辞書をネイティブバイトオーダーに変換して
+                            キャッシュし, mmapで読み込む(igo.convert参照).
+                            True: デフォルトのキャッシュディレクトリを使用,
+                            文字列: キャッシュディレクトリ, None: 変換しない
+        @param user_dictionary 単語辞書と合わせて検索するユーザー辞書
+                               (igo.userdic.UserDictionary)
+        @param feature_store 圧縮された素性データ(word.feat, igo.features参照)を
+                             使用するかどうか. None: あれば使用, False: 使用しない
+        @param stats 解析毎の段階別の時間と件数を集計するigo.stats.Stats.
+                     Noneの場合は計測しない
+        @param max_unknown_length 0より大きい場合, 未知語の長さの上限.
+                                  長い同じ文字種の並びは上限以下の未知語に
+                                  分けられ, ラティスの幅が抑えられる
         """
-        if not path:
-            path = Tagger.lookup()
-        self.wdc = WordDic(path, gae, gae, use_mmap)
-        self.unk = Unknown(path, gae, use_mmap)
-        self.mtx = Matrix(path, gae, use_mmap)
+        if engine not in ('python', 'numpy', 'array'):
+            raise ValueError('unknown engine: %r' % (engine,))
+        if isinstance(path, Dictionary):
+            self.dictionary = path
+            self._owner = False
+        else:
+            self.dictionary = Dictionary(path, gae, use_mmap,
+                                         feature_cache_size, preload_word_ids,
+                                         accel, native_cache, feature_store)
+            self._owner = True
+        """ 辞書. pathから読み込んだ場合はreleaseで解放される """
+        self.user_dictionary = user_dictionary
+        """ ユーザー辞書. 解析中にも単語を追加できる """
+        self.stats = stats
+        """ 計測値の集計(igo.stats.Stats). 解析中にも設定, 解除できる """
+        self.max_unknown_length = max_unknown_length
+        self.options = dict(self.dictionary.options, engine=engine,
+                            result_cache_size=result_cache_size,
+                            user_dictionary=user_dictionary,
+                            max_unknown_length=max_unknown_length)
+        """ コンストラクタの引数. parse_manyのワーカーで使用される """
+        self._local = threading.local()
+        self.result_cache = LRUCache(result_cache_size, result_sizeof) \
+            if result_cache_size > 0 else None
+        self.engine = engine
+        if engine == 'numpy':
+            from igo import numpy_engine  # noqa: F401  fail early
+
+    @property
+    def wdc(self):
+        """ 単語辞書 """
+        return self.dictionary.wdc
+
+    @property
+    def unk(self):
+        """ 未知語辞書 """
+        return self.dictionary.unk
+
+    @property
+    def mtx(self):
+        """ 連接コスト表 """
+        return self.dictionary.mtx
+
+    @property
+    def viterbi(self):
+        """ igo._accel.Viterbi. 高速化モジュールを使用しない場合はNone """
+        return self.dictionary.viterbi
+
+    @property
+    def matrix2d(self):
+        """ engine='numpy'の場合に使用する2次元の連接コスト表 """
+        return self.dictionary.matrix2d
+
+    @property
+    def packed(self):
+        """ 1ファイルにまとめられた辞書から読み込んだ場合はPackedDictionary """
+        return self.dictionary.packed
+
+    def workspace(self):
+        """
+        現在のスレッドのWorkspaceを返す. 最初の呼び出しで作成される
+        """
+        ws = getattr(self._local, 'workspace', None)
+        if ws is None:
+            if self.dictionary is None:
+                raise ValueError('Tagger is already released')
+            ws = self._local.workspace = Workspace(self.dictionary,
+                                                   self.engine,
+                                                   self.user_dictionary)
+        return ws
+
+    def warmup(self, prefetch=True):
+        """
+        辞書の全ての構成要素と現在のスレッドのWorkspaceを準備する
+
+        @param prefetch Trueの場合, mmapされた辞書をmadvise(MADV_WILLNEED)で
+                        先読みさせる
+        @return self
+        """
+        self.dictionary.warmup(prefetch)
+        self.workspace()
+        # parse without the result cache and stats
+        text = array.array('H', UTF16Codec.encode(u'warmup')[0])
+        vn = self.__parse(text)
+        while vn:
+            decodeUTF16a(text[vn.start:vn.start + vn.length])
+            vn = vn.prev
+        return self
 
-    def parse(self, text, result=None):
+    def parse(self, text, result=None, lazy=False, constraints=None,
+              chunk_size=0):
         """
         形態素解析を行う
 
+        制約を指定した場合, 境界をまたぐ候補はラティスに追加されない.
+        区間に一致する単語がない場合は, 区間の先頭の文字の文字カテゴリの未知語になる.
+
         @param text 解析対象テキスト
         @param result 解析結果の形態素が追加されるリスト. None指定時は内部でリストを作成する
+        @param lazy Trueの場合は表層形と素性を参照時にデコードするLazyMorphemeを返す
+        @param constraints 制約のiterable. 位置はtext内での位置.
+                           整数: 形態素の境界になる位置,
+                           (開始位置, 終了位置): 1つの形態素になる区間
+        @param chunk_size 0より大きい場合, テキストをchunk_size以下の長さ(UTF-16)に
+                          区切って解析する(iter_parse参照). constraintsと同時には
+                          指定できない
         @return 解析結果の形態素リスト. {@code parse(text,result)=result}
         """
         if result is None:
             result = []
+        if chunk_size > 0:
+            if constraints is not None:
+                raise ValueError('constraints can not be used with chunk_size')
+            result.extend(self.iter_parse(text, lazy, chunk_size))
+            return result
+        cache = self.result_cache
+        if cache is None or lazy or constraints is not None:
+            u16 = array.array('H', UTF16Codec.encode(text)[0])
+            segments = None if constraints is None else \
+                _segments(text, len(u16), constraints)
+            result.extend(self.__iter_morphemes(u16, 0, lazy, segments))
+            return result
+        key = self.__cache_key('parse', text)
+        ms = cache.get(key)
+        if ms is None:
+            text = array.array('H', UTF16Codec.encode(text)[0])
+            ms = tuple((m.surface, m.feature, m.start)
+                       for m in self.__iter_morphemes(text, 0))
+            cache.put(key, ms)
+        result.extend(Morpheme(*m) for m in ms)
+        return result
+
+    def iter_parse(self, text, lazy=False, chunk_size=0):
+        """
+        形態素解析を行い, 形態素を順に返す
+        形態素の表層形と素性は取り出された時にデコードされる
+
+        chunk_sizeを指定すると, テキストをfind_cutで区切り, 区間毎に独立して解析する.
+        ラティスはテキスト全体ではなく区間毎に作成されるため, 改行を含まない
+        長い文書でもメモリ使用量はchunk_sizeに比例する.
+        形態素の開始位置はテキストの先頭からの位置.
+
+        @param text 解析対象テキスト
+        @param lazy Trueの場合はLazyMorphemeを返す
+        @param chunk_size 0より大きい場合, 一度に解析する長さ(UTF-16)の上限
+        @return 解析結果の形態素のイテレータ
+        """
         text = array.array('H', UTF16Codec.encode(text)[0])
-        vn = self.__parse(text)
-        wd = self.wdc.word_data
+        if chunk_size > 0:
+            return self.__iter_chunks(text, lazy, chunk_size)
+        return self.__iter_morphemes(text, 0, lazy)
+
+    def __iter_chunks(self, text, lazy, chunk_size):
+        trie = self.wdc.trie
+        unk = self.unk
+        start = 0
+        while start < len(text):
+            end = find_cut(text, start, start + chunk_size, trie, unk,
+                           self.user_dictionary, self.max_unknown_length)
+            for m in self.__iter_morphemes(text[start:end], start, lazy):
+                yield m
+            start = end
+
+    def iter_parse_stream(self, fileobj, max_length=65536, lazy=False):
+        """
+        テキストストリームを文毎に形態素解析し, 形態素を順に返す
+        ストリームは改行で区切られ, max_lengthより長い行は文末記号で区切られる.
+        使用するメモリはストリームの長さによらず, max_lengthに比例する
+
+        @param fileobj 解析対象テキストのストリーム. readメソッドを持つこと
+        @param max_length 一度に解析する文字数の上限
+        @param lazy Trueの場合はLazyMorphemeを返す
+        @return 解析結果の形態素のイテレータ. 形態素の開始位置はストリームの先頭からの位置
+        """
+        offset = 0
+        for sentence in iter_sentences(fileobj, max_length):
+            text = array.array('H', UTF16Codec.encode(sentence)[0])
+            for m in self.__iter_morphemes(text, offset, lazy):
+                yield m
+            offset += len(text)
+
+    def __cache_key(self, kind, text):
+        user = self.user_dictionary
+        if user is None:
+            return (kind, text)
+        return (kind, text, user.version)
+
+    def __iter_morphemes(self, text, offset, lazy=False, segments=None):
+        stats = self.stats
+        if stats is not None:
+            for m in self.__iter_profiled(stats, text, offset, lazy,
+                                          segments):
+                yield m
+            return
+        vn = self.__parse(text, segments)
+        wdc = self.workspace().wdc
+        if lazy:
+            while vn:
+                yield LazyMorpheme(vn.word_id, vn.start, vn.length, text, wdc,
+                                   offset)
+                vn = vn.prev
+            return
+        feature = wdc.feature
         while vn:
             surface = decodeUTF16a(text[vn.start:vn.start + vn.length])[0]
-            feature = decodeUTF16b(wd(vn.word_id))[0]
-            result.append(Morpheme(surface, feature, vn.start))
+            yield Morpheme(surface, feature(vn.word_id), vn.start + offset)
             vn = vn.prev
-        return result
+
+    def __iter_profiled(self, stats, text, offset, lazy, segments):
+        """
+        __iter_morphemesと同じ. 計測値をstatsに加える
+        totalは解析とデコードの時間の合計で, 形態素を受け取った側の処理を含まない
+        """
+        rec = Record()
+        rec.texts = 1
+        rec.chars = len(text)
+        try:
+            t = _timer()
+            vn = self.__parse(text, segments, rec)
+            rec.total = _timer() - t
+            wdc = self.workspace().wdc
+            feature = wdc.feature
+            while vn:
+                t = _timer()
+                if lazy:
+                    m = LazyMorpheme(vn.word_id, vn.start, vn.length, text,
+                                     wdc, offset)
+                else:
+                    m = Morpheme(
+                        decodeUTF16a(text[vn.start:vn.start + vn.length])[0],
+                        feature(vn.word_id), vn.start + offset)
+                    rec.decoded_bytes += 2 * (vn.length + len(m.feature))
+                t = _timer() - t
+                rec.decode += t
+                rec.total += t
+                rec.morphemes += 1
+                vn = vn.prev
+                yield m
+        finally:
+            stats.add(rec)
 
     """
     分かち書きを行う
@@ -102,29 +622,175 @@ class Tagger:
     def wakati(self, text, result=None):
         if result is None:
             result = []
+        cache = self.result_cache
+        if cache is not None:
+            key = self.__cache_key('wakati', text)
+            ws = cache.get(key)
+            if ws is None:
+                ws = tuple(self.__wakati(text, []))
+                cache.put(key, ws)
+            result.extend(ws)
+            return result
+        return self.__wakati(text, result)
+
+    def __wakati(self, text, result):
         text = array.array('H', UTF16Codec.encode(text)[0])
+        stats = self.stats
+        if stats is not None:
+            return self.__wakati_profiled(stats, text, result)
         vn = self.__parse(text)
         while vn:
             result.append(decodeUTF16a(text[vn.start:vn.start + vn.length])[0])
             vn = vn.prev
         return result
 
-    def __parse(self, text):
-        length = len(text)
-        nodes = [None] * (length + 1)
-        nodes[0] = Tagger.__BOS_NODES
+    def __wakati_profiled(self, stats, text, result):
+        rec = Record()
+        rec.texts = 1
+        rec.chars = len(text)
+        try:
+            t = _timer()
+            vn = self.__parse(text, None, rec)
+            d = _timer()
+            while vn:
+                result.append(
+                    decodeUTF16a(text[vn.start:vn.start + vn.length])[0])
+                rec.decoded_bytes += 2 * vn.length
+                rec.morphemes += 1
+                vn = vn.prev
+            end = _timer()
+            rec.decode = end - d
+            rec.total = end - t
+        finally:
+            stats.add(rec)
+        return result
 
-        wdc = self.wdc
-        unk = self.unk
-        fn = MakeLattice(nodes, self.set_mincost_node)
-        for i in range(0, length):
-            if nodes[i] is not None:
-                fn.set(i)
-                wdc.search(text, i, fn)  # 単語辞書から形態素を検索
-                unk.search(text, i, wdc, fn)  # 未知語辞書から形態素を検索
+    def __build_lattice(self, text):
+        ws = self.workspace()
+        viterbi = self.viterbi
+        set_mincost_node = self.mtx.set_mincost_node if viterbi is None \
+            else viterbi.set_mincost_node
+        return build_lattice(text, ws.wdc, ws.unk, set_mincost_node,
+                             self.max_unknown_length)
+
+    def lattice(self, text, marginals=False,
+                temperature=DEFAULT_TEMPERATURE):
+        """
+        全ての候補を保持したラティスを返す (igo.export参照)
+
+        @param text 解析対象テキスト
+        @param marginals Trueの場合, 各ノードの周辺確率を求める
+        @param temperature 周辺確率の温度. 小さいほど最適パスに確率が集中する
+        @return ExportedLattice
+        """
+        text = array.array('H', UTF16Codec.encode(text)[0])
+        lattice = ExportedLattice(self.__build_lattice(text), text,
+                                  self.workspace().wdc, self.mtx)
+        if marginals:
+            lattice.compute_marginals(temperature)
+        return lattice
+
+    def parse_nbest(self, text, n, lazy=False):
+        """
+        総コストの小さい順にn個の形態素解析結果を返す (igo.nbest参照)
+        ラティス全体を保持するため, parseより多くのメモリを使用する
+
+        @param text 解析対象テキスト
+        @param n 返す解析結果の数の上限
+        @param lazy Trueの場合はLazyMorphemeを返す
+        @return (総コスト, 形態素リスト)のリスト. 最初の要素の形態素はparse(text)と同じ
+        """
+        text = array.array('H', UTF16Codec.encode(text)[0])
+        lattice = self.__build_lattice(text)
+        ws = self.workspace()
+        feature = ws.wdc.feature
+        result = []
+        for cost, nodes in iter_paths(lattice, self.mtx, ws.wdc.costs, n):
+            if len(result) == n:
+                break
+            if lazy:
+                ms = [LazyMorpheme(vn.word_id, vn.start, vn.length, text,
+                                   ws.wdc) for vn in nodes]
+            else:
+                ms = [Morpheme(decodeUTF16a(text[vn.start:vn.start +
+                                                 vn.length])[0],
+                               feature(vn.word_id), vn.start) for vn in nodes]
+            result.append((cost, ms))
+        return result
+
+    def parse_many(self, texts, workers=None, chunksize=1):
+        """
+        複数のテキストをプロセスプールで形態素解析する
+
+        各ワーカープロセスは同じ辞書を開き直す. mmapが利用可能な環境では
+        辞書のページはOSによって共有され, ワーカー毎にコピーされない.
+
+        @param texts 解析対象テキストのiterable
+        @param workers ワーカープロセス数. None指定時はCPU数. 1以下の場合は現在のプロセスで解析する
+        @param chunksize 一度にワーカーに渡すテキストの数
+        @return 入力と同じ順序で解析結果の形態素リストを返すイテレータ
+        """
+        import multiprocessing
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            for text in texts:
+                yield self.parse(text)
+            return
+        # Pool.imap reads the whole iterable at once. texts are passed in
+        # batches, the next one is queued while the results of the current one
+        # are consumed, so at most two batches are held in memory
+        texts = iter(texts)
+        size = workers * chunksize * _BATCHES_PER_CHUNK
+        pool = multiprocessing.Pool(workers, _init_worker, (self.options, ))
+        try:
+            pending = None
+            while True:
+                batch = list(itertools.islice(texts, size))
+                queued = pool.imap(_parse_in_worker, batch, chunksize) \
+                    if batch else None
+                if pending is not None:
+                    for result in pending:
+                        yield result
+                if queued is None:
+                    break
+                pending = queued
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __parse(self, text, segments=None, rec=None):
+        """
+        @param rec 指定された場合, 計測値(igo.stats.Record)を加える
+        """
+        ws = self.workspace()
+        if ws.lattice is not None:
+            return self.__parse_array(text, ws, segments, rec)
+        length = len(text)
+        fn = ws.begin(length)
+        nodes = ws.nodes
+        wdc = ws.wdc
+        unk = ws.unk
+        if rec is not None:
+            fn, wdc, unk = profile(rec, fn, wdc, unk, nodes)
+        try:
+            if segments is not None:
+                self.__search_segments(text, segments, nodes, wdc, unk, fn)
+            else:
+                columns = unk.classify(text, self.max_unknown_length)
+                for i in range(0, length):
+                    if nodes[i] is not None:
+                        fn.set(i)
+                        wdc.search(text, i, fn)  # 単語辞書から形態素を検索
+                        # 未知語辞書から形態素を検索
+                        unk.search(text, i, wdc, fn, columns)
+                        fn.flush()
 
-        cur = self.set_mincost_node(ViterbiNode.makeBOSEOS(),
-                                    nodes[length]).prev
+            cur = fn.set_mincost_node(ws.eos, nodes[length]).prev
+        except BaseException:
+            ws.clear()
+            raise
+        ws.end(length)
 
         # reverse
         head = None
@@ -135,26 +801,105 @@ class Tagger:
             cur = tmp
         return head
 
-    def set_mincost_node(self, vn, prevs):
-        mtx = self.mtx
-        left_id = vn.left_id
-        f = vn.prev = prevs[0]
-        mincost = f.cost + mtx.linkcost(f.right_id, left_id)
-
-        for i in range(1, len(prevs)):
-            p = prevs[i]
-            cost = p.cost + mtx.linkcost(p.right_id, left_id)
-            if cost < mincost:
-                mincost = cost
-                vn.prev = p
-
-        vn.cost += mincost
+    def __search_segments(self, text, segments, nodes, wdc, unk, fn):
+        """
+        区間毎に切り出したテキストを検索する. 候補は区間の外にはみ出さない
+        """
+        cb = SegmentLattice(fn)
+        for start, end, exact in segments:
+            seg = text[start:end]
+            cb.offset = start
+            cb.exact = exact
+            if exact:
+                # the span is one morpheme
+                if nodes[start] is not None:
+                    cb.set(start)
+                    wdc.search(seg, 0, cb)
+                    if cb.isempty():
+                        unk.search_fixed(seg, 0, exact, wdc, cb)
+                    fn.flush()
+                continue
+            columns = unk.classify(seg, self.max_unknown_length)
+            for i in range(start, end):
+                if nodes[i] is not None:
+                    cb.set(i)
+                    wdc.search(seg, i - start, cb)
+                    unk.search(seg, i - start, wdc, cb, columns)
+                    fn.flush()
+
+    def __parse_array(self, text, ws, segments=None, rec=None):
+        length = len(text)
+        lattice = ws.lattice
+        lattice.reset(length)
+        add_word = lattice.add_word
+        search = ws.wdc.trie.commonprefix_search
+        user = self.user_dictionary
+        unk = ws.unk
+        if rec is not None:
+            search, user, unk = profile_array(rec, lattice, search, user, unk)
+        if segments is None:
+            segments = ((0, length, 0), )
+        for start, end, exact in segments:
+            seg = text if end - start == length else text[start:end]
+            if exact:
+                if lattice.has_ends(start):
+                    lattice.set(start)
+                    search(seg, 0, lambda s, l, trie_id: l == exact and
+                           add_word(s, l, trie_id))
+                    if user is not None:
+                        user.search_lattice(seg, 0, lattice, exact)
+                    if lattice.isempty():
+                        unk.search_fixed(seg, 0, exact, lattice, lattice)
+                continue
+            columns = unk.classify(seg, self.max_unknown_length)
+            for i in range(start, end):
+                if lattice.has_ends(i):
+                    lattice.set(i)
+                    k = i - start
+                    search(seg, k, add_word)  # 単語辞書から形態素を検索
+                    if user is not None:
+                        user.search_lattice(seg, k, lattice)
+                    # 未知語辞書から形態素を検索
+                    unk.search(seg, k, lattice, lattice, columns)
+        if rec is None:
+            return lattice.backtrace(lattice.finish(length))
+        t = _timer()
+        vn = lattice.backtrace(lattice.finish(length))
+        rec.viterbi += _timer() - t
+        rec.edges += len(lattice.prev_costs)
         return vn
 
+    def set_mincost_node(self, vn, prevs):
+        return self.mtx.set_mincost_node(vn, prevs)
+
+    def feature_cache_info(self):
+        """
+        素性キャッシュの統計情報を返す
+
+        @return CacheInfo(hits, misses, maxsize, currsize). キャッシュが無効な場合はNone
+        """
+        cache = self.wdc.feature_cache
+        return cache.info() if cache is not None else None
+
+    def result_cache_info(self):
+        """
+        解析結果キャッシュの統計情報を返す
+
+        @return CacheInfo(hits, misses, maxsize, currsize). サイズの単位はバイト.
+                キャッシュが無効な場合はNone
+        """
+        cache = self.result_cache
+        return cache.info() if cache is not None else None
+
     def release(self):
-        self.wdc.release()
-        self.unk.release()
-        self.mtx.release()
+        """
+        Taggerを解放する. 辞書はpathから読み込んだ場合のみ解放される
+        """
+        self.result_cache = None
+        self._local = threading.local()
+        if self.dictionary is not None and self._owner:
+            self.dictionary.release()
+        self.dictionary = None
 
     def __enter__(self):
         return self
@@ -163,6 +908,97 @@ class Tagger:
         self.release()
 
 
+_worker_tagger = None
+""" parse_manyのワーカープロセス内で使用されるTagger """
+
+
+def _init_worker(options):
+    global _worker_tagger
+    _worker_tagger = Tagger(**options)
+
+
+def _parse_in_worker(text):
+    return _worker_tagger.parse(text)
+
+
+class Workspace(object):
+    """
+    解析中の状態を保持するバッファ
+
+    位置毎の形態素のリスト, MakeLattice, BOS/EOSノード, Lattice(engine='array')を
+    保持し, 解析をまたいで再利用する. 辞書は共有され, 変更されない.
+    Tagger.workspace()により, スレッド毎に作成される.
+    作成したスレッド以外から使用してはならない.
+    """
+    __slots__ = ['wdc', 'unk', 'nodes', 'bos_nodes', 'fn', 'eos', 'lattice']
+
+    MAX_KEEP = 65536
+    """ 解析後に保持する位置毎のリストの長さの上限 """
+
+    def __init__(self, dictionary, engine='python', user_dictionary=None):
+        """
+        @param user_dictionary 指定された場合, wdcはユーザー辞書と合わせて検索する
+        """
+        self.wdc = dictionary.wdc
+        if user_dictionary is not None:
+            self.wdc = UserWordDic(self.wdc, user_dictionary)
+        self.unk = dictionary.unk
+        self.nodes = [None] * 64
+        """ nodes[位置] = その位置で終わる形態素のリスト """
+        self.bos_nodes = [ViterbiNode.makeBOSEOS()]
+        self.lattice = None
+        self.fn = None
+        self.eos = ViterbiNode.makeBOSEOS()
+        mtx = dictionary.mtx
+        viterbi = dictionary.viterbi
+        if engine == 'array':
+            self.lattice = Lattice(dictionary.wdc, mtx, viterbi)
+            return
+        set_mincost_node = mtx.set_mincost_node if viterbi is None \
+            else viterbi.set_mincost_node
+        if engine == 'numpy':
+            from igo.numpy_engine import NumpyMakeLattice
+            self.fn = NumpyMakeLattice(self.nodes, set_mincost_node,
+                                       dictionary.matrix2d)
+        else:
+            self.fn = MakeLattice(self.nodes, set_mincost_node)
+
+    def begin(self, length):
+        """
+        長さlengthのテキストの解析を始める
+        位置0にBOSノードが置かれる
+
+        @return MakeLattice
+        """
+        nodes = self.nodes
+        if len(nodes) <= length:
+            nodes.extend([None] * (length + 1 - len(nodes)))
+        nodes[0] = self.bos_nodes
+        eos = self.eos
+        eos.cost = 0
+        eos.prev = None
+        return self.fn
+
+    def end(self, length):
+        """
+        解析が終わった時に呼び出される
+        MakeLattice.setが各位置のリストを取り除くため, 最後の位置だけを消去する
+        """
+        nodes = self.nodes
+        nodes[length] = None
+        self.eos.prev = None
+        if len(nodes) > Workspace.MAX_KEEP:
+            del nodes[Workspace.MAX_KEEP:]
+
+    def clear(self):
+        """
+        解析が中断された場合に, バッファを全て消去する
+        """
+        nodes = self.nodes
+        nodes[:] = [None] * min(len(nodes), Workspace.MAX_KEEP)
+        self.eos.prev = None
+
+
 class MakeLattice:
     __slots__ = ['nodes', 'i', 'prevs', 'empty', 'set_mincost_node']
 
@@ -191,5 +1027,41 @@ class MakeLattice:
         else:
             ends.append(self.set_mincost_node(vn, self.prevs))
 
+    def flush(self):
+        """
+        位置iから始まる形態素の追加が終わったときに呼び出される
+        """
+        pass
+
+    def isempty(self):
+        return self.empty
+
+
+class SegmentLattice(object):
+    """
+    制約付きの解析で, 区間毎に切り出したテキストの検索結果をMakeLatticeに渡す
+
+    形態素の開始位置をテキスト全体での位置に直す.
+    exactが0以外の場合, 長さがexactの形態素のみを渡す.
+    """
+    __slots__ = ['fn', 'offset', 'exact', 'empty']
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.offset = 0
+        self.exact = 0
+        self.empty = True
+
+    def set(self, i):
+        self.fn.set(i)
+        self.empty = True
+
+    def __call__(self, vn):
+        if self.exact and vn.length != self.exact:
+            return
+        vn.start += self.offset
+        self.empty = False
+        self.fn(vn)
+
     def isempty(self):
         return self.empty
@@ -0,0 +1,109 @@
+# coding: utf-8
+import asyncio
+import concurrent.futures
+import io
+import threading
+import time
+
+import pytest
+
+import igo.tagger
+from igo.aio import AsyncTagger
+
+
+def flat(m):
+    return m.surface, m.feature, m.start
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+TEXTS = ['私の名前は中野です。', 'Hello, world!  123 テスト　です',
+         'おはようー😳こんにちはー美味しいご飯だよ', '']
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_parse(executor):
+    t = igo.tagger.Tagger()
+    stream = 'こんにちは世界。😳すもももももももものうち\n\n東京都' * 3
+
+    async def chunks():
+        for i in range(0, len(stream), 7):
+            yield stream[i:i + 7]
+
+    async def main():
+        async with AsyncTagger(executor=executor, workers=2) as a:
+            ms = await asyncio.gather(*[a.parse(s) for s in TEXTS])
+            ws = await asyncio.gather(*[a.wakati(s) for s in TEXTS])
+            it = [flat(m) async for m in a.iter_parse(chunks(), 16)]
+            return ms, ws, it, a.metrics()
+
+    ms, ws, it, metrics = run(main())
+    assert [[flat(m) for m in x] for x in ms] == \
+        [[flat(m) for m in t.parse(s)] for s in TEXTS]
+    assert ws == [t.wakati(s) for s in TEXTS]
+    assert it == [flat(m) for m in t.iter_parse_stream(io.StringIO(stream),
+                                                       16)]
+    assert metrics.count > 8 and metrics.inflight == 0
+    assert 0 < metrics.p50 <= metrics.p90 <= metrics.p99 <= metrics.max
+
+
+class SlowExecutor(concurrent.futures.ThreadPoolExecutor):
+    """ counts concurrent calls """
+
+    def __init__(self, workers):
+        concurrent.futures.ThreadPoolExecutor.__init__(self, workers)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.started = 0
+
+    def submit(self, fn, *args):
+        def call():
+            with self.lock:
+                self.started += 1
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            time.sleep(0.02)
+            try:
+                return fn(*args)
+            finally:
+                with self.lock:
+                    self.running -= 1
+        return concurrent.futures.ThreadPoolExecutor.submit(self, call)
+
+
+def test_concurrency_limit_and_cancel():
+    executor = SlowExecutor(8)
+
+    async def main():
+        a = AsyncTagger(executor=executor, max_concurrency=2)
+        ws = await asyncio.gather(*[a.wakati('東京都') for _ in range(6)])
+        assert ws == [['東京', '都']] * 6
+        assert executor.peak == 2
+
+        tasks = [asyncio.ensure_future(a.wakati('東京都')) for _ in range(6)]
+        await asyncio.sleep(0.005)
+        for task in tasks[1:]:
+            task.cancel()
+        done = await asyncio.gather(*tasks, return_exceptions=True)
+        assert done[0] == ['東京', '都']
+        assert all(isinstance(x, asyncio.CancelledError) for x in done[1:])
+        # wait for the started one
+        while a.metrics().inflight:
+            await asyncio.sleep(0.01)
+        # slots are released
+        assert await a.wakati('東京都') == ['東京', '都']
+        a.close()
+        return a.metrics()
+
+    metrics = run(main())
+    assert metrics.cancelled == 5
+    assert metrics.count == 8
+    assert executor.started <= 9
+    executor.shutdown()
@@ -0,0 +1,177 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import array
+import io
+import random
+
+import pytest
+
+import igo.build
+import igo.tagger
+from igo.build import DoubleArrayBuilder, Writer, parse_entry, to_key
+from igo.trie import Searcher
+
+CHAR_DEF = '''\
+# name invoke group length
+DEFAULT 0 1 0
+SPACE 0 1 0
+HIRAGANA 0 1 2
+KANJI 0 0 2
+ALPHA 1 1 0
+
+0x0020 SPACE
+0x0041..0x005A ALPHA  # A-Z
+0x0061..0x007A ALPHA
+0x3041..0x3096 HIRAGANA
+0x4E00..0x9FFF KANJI
+0x3007 KANJI HIRAGANA
+'''
+
+UNK_DEF = '''\
+DEFAULT,1,1,10000,記号,一般,*,*,*,*,*
+SPACE,1,1,10000,記号,空白,*,*,*,*,*
+HIRAGANA,1,1,8000,名詞,一般,*,*,*,*,*
+KANJI,1,1,8000,名詞,一般,*,*,*,*,*
+ALPHA,1,1,5000,名詞,固有名詞,*,*,*,*,*
+ALPHA,2,2,9000,記号,アルファベット,*,*,*,*,*
+'''
+
+MATRIX_DEF = '''\
+3 3
+0 0 0
+0 1 10
+0 2 500
+1 0 10
+1 1 200
+1 2 -300
+2 0 10
+2 1 100
+2 2 800
+'''
+
+CSV = [
+    '東京,1,1,3000,名詞,固有名詞,地域,一般,*,*,東京,トウキョウ,トーキョー\n'
+    '京都,1,1,3000,名詞,固有名詞,地域,一般,*,*,京都,キョウト,キョート\n'
+    'へ,2,2,2000,助詞,格助詞,一般,*,*,*,へ,ヘ,エ\n',
+    # a quoted surface, a word out of BMP and several words of a key
+    '"a,""b",1,1,1000,名詞,一般,*,*,*,*,"a,""b"\n'
+    '😳,1,1,1000,記号,一般,*,*,*,*,😳\n'
+    '東,1,1,5000,名詞,固有名詞,地域,一般,*,*,東,ヒガシ,ヒガシ\n'
+    '東,1,1,4000,名詞,一般,*,*,*,*,東,ヒガシ,ヒガシ\n'
+    '東,2,2,4000,接頭詞,名詞接続,*,*,*,*,東,ヒガシ,ヒガシ\n'
+    '行く,1,1,3000,動詞,自立,*,*,五段・カ行促音便,基本形,行く,イク,イク\n',
+]
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    src = tmp_path_factory.mktemp('src')
+    for name, text in [('char.def', CHAR_DEF), ('unk.def', UNK_DEF),
+                       ('matrix.def', MATRIX_DEF), ('a.csv', CSV[0]),
+                       ('b.csv', CSV[1])]:
+        with io.open(str(src / name), 'w', encoding='utf-8') as f:
+            f.write(text)
+    return src
+
+
+def test_parse_entry():
+    assert parse_entry('東京,1,2,-3,名詞,"x,y"') == \
+        ('東京', 1, 2, -3, '名詞,"x,y"')
+    assert parse_entry('"a,""b",1,2,3,*') == ('a,"b', 1, 2, 3, '*')
+    assert parse_entry('東京\t1\t2\t3\t名詞,*', '\t') == \
+        ('東京', 1, 2, 3, '名詞,*')
+    for line in ['東京,1,2', '"東京,1,2,3,*', '東京,a,2,3,*']:
+        with pytest.raises(ValueError):
+            parse_entry(line)
+
+
+def test_double_array(tmp_path):
+    rnd = random.Random(0)
+    chars = 'あいうアイウ漢字ab\x03￿😳'
+    keys = sorted(set(to_key(''.join(rnd.choice(chars)
+                                     for _ in range(rnd.randint(1, 8))))
+                      for _ in range(2000)))
+    path = str(tmp_path / 'word2id')
+    begs, base, lens, chck, tail = DoubleArrayBuilder(keys).build()
+    Writer().write(path, array.array('i', [len(base), len(begs), len(tail)]),
+                   begs, base, lens, chck, tail)
+    trie = Searcher(path)
+    assert trie.size() == len(keys)
+    ids = dict((k, i) for i, k in enumerate(keys))
+    for k, i in ids.items():
+        assert trie.search(array.array('H', [ord(c) for c in k])) == i
+    # strict prefixes of the keys which are not keys
+    prefixes = set(k[:n] for k in keys for n in range(1, len(k))) - set(keys)
+    assert prefixes
+    for k in prefixes:
+        assert trie.search(array.array('H', [ord(c) for c in k])) == -1
+    # compare common-prefix search with the brute force
+    for _ in range(200):
+        text = to_key(''.join(rnd.choice(chars) for _ in range(12)))
+        codes = array.array('H', [ord(c) for c in text])
+        for start in range(len(text)):
+            e = []
+            for end in range(start + 1, len(text) + 1):
+                if text[start:end] in ids:
+                    e.extend([end - start, ids[text[start:end]]])
+            assert trie.commonprefix(codes, start) == e
+    trie.release()
+
+
+def wakati(t, text):
+    return [(m.surface, m.feature.split(',')[0]) for m in t.parse(text)]
+
+
+@pytest.mark.parametrize('engine,accel', [('python', None), ('python', False),
+                                          ('array', None)])
+def test_build(source, tmp_path, engine, accel):
+    dst = str(tmp_path / 'dic')
+    igo.build.build(str(source), dst, encoding='utf-8')
+    t = igo.tagger.Tagger(dst, engine=engine, accel=accel)
+    assert t.wakati('東京へ行く') == ['東京', 'へ', '行く']
+    assert t.parse('東京')[0].feature == \
+        '名詞,固有名詞,地域,一般,*,*,東京,トウキョウ,トーキョー'
+    # words of a surface are sorted by the left context id and cost
+    wdc = t.dictionary.wdc
+    key_id = wdc.trie.search(array.array('H', [ord('東')]))
+    assert [(wdc.left_ids[i], wdc.costs[i]) for i in
+            range(wdc.indices[key_id], wdc.indices[key_id + 1])] == \
+        [(1, 4000), (1, 5000), (2, 4000)]
+    # spaces are skipped, 〇 is also HIRAGANA
+    e = wakati(t, 'a,"b😳XYZ 〇ぬ')
+    assert e == [('a,"b', '名詞'), ('😳', '記号'), ('XYZ', '名詞'),
+                 ('〇ぬ', '名詞')]
+    t.release()
+
+    # for gae=True, with the compressed features
+    dst = str(tmp_path / 'gae')
+    igo.build.main(['--bigendian', '-z', '-e', 'utf-8', dst, str(source)])
+    for native_cache in [None, str(tmp_path / 'cache')]:
+        g = igo.tagger.Tagger(dst, gae=True, engine=engine, accel=accel,
+                              native_cache=native_cache)
+        assert g.dictionary.wdc.store is not None
+        assert g.wakati('東京へ行く') == ['東京', 'へ', '行く']
+        assert wakati(g, 'a,"b😳XYZ 〇ぬ') == e
+        g.release()
+
+
+def test_errors(source, tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for name in ['char.def', 'unk.def', 'matrix.def', 'a.csv']:
+        with io.open(str(source / name), encoding='utf-8') as f:
+            text = f.read()
+        if name == 'unk.def':
+            text = text.replace('KANJI,', 'KANA,')
+        with io.open(str(src / name), 'w', encoding='utf-8') as f:
+            f.write(text)
+    with pytest.raises(ValueError) as e:
+        igo.build.build(str(src), str(tmp_path / 'dic'), encoding='utf-8')
+    assert 'KANJI' in str(e.value)
+
+    with io.open(str(src / 'b.csv'), 'w', encoding='utf-8') as f:
+        f.write('東京,1,1\n')
+    with pytest.raises(ValueError) as e:
+        igo.build.build(str(src), str(tmp_path / 'dic'), encoding='utf-8')
+    assert 'b.csv:1' in str(e.value)
@@ -0,0 +1,64 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import os
+
+import pytest
+
+import igo.features
+import igo.pack
+import igo.tagger
+from igo.dictionary import Dictionary
+from igo.features import split_feature
+
+
+def test_split_feature():
+    assert split_feature('名詞,一般,*,*,*,*,東京,トウキョウ,トーキョー') == \
+        ('名詞,一般,*,*,*,*,', '東京,トウキョウ,トーキョー')
+    assert split_feature('名詞,一般,*,*,*,*') == ('名詞,一般,*,*,*,*', '')
+    assert split_feature('名詞,一般,*,*,*,*,') == ('名詞,一般,*,*,*,*,', '')
+    assert split_feature('a,b,c', 1) == ('a,', 'b,c')
+
+
+@pytest.fixture(scope='module')
+def dicdir(tmp_path_factory):
+    if not hasattr(os, 'symlink'):
+        pytest.skip('symlink is not available')
+    src = Dictionary.lookup()
+    path = tmp_path_factory.mktemp('ipadic')
+    for name in os.listdir(src):
+        os.symlink(os.path.join(src, name), str(path / name))
+    igo.features.compress(str(path))
+    return path
+
+
+def test_compress(dicdir):
+    assert os.path.getsize(str(dicdir / 'word.feat')) < \
+        os.path.getsize(str(dicdir / 'word.dat')) // 4
+    a = Dictionary()
+    b = Dictionary(str(dicdir))
+    assert b.wdc.store is not None and b.wdc.data is None
+    assert Dictionary(str(dicdir), feature_store=False).wdc.store is None
+    for i in range(len(a.wdc.costs) - 1):
+        assert b.wdc.feature(i) == a.wdc.feature(i)
+    assert b.wdc.word_data(123) == a.wdc.word_data(123)
+
+    text = 'すもももももももものうち。東京特許許可局でPythonの解析😳'
+    with igo.tagger.Tagger(a) as t:
+        e = [(m.surface, m.feature) for m in t.parse(text)]
+    with igo.tagger.Tagger(b) as t:
+        assert [(m.surface, m.feature) for m in t.parse(text)] == e
+        assert [(m.surface, m.feature) for m in t.parse(text, lazy=True)] \
+            == e
+    b.warmup()
+    b.release()
+    a.release()
+
+
+def test_pack(dicdir, tmp_path):
+    packed = str(tmp_path / 'ipadic.igo')
+    igo.pack.pack(str(dicdir), packed)
+    d = Dictionary(packed)
+    assert d.wdc.store is not None
+    assert d.wdc.feature(0) == Dictionary().wdc.feature(0)
+    d.release()
@@ -1,7 +1,21 @@
 # coding: utf-8
 from __future__ import unicode_literals
 
+import array
+import io
+import math
+import os
+import sys
+
+import pytest
+
+import igo.accel
+import igo.cache
+import igo.convert
+import igo.pack
 import igo.tagger
+from igo.dictionary import Unknown
+from igo.dictreader import UTF16Codec
 
 
 def flat(m):
@@ -57,3 +71,419 @@ def test_surrogate_pairs():
     e = [('おはよう', '感動詞,*,*,*,*,*,おはよう,オハヨウ,オハヨー', 0),
          ('😳', '記号,一般,*,*,*,*,*', 4)]
     assert a == e
+
+
+def test_parse_many():
+    t = igo.tagger.Tagger()
+    texts = ['こんにちは世界', '私の名前は中野です。', '😳おはよう', ''] * 4
+    e = [[flat(x) for x in t.parse(s)] for s in texts]
+    for workers in (1, 2):
+        a = [[flat(x) for x in ms]
+             for ms in t.parse_many(texts, workers=workers, chunksize=3)]
+        assert a == e
+
+    # the input is read in batches, not at once
+    consumed = []
+
+    def lines():
+        for i in range(1000):
+            consumed.append(i)
+            yield texts[i % len(texts)]
+
+    it = t.parse_many(lines(), workers=2, chunksize=3)
+    assert [flat(x) for x in next(it)] == e[0]
+    assert len(consumed) <= 2 * 2 * 3 * igo.tagger._BATCHES_PER_CHUNK
+    a = [[flat(x) for x in ms] for ms in it]
+    assert len(a) == 999
+    assert a[:len(texts) - 1] == e[1:]
+
+
+def test_numpy_engine():
+    pytest.importorskip('numpy')
+    t = igo.tagger.Tagger()
+    n = igo.tagger.Tagger(engine='numpy')
+    for s in ['私の名前は中野です。', 'すもももももももものうち',
+              'Hello, world!  123 テスト　です', 'おはようー😳こんにちはー美味しいご飯だよ',
+              '']:
+        assert ([flat(x) for x in n.parse(s)] ==
+                [flat(x) for x in t.parse(s)])
+    with pytest.raises(ValueError):
+        igo.tagger.Tagger(engine='unknown')
+
+
+def test_array_engine():
+    t = igo.tagger.Tagger()
+    a = igo.tagger.Tagger(engine='array')
+    # the lattice is reused across calls and grows beyond its initial size
+    for s in ['私の名前は中野です。', 'Hello, world!  123 テスト　です',
+              'おはようー😳こんにちはー美味しいご飯だよ', '',
+              'すもももももももものうち' * 200, 'こんにちは世界']:
+        assert ([flat(x) for x in a.parse(s)] ==
+                [flat(x) for x in t.parse(s)])
+        assert a.wakati(s) == t.wakati(s)
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_workspace(engine):
+    import threading
+    t = igo.tagger.Tagger(engine=engine)
+    texts = ['Hello, world!  123 テスト　です', 'ab  c', '私の名前は中野です。',
+             'すもももももももものうち' * 10]
+    e = [t.wakati(s) for s in texts]
+    ws = t.workspace()
+    # buffers are reused and cleared between calls
+    assert [t.wakati(s) for s in texts] == e
+    assert t.workspace() is ws
+    if engine == 'python':
+        assert all(x is None for x in ws.nodes)
+
+    result = {}
+
+    def work(n):
+        result[n] = ([[t.wakati(s) for s in texts] for _ in range(20)],
+                     t.workspace())
+
+    threads = [threading.Thread(target=work, args=(n, )) for n in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert all(r == [e] * 20 for r, _ in result.values())
+    assert len(set(id(w) for _, w in result.values()) | {id(ws)}) == 5
+
+
+def path_cost(t, ms):
+    wdc, mtx = t.wdc, t.mtx
+    cost = 0
+    right = 0  # BOS
+    for m in ms:
+        cost += mtx.linkcost(right, wdc.left_ids[m.word_id])
+        cost += wdc.costs[m.word_id]
+        right = wdc.right_ids[m.word_id]
+    return cost + mtx.linkcost(right, 0)  # EOS
+
+
+@pytest.mark.parametrize('accel', [False, None])
+def test_parse_nbest(accel):
+    t = igo.tagger.Tagger(accel=accel)
+    for s in ['すもももももももものうち', '外国人参政権', 'Hello  world 　x', '',
+              'おはようー😳こんにちはー美味しいご飯だよ']:
+        r = t.parse_nbest(s, 30, lazy=True)
+        assert 0 < len(r) <= 30
+        assert [flat(m) for m in r[0][1]] == [flat(m) for m in t.parse(s)]
+        assert [c for c, _ in r] == sorted(c for c, _ in r)
+        assert [c for c, _ in r] == [path_cost(t, ms) for _, ms in r]
+        paths = set(tuple(m.word_id for m in ms) for _, ms in r)
+        assert len(paths) == len(r)
+        assert [(c, [flat(m) for m in ms])
+                for c, ms in t.parse_nbest(s, 5)] == \
+            [(c, [flat(m) for m in ms]) for c, ms in r[:5]]
+
+
+@pytest.mark.parametrize('accel', [False, None])
+def test_lattice(accel):
+    t = igo.tagger.Tagger(accel=accel)
+    for s in ['東京都に住む', '外国人参政権', 'Hello  world 　x', '']:
+        lat = t.lattice(s, marginals=True)
+        n = len(lat)
+        assert lat.best_path() == [] if s == '' else \
+            [lat.surface(k) for k in lat.best_path()] == t.wakati(s)
+        paths = t.parse_nbest(s, 100000, lazy=True)
+        assert lat.cost[n - 1] == paths[0][0]
+        assert list(lat.nodes(len(s))) == [n - 1]
+        for k in range(1, n):
+            assert lat.edges(k)
+            for p, c in lat.edges(k):
+                assert lat.start[p] + lat.length[p] <= lat.start[k]
+                assert c == t.mtx.linkcost(lat.right_id[p], lat.left_id[k])
+
+        # brute force over all paths
+        z = 0.0
+        expected = {}
+        for cost, ms in paths:
+            w = math.exp(-(cost - paths[0][0]) / lat.temperature)
+            z += w
+            for m in ms:
+                key = (m.word_id, m.start, len(m.surface))
+                expected[key] = expected.get(key, 0.0) + w
+        assert lat.marginal[0] == pytest.approx(1.0)
+        assert lat.marginal[n - 1] == pytest.approx(1.0)
+        for k in range(1, n - 1):
+            key = (lat.word_id[k], lat.start[k], lat.length[k])
+            e = expected.get(key, 0.0) / z
+            assert lat.marginal[k] == pytest.approx(e, abs=1e-9)
+        a = list(lat.marginal)
+        assert list(lat.compute_marginals(use_numpy=False)) == \
+            pytest.approx(a, abs=1e-9)
+        sharp = lat.compute_marginals(temperature=1.0)
+        assert all(sharp[k] == pytest.approx(1.0) for k in lat.best_path())
+
+
+def test_iter_sentences():
+    f = io.StringIO('ab\ncd。ef。gh\n\nijklmnopqrstu')
+    a = list(igo.tagger.iter_sentences(f, max_length=4))
+    assert a == ['ab\n', 'cd。', 'ef。', 'gh\n', '\n', 'ijkl', 'mnop', 'qrst',
+                 'u']
+
+
+def test_iter_parse():
+    t = igo.tagger.Tagger()
+    s = '私の名前は中野です。'
+    it = t.iter_parse(s)
+    assert flat(next(it)) == ('私', '名詞,代名詞,一般,*,*,*,私,ワタシ,ワタシ', 0)
+    assert [flat(x) for x in it] == [flat(x) for x in t.parse(s)][1:]
+
+    text = 'こんにちは世界\n😳おはよう\n私の名前は中野です。'
+    a = [flat(x) for x in t.iter_parse_stream(io.StringIO(text))]
+    e = [flat(x) for x in t.parse(text)]
+    assert a == e
+
+
+def test_find_cut():
+    t = igo.tagger.Tagger()
+    trie, unk = t.wdc.trie, t.unk
+
+    def cut(s, start, end):
+        text = array.array('H', UTF16Codec.encode(s)[0])
+        return igo.tagger.find_cut(text, start, end, trie, unk)
+
+    assert cut('私の名前は中野です。', 0, 20) == 10
+    assert cut('ab。cd\nefgh', 0, 8) == 6
+    assert cut('ab。cd\nefgh', 0, 5) == 3
+    # no candidate crosses the boundary between ア and 漢
+    assert cut('アアアア漢漢', 0, 5) == 4
+    assert cut('アアアアアア', 0, 5) == 5
+    assert cut('アアアア😳ア', 0, 6) == 4
+    assert cut('ああああ😳😳', 0, 7) in (4, 6)
+    assert cut('😳😳😳😳', 0, 5) == 4
+    assert cut('😳😳😳😳', 2, 3) == 4
+    # 取り消し and 申し込み cross the end of the window
+    assert cut('東京取り消しです', 0, 5) == 2
+    assert cut('東京申し込みです', 0, 5) == 2
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_chunk_size(engine):
+    t = igo.tagger.Tagger(engine=engine)
+    s = '私の名前は中野です。今日はいい天気ですね\n😳おはよう' * 20
+    e = [flat(x) for x in t.parse(s)]
+    for chunk_size in [20, 30, 1000]:
+        assert [flat(x) for x in t.parse(s, chunk_size=chunk_size)] == e
+    # without punctuations, the morphemes are consistent with the text
+    s = '東京都の今日の天気アイウエオＡＢＣ漢字ひらがな' * 20
+    for chunk_size in [1, 16]:
+        pos = 0
+        for m in t.iter_parse(s + '😳', lazy=True, chunk_size=chunk_size):
+            assert m.start == pos
+            pos += len(m.surface.encode('utf-16-le')) // 2
+        assert pos == len(s) + 2
+    # the cuts no candidate crosses are boundaries of the whole parse
+    text = array.array('H', UTF16Codec.encode(s)[0])
+    starts = set(m.start for m in t.parse(s))
+    for chunk_size in [3, 8, 16]:
+        start = 0
+        while start < len(text):
+            end = start + chunk_size
+            start = igo.tagger.find_cut(text, start, end, t.wdc.trie, t.unk)
+            assert start in starts or start >= min(end, len(text))
+    # the window ends inside 取り消し and 申し込み
+    for x in ['東京取り消しです', '東京申し込みです']:
+        e = [flat(m) for m in t.parse(x)]
+        assert [flat(m) for m in t.parse(x, chunk_size=5)] == e
+    with pytest.raises(ValueError):
+        t.parse(s, chunk_size=10, constraints=[1])
+
+
+def test_lazy_morpheme():
+    t = igo.tagger.Tagger()
+    s = '私の名前は中野です。😳'
+    a = t.parse(s, lazy=True)
+    assert [flat(x) for x in a] == [flat(x) for x in t.parse(s)]
+    m = a[0]
+    assert m.pos == '名詞'
+    assert m.pos_detail == ('代名詞', '一般', '*')
+    assert m.base_form == '私'
+    assert m.reading == 'ワタシ'
+    assert m.pronunciation == 'ワタシ'
+    assert a[-1].surface == '😳'
+    assert a[-1].reading is None
+
+    text = 'こんにちは世界\n😳おはよう\n'
+    a = [flat(x) for x in t.iter_parse_stream(io.StringIO(text), lazy=True)]
+    assert a == [flat(x) for x in t.parse(text)]
+
+
+def test_feature_cache():
+    t = igo.tagger.Tagger()
+    assert t.feature_cache_info() is None
+    s = '私の名前は中野です。私の名前は中野です。'
+    e = [flat(x) for x in t.parse(s)]
+
+    ids = [m.word_id for m in t.parse('の。', lazy=True)]
+    c = igo.tagger.Tagger(feature_cache_size=8, preload_word_ids=ids)
+    assert [flat(x) for x in c.parse(s)] == e
+    info = c.feature_cache_info()
+    # 'の' and '。' are preloaded and the other 5 words miss only once
+    assert info.misses == 5
+    assert info.hits == len(e) - 5
+    assert info.maxsize == 8
+    assert info.currsize == 5 + 2
+
+    lru = igo.cache.LRUCache(2)
+    lru.put(1, 'a')
+    lru.put(2, 'b')
+    assert lru.get(1) == 'a'
+    lru.put(3, 'c')  # evicts 2, the least recently used one
+    assert lru.get(2) is None
+    assert lru.get(1) == 'a' and lru.get(3) == 'c'
+
+
+def test_result_cache():
+    t = igo.tagger.Tagger()
+    c = igo.tagger.Tagger(result_cache_size=1 << 16)
+    s = '私の名前は中野です。'
+    e = [flat(x) for x in t.parse(s)]
+    a = c.parse(s)
+    assert [flat(x) for x in a] == e
+    # changes by a caller must not affect the cached result
+    a[0].surface = 'x'
+    a.append(None)
+    assert [flat(x) for x in c.parse(s)] == e
+    assert c.wakati(s) == c.wakati(s) == t.wakati(s)
+    info = c.result_cache_info()
+    assert (info.hits, info.misses) == (2, 2)
+    assert 0 < info.currsize <= info.maxsize
+
+    c = igo.tagger.Tagger(result_cache_size=1)
+    assert [flat(x) for x in c.parse(s)] == e
+    assert c.result_cache_info().currsize == 0
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_accel(engine):
+    if not igo.accel.available():
+        pytest.skip('igo._accel is not built')
+    t = igo.tagger.Tagger(engine=engine, accel=False)
+    a = igo.tagger.Tagger(engine=engine, accel=True)
+    assert t.viterbi is None and a.viterbi is not None
+    for s in ['私の名前は中野です。', 'Hello, world!  123 テスト　です',
+              'おはようー😳こんにちはー美味しいご飯だよ', '',
+              '1234567890' * 30 + 'ＡＢＣ' * 10 + ' x']:
+        assert ([flat(x) for x in a.parse(s)] ==
+                [flat(x) for x in t.parse(s)])
+
+
+@pytest.mark.parametrize('accel,numpy_min_length', [
+    (False, 128), (None, 128), (False, 0), (None, 0)])
+def test_run_ends(accel, numpy_min_length, monkeypatch):
+    if numpy_min_length == 0:
+        pytest.importorskip('numpy')
+    monkeypatch.setattr(Unknown, 'NUMPY_MIN_LENGTH', numpy_min_length)
+    t = igo.tagger.Tagger(accel=accel)
+    unk = t.unk
+    category = unk.category
+    masks = category.eql_masks
+    for s in ['', 'ア', 'アアアあああ漢〇〇漢〇ぬ12３ａｂc  x😳😳',
+              '〇漢あ' * 20 + 'ｱｲｳ' * 5]:
+        text = array.array('H', UTF16Codec.encode(s)[0])
+        expected = []
+        for i in range(len(text)):
+            j = i + 1
+            while j < len(text) and masks[text[i]] & masks[text[j]]:
+                j += 1
+            expected.append(j)
+        assert list(unk.run_ends(text)) == expected
+        assert list(unk.run_ends(text, 3)) == \
+            [min(e, i + 3) for i, e in enumerate(expected)]
+        columns = unk.classify(text, 3)
+        assert list(columns.ends) == \
+            [min(e, i + 3) for i, e in enumerate(expected)]
+        assert [ct.id for ct in columns.categories] == \
+            [category.category(c).id for c in text]
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_max_unknown_length(engine):
+    t = igo.tagger.Tagger(engine=engine)
+    m = igo.tagger.Tagger(t.dictionary, engine=engine, max_unknown_length=4)
+    s = 'ＸＹＺ' * 1000 + 'です'
+    assert t.wakati(s) == [s[:-2], 'です']
+    ws = m.wakati(s)
+    assert ''.join(ws) == s and ws[-1] == 'です'
+    assert max(len(w) for w in ws) == 4
+    assert m.wakati('ＡＢＣです') == t.wakati('ＡＢＣです')
+    assert len(m.parse_nbest(s, 2)) == 2
+    m.release()
+    t.release()
+
+
+@pytest.mark.parametrize('use_mmap', [None, False])
+def test_packed_dictionary(tmp_path, use_mmap):
+    t = igo.tagger.Tagger()
+    dst = str(tmp_path / 'ipadic.igo')
+    igo.pack.pack(igo.tagger.Tagger.lookup(), dst)
+    s = 'おはようー😳こんにちはー美味しいご飯だよ 123 abc'
+    with igo.tagger.Tagger(dst, use_mmap=use_mmap) as p:
+        assert p.packed is not None
+        assert [flat(x) for x in p.parse(s)] == [flat(x) for x in t.parse(s)]
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_lazy_loading(engine):
+    t = igo.tagger.Tagger(engine=engine)
+    d = t.dictionary
+    assert (d._wdc, d._unk, d._mtx) == (None, None, None)
+    s = 'おはようー😳こんにちはー美味しいご飯だよ 123 abc'
+    e = [flat(x) for x in t.parse(s)]
+    assert d._wdc is not None and d._mtx is not None
+    w = igo.tagger.Tagger(engine=engine)
+    assert w.warmup() is w
+    assert w.dictionary._unk is not None
+    assert [flat(x) for x in w.parse(s)] == e
+    w.release()
+    with pytest.raises(ValueError):
+        w.parse(s)
+    # release before anything is loaded
+    igo.tagger.Tagger().release()
+    with pytest.raises(IOError):
+        igo.tagger.Tagger('no-such-dictionary')
+
+
+def make_gae_dictionary(dst):
+    # big endian dictionary with splitted word.dat, like the one for gae=True
+    os.mkdir(dst)
+    for name, arrays in igo.convert.native_sections(
+            igo.tagger.Tagger.lookup(), bigendian=False):
+        data = b''
+        for a in arrays:
+            a = array.array(a.typecode, a)
+            if sys.byteorder == 'little':
+                a.byteswap()
+            data += a.tobytes()
+        if name == 'word.dat':
+            half = len(data) // 4 * 2
+            parts = [('word.dat.0', data[:half]), ('word.dat.1', data[half:])]
+        else:
+            parts = [(name, data)]
+        for n, d in parts:
+            with open(os.path.join(dst, n), 'wb') as f:
+                f.write(d)
+
+
+def test_native_cache(tmp_path):
+    src = str(tmp_path / 'ipadic_gae')
+    cache = str(tmp_path / 'cache')
+    make_gae_dictionary(src)
+    t = igo.tagger.Tagger()
+    s = 'おはようー😳こんにちはー美味しいご飯だよ 123 abc'
+    e = [flat(x) for x in t.parse(s)]
+    with igo.tagger.Tagger(src, gae=True) as g:
+        assert [flat(x) for x in g.parse(s)] == e
+    with igo.tagger.Tagger(src, gae=True, native_cache=cache) as g:
+        assert g.packed is not None
+        assert [flat(x) for x in g.parse(s)] == e
+    files = os.listdir(cache)
+    assert len(files) == 1
+    # the converted copy is reused
+    with igo.tagger.Tagger(src, gae=True, native_cache=cache) as g:
+        assert g.packed.path == os.path.join(cache, files[0])
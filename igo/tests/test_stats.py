@@ -0,0 +1,110 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import io
+import sys
+
+import pytest
+
+import igo.parse
+import igo.tagger
+from igo.stats import COUNTERS, TIMERS, Stats
+
+ENGINES = [('python', None), ('python', False), ('array', None),
+           ('array', False)]
+
+TEXTS = ['すもももももももものうち', '東京都庁で１２３ＡＢＣを見た。', 'abc xyz',
+         '']
+
+
+def flat(ms):
+    return [(m.surface, m.feature, m.start) for m in ms]
+
+
+@pytest.mark.parametrize('engine,accel', ENGINES)
+def test_stats(engine, accel):
+    plain = igo.tagger.Tagger(engine=engine, accel=accel)
+    records = []
+    stats = Stats(records.append)
+    t = igo.tagger.Tagger(plain.dictionary, engine=engine, stats=stats)
+    for text in TEXTS:
+        assert flat(t.parse(text)) == flat(plain.parse(text))
+        assert t.wakati(text) == plain.wakati(text)
+    assert flat(t.parse('東京都', constraints=[1])) == \
+        flat(plain.parse('東京都', constraints=[1]))
+    assert len(records) == len(TEXTS) * 2 + 1
+
+    d = stats.as_dict()
+    assert d['texts'] == len(records)
+    assert d['chars'] == sum(len(s) for s in TEXTS) * 2 + 3
+    for k in COUNTERS:
+        assert d[k] > 0, k
+    for k in TIMERS:
+        assert d[k] >= 0, k
+    assert d['total'] >= d['max_total'] > 0
+    # wakati decodes surfaces only
+    rec = records[1]
+    assert rec.morphemes == len(plain.wakati(TEXTS[0]))
+    assert rec.decoded_bytes == 2 * len(TEXTS[0])
+    assert rec.trie_probes == len(TEXTS[0])
+
+    report = stats.report()
+    for k in COUNTERS + TIMERS:
+        assert k in report
+    stats.reset()
+    assert stats.as_dict()['texts'] == 0
+    t.stats = None
+    t.parse(TEXTS[0])
+    assert stats.as_dict()['texts'] == 0
+    t.release()
+    plain.release()
+
+
+def test_counters_of_engines():
+    # engines count the same nodes and edges
+    dicts = []
+    for engine in ['python', 'array']:
+        stats = Stats()
+        t = igo.tagger.Tagger(engine=engine, stats=stats)
+        for text in TEXTS:
+            t.parse(text)
+        t.release()
+        d = stats.as_dict()
+        dicts.append(dict((k, d[k]) for k in COUNTERS))
+    assert dicts[0] == dicts[1]
+
+
+def test_warmup():
+    # warmup is not measured nor cached
+    stats = Stats()
+    t = igo.tagger.Tagger(stats=stats, result_cache_size=1 << 20).warmup()
+    assert stats.as_dict()['texts'] == 0
+    assert t.result_cache_info().currsize == 0
+    t.release()
+
+
+def test_iter_parse():
+    stats = Stats()
+    t = igo.tagger.Tagger(stats=stats)
+    it = t.iter_parse(TEXTS[1])
+    next(it)
+    assert stats.as_dict()['texts'] == 0
+    ms = list(it)
+    assert stats.as_dict()['morphemes'] == len(ms) + 1
+    t.parse(TEXTS[0], lazy=True)
+    assert stats.as_dict()['texts'] == 2
+    t.release()
+
+
+def test_cli(monkeypatch, capsys):
+    text = 'すもももももももものうち\n'
+    if sys.version_info[0] > 2:
+        stdin = io.TextIOWrapper(io.BytesIO(text.encode('utf-8')),
+                                 encoding='utf-8')
+    else:
+        pytest.skip('igo reads stdin by the file descriptor')
+    monkeypatch.setattr(sys, 'stdin', stdin)
+    igo.parse.main(['--stats'])
+    out, err = capsys.readouterr()
+    assert out.splitlines()[-1] == 'EOS'
+    assert 'trie_probes' in err and 'viterbi' in err
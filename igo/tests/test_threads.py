@@ -0,0 +1,101 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import random
+import sys
+import threading
+
+import pytest
+
+import igo.tagger
+from igo.dictionary import Dictionary
+
+CHARS = ('あいうえおかきくけこアイウエオカキクケコーｱｲｳ漢字東京都'
+         'abcXYZ123１２３ 　、。!?😳')
+
+
+def make_texts(n, seed=0):
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(CHARS) for _ in range(rnd.randint(0, 40)))
+            for _ in range(n)]
+
+
+def flat(m):
+    return m.surface, m.feature, m.start
+
+
+def run_threads(n, target):
+    start = threading.Event()
+    errors = []
+
+    def work(k):
+        start.wait()
+        try:
+            target(k)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(k, )) for k in range(n)]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+@pytest.fixture
+def switch_often():
+    if not hasattr(sys, 'setswitchinterval'):
+        yield
+        return
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.parametrize('engine', ['python', 'array'])
+def test_shared_tagger(engine, switch_often):
+    texts = make_texts(200)
+    expected = [[flat(m) for m in igo.tagger.Tagger().parse(s)]
+                for s in texts]
+
+    # the dictionary is loaded by the threads at the same time
+    t = igo.tagger.Tagger(engine=engine, feature_cache_size=64,
+                          result_cache_size=1 << 16)
+    results = {}
+
+    def work(k):
+        order = list(range(len(texts)))
+        random.Random(k).shuffle(order)
+        r = results[k] = [None] * len(texts)
+        for i in order:
+            r[i] = [flat(m) for m in t.parse(texts[i])]
+            assert t.wakati(texts[i]) == [m[0] for m in r[i]]
+
+    run_threads(8, work)
+    for k in range(8):
+        assert results[k] == expected
+
+
+def test_shared_dictionary(switch_often):
+    texts = make_texts(100, seed=1)
+    expected = [[flat(m) for m in igo.tagger.Tagger().parse(s)]
+                for s in texts]
+    with Dictionary(feature_cache_size=64) as d:
+        results = {}
+
+        def work(k):
+            # lightweight taggers share one dictionary
+            t = igo.tagger.Tagger(d, engine=['python', 'array'][k % 2])
+            results[k] = [[flat(m) for m in t.parse(s)] for s in texts]
+            t.release()
+
+        run_threads(8, work)
+        for k in range(8):
+            assert results[k] == expected
+        # releasing a tagger does not release a shared dictionary
+        assert igo.tagger.Tagger(d).wakati('東京都') == ['東京', '都']
+    with pytest.raises(ValueError):
+        igo.tagger.Tagger(d).wakati('東京都')
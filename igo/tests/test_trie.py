@@ -0,0 +1,75 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import array
+
+import igo.tagger
+from igo.dictreader import UTF16Codec
+from igo.trie import KeyStream, base_id, chck_TERMINATE_CODE
+
+TEXT = ('すもももももももものうち。私の名前は中野です。'
+        '東京特許許可局でPythonの形態素解析を行いました。😳')
+
+
+def reference_commonprefix_search(searcher, key, start, fn):
+    # the KeyStream based implementation used until 1.0.0
+    base = searcher.base
+    chck = searcher.chck
+    begs = searcher.begs
+    tail = searcher.tail
+    lens = searcher.lens
+    node = base[0]
+    offset = -1
+    kin = KeyStream(key, start)
+
+    def call_if_key_including(kin, node, start, offset, fn):
+        node_id = base_id(node)
+        l = lens[node_id]
+        beg = begs[node_id]
+        prefix = tail[beg:beg + l]
+        if kin.startswith(prefix):
+            fn(start, offset + l + 1, node_id)
+
+    while 1:
+        code = kin.read()
+        offset += 1
+        terminal_idx = node + chck_TERMINATE_CODE
+        if chck[terminal_idx] == chck_TERMINATE_CODE:
+            fn(start, offset, base_id(base[terminal_idx]))
+            if code == chck_TERMINATE_CODE:
+                return
+        idx = node + code
+        node = base[idx]
+        if chck[idx] == code:
+            if node >= 0:
+                continue
+            else:
+                call_if_key_including(kin, node, start, offset, fn)
+        return
+
+
+def test_commonprefix_search():
+    trie = igo.tagger.Tagger().wdc.trie
+    text = array.array('H', UTF16Codec.encode(TEXT)[0])
+
+    def collect(search):
+        result = []
+        for i in range(len(text)):
+            search(trie, text, i, lambda *a: result.append(a))
+        return result
+
+    e = collect(reference_commonprefix_search)
+    assert e
+    assert collect(type(trie).commonprefix_search) == e
+
+    for start, length, key_id in e:
+        assert trie.search(text[start:start + length]) == key_id
+    assert trie.search(array.array('H', UTF16Codec.encode('すももX')[0])) == -1
+    # strict prefixes of the keys with a TAIL are not keys
+    assert trie.search(array.array('H', UTF16Codec.encode('あかの')[0])) == -1
+    assert trie.search(array.array('H', UTF16Codec.encode('あかのれん')[0])) != -1
+    found = set((start, length) for start, length, _ in e)
+    for start, length, _ in e:
+        for l in range(1, length):
+            if (start, l) not in found:
+                assert trie.search(text[start:start + l]) == -1
@@ -0,0 +1,130 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import array
+import io
+import pickle
+
+import pytest
+
+import igo.tagger
+from igo.userdic import UserDictionary
+
+ENGINES = [('python', None), ('python', False), ('array', None),
+           ('array', False)]
+
+
+def flat(m):
+    return m.surface, m.feature, m.start
+
+
+def encode(s):
+    return array.array('H', [ord(c) for c in s])
+
+
+def surfaces(ms):
+    return [m.surface for m in ms]
+
+
+@pytest.fixture(scope='module')
+def tagger():
+    t = igo.tagger.Tagger()
+    yield t
+    t.release()
+
+
+def test_add(tagger):
+    ud = UserDictionary(tagger)
+    assert ud.template('東京', '名詞,固有名詞,地域') == \
+        tagger.parse('東京', lazy=True)[0].word_id
+    with pytest.raises(KeyError):
+        ud.template('東京', '動詞')
+    with pytest.raises(KeyError):
+        ud.add('igo', 'no-such-word')
+    # あかの is only a prefix of あかのれん
+    with pytest.raises(KeyError):
+        ud.template('あかの')
+    with pytest.raises(KeyError):
+        ud.add('xyz', like='あかの')
+    assert len(ud) == 0
+    w = ud.add('igo-python', '東京', '名詞,固有名詞')
+    assert w == ud.base and len(ud) == 1
+    assert ud.feature(w) == '名詞,固有名詞,地域,一般,*,*,igo-python'
+    assert ud.add('参政権', '政権', feature='名詞,一般,*,*,*,*,参政権',
+                  cost=0) == w + 1
+    assert ud.commonprefix(encode('igo-python'), 0) == [(10, [w])]
+    assert ud.version == 2
+
+    s = '外国人参政権とigo-pythonの話😳'
+    assert surfaces(tagger.parse(s))[:3] == ['外国', '人参', '政権']
+    for engine, accel in ENGINES:
+        t = igo.tagger.Tagger(engine=engine, accel=accel, user_dictionary=ud)
+        ms = t.parse(s)
+        assert surfaces(ms) == ['外国', '人', '参政権', 'と', 'igo-python',
+                                'の', '話', '😳']
+        assert ms[4].feature == ud.feature(w)
+        assert [flat(m) for m in t.parse(s, lazy=True)] == \
+            [flat(m) for m in ms]
+        assert t.wakati(s) == surfaces(ms)
+        t.release()
+
+    u = igo.tagger.Tagger(tagger.dictionary, user_dictionary=ud)
+    assert surfaces(u.parse_nbest(s, 3)[0][1]) == surfaces(u.parse(s))
+    lat = u.lattice(s, marginals=True)
+    assert [lat.surface(n) for n in lat.best_path()] == surfaces(u.parse(s))
+    assert lat.feature(lat.best_path()[4]) == ud.feature(w)
+
+
+def test_load_and_cache(tagger):
+    ud = UserDictionary(tagger).load(io.StringIO(
+        '# comment\n\nigo-python\t東京/名詞,固有名詞\n'
+        'python\t東京\t名詞,固有名詞,組織,*,*,*,Python\n'))
+    assert len(ud) == 2
+    with pytest.raises(ValueError):
+        ud.load(['igo-python'])
+    t = igo.tagger.Tagger(tagger.dictionary, user_dictionary=ud,
+                          result_cache_size=1 << 16)
+    assert t.wakati('pythonとigo') == ['python', 'と', 'igo']
+    assert t.parse('python')[0].feature.endswith(',Python')
+    # added words invalidate cached results
+    ud.add('igo', '東京')
+    assert t.wakati('pythonとigo') == ['python', 'と', 'igo']
+    assert t.parse('igo')[0].feature.endswith(',igo')
+
+    # words are picklable for worker processes, without the dictionary
+    p = pickle.loads(pickle.dumps(ud))
+    key = encode('igo-python')
+    assert p.commonprefix(key, 0) == ud.commonprefix(key, 0)
+    assert p.features == ud.features
+    with pytest.raises(AttributeError):
+        p.add('x', '東京')
+
+
+@pytest.mark.parametrize('engine,accel', ENGINES)
+def test_constraints(tagger, engine, accel):
+    t = igo.tagger.Tagger(engine=engine, accel=accel)
+    s = '外国人参政権と😳https://example.com/a?b=1を参照'
+    e = [flat(m) for m in t.parse(s)]
+    # boundaries on the best path do not change the result
+    assert [flat(m) for m in t.parse(s, constraints=[2, 4])] == e
+    assert [flat(m) for m in t.parse(s, constraints=[])] == e
+
+    ms = t.parse(s, constraints=[3])
+    assert surfaces(ms)[:4] == ['外国', '人', '参政', '権']
+
+    url = s.index('h'), s.index('を')
+    ms = t.parse(s, constraints=[url, (3, 6)])
+    assert surfaces(ms) == ['外国', '人', '参政権', 'と', '😳',
+                            'https://example.com/a?b=1', 'を', '参照']
+    # positions are in UTF-16
+    assert ms[5].start == url[0] + 1
+    # a span without a word is an unknown word of its first character
+    assert ms[2].feature.startswith('名詞,一般')
+    assert ms[5].feature.startswith('名詞,')
+    assert surfaces(t.parse(s, lazy=True, constraints=[(3, 6)]))[2] == '参政権'
+
+    for bad in [[(3, 3)], [(2, 6), 4], [(2, 6), (4, 8)], [(0, 100)], [-1]]:
+        with pytest.raises(ValueError):
+            t.parse(s, constraints=bad)
+    assert t.wakati(s) == [m[0] for m in e]
+    t.release()
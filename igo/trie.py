@@ -5,6 +5,9 @@ from igo.dictreader import DictReader
 
 if sys.version_info[0] > 2:
     unichr = chr
+    str_types = (str, )
+else:
+    str_types = (str, unicode)  # noqa: F821
 
 
 def base_id(nid):
@@ -39,6 +42,7 @@ class KeyStream:
     """
     文字列を文字のストリームとして扱うためのクラス。
     readメソッドで個々の文字を順に読み込み、文字列の終端に達した場合には{@code Chck_TERMINATE_CODE}が返される。
+    Searcherは添字で直接キーを読むため、このクラスを使用しない
     * XXX: クラス名は不適切
     """
     __slots__ = ['s', 'cur', 'len']
@@ -76,16 +80,18 @@ class Searcher:
     """
     DoubleArray検索用のクラス
     """
-    __slots__ = ['rd', 'num_keys', 'begs', 'base', 'lens', 'chck', 'tail']
+    __slots__ = ['rd', 'num_keys', 'begs', 'base', 'lens', 'chck', 'tail',
+                 'accel']
 
     def __init__(self, path, bigendian=False, use_mmap=None):
         """
         instantiate a DoubleArray Searcher
 
-        @param filepath path of DoubleArray
+        @param path path of DoubleArray, or a reader opened by open_reader
         @param mmap use mmap or not; None: depends on environment
         """
-        self.rd = DictReader(path, bigendian, use_mmap)
+        self.rd = DictReader(path, bigendian, use_mmap) \
+            if isinstance(path, str_types) else path
         with self.rd as r:
             node_size = r.get_int()
             tind_size = r.get_int()
@@ -96,8 +102,22 @@ class Searcher:
             self.lens = r.get_shortarray(tind_size)
             self.chck = r.get_chararray(node_size)
             self.tail = r.get_chararray(tail_size)
+        self.accel = None
+
+    def accelerate(self, mod):
+        """
+        commonprefixに高速化モジュールを使用する
+
+        @param mod igo._accelモジュール. Noneの場合はPythonの実装を使用する
+        """
+        self.accel = None if mod is None else mod.Trie(
+            self.base, self.chck, self.begs, self.lens, self.tail)
+
+    def prefetch(self):
+        self.rd.prefetch()
 
     def release(self):
+        self.accel = None
         del self.begs
         del self.base
         del self.lens
@@ -120,71 +140,87 @@ class Searcher:
         @param key 検索対象のキー文字列
         @return キーが見つかった場合はそのIDを、見つからなかった場合は-1を返す
         """
-        begs = self.begs
-        tail = self.tail
-        lens = self.lens
         base = self.base
         chck = self.chck
         node = base[0]
-
-        def exists(kin, node):
-            node_id = base_id(node)
-            beg = begs[node_id]
-            s = tail[beg:beg + lens[node_id]]
-            return kin.rest().equals(s)
-
-        kin = KeyStream(key)
-        code = kin.read()
+        length = len(key)
+        i = 0
         while 1:
+            code = key[i] if i < length else chck_TERMINATE_CODE
+            i += 1
             idx = node + code
             node = base[idx]
-            if chck[idx] == code:
-                if node >= 0:
-                    continue
-                elif kin.eos() or exists(kin, node):
-                    return base_id(node)
+            if chck[idx] != code:
+                return -1
+            if node >= 0:
+                continue
+            node_id = base_id(node)
+            if i >= length:
+                # the key is a strict prefix of the key with a TAIL
+                return node_id if self.lens[node_id] == 0 else -1
+            if length - i == self.lens[node_id] and \
+                    self._tail_matches(key, i, node_id):
+                return node_id
             return -1
 
-# with, iterator
+    def _tail_matches(self, key, i, node_id):
+        """
+        key[i:]がnode_idのTAIL文字列で始まるかどうか
+        """
+        l = self.lens[node_id]
+        if len(key) - i < l:
+            return False
+        tail = self.tail
+        beg = self.begs[node_id] - i
+        for j in range(i, i + l):
+            if key[j] != tail[beg + j]:
+                return False
+        return True
+
     def commonprefix_search(self, key, start, fn):
         """
         common-prefix検索を行う
-        条件に一致するキーが見つかる度に、fn.call(...)メソッドが呼び出される
+        条件に一致するキーが見つかる度に、fn(start, 一致した長さ, キーID)が呼び出される
 
         @param key 検索対象のキー文字列
         @param start 検索対象となるキー文字列の最初の添字
         @param fn 一致を検出した場合に呼び出されるメソッドを定義したコールバック関数
         """
+        m = self.commonprefix(key, start)
+        for k in range(0, len(m), 2):
+            fn(start, m[k], m[k + 1])
+
+    def commonprefix(self, key, start):
+        """
+        common-prefix検索を行う
+
+        @param key 検索対象のキー文字列
+        @param start 検索対象となるキー文字列の最初の添字
+        @return 一致した長さとキーIDを交互に並べたリスト
+        """
+        if self.accel is not None:
+            return self.accel.commonprefix(key, start)
         base = self.base
         chck = self.chck
-        begs = self.begs
-        tail = self.tail
-        lens = self.lens
+        length = len(key)
+        result = []
         node = base[0]
-        offset = -1
-        kin = KeyStream(key, start)
-
-        def call_if_key_including(kin, node, start, offset, fn):
-            node_id = base_id(node)
-            l = lens[node_id]
-            beg = begs[node_id]
-            prefix = tail[beg:beg+l]
-            if kin.startswith(prefix):
-                fn(start, offset + l + 1, node_id)
-
+        i = start
         while 1:
-            code = kin.read()
-            offset += 1
-            terminal_idx = node + chck_TERMINATE_CODE
-            if chck[terminal_idx] == chck_TERMINATE_CODE:
-                fn(start, offset, base_id(base[terminal_idx]))
-                if code == chck_TERMINATE_CODE:
-                    return
+            if chck[node] == chck_TERMINATE_CODE:
+                result.append(i - start)
+                result.append(base_id(base[node]))
+            if i == length:
+                return result
+            code = key[i]
+            i += 1
             idx = node + code
             node = base[idx]
-            if chck[idx] == code:
-                if node >= 0:
-                    continue
-                else:
-                    call_if_key_including(kin, node, start, offset, fn)
-            return
+            if chck[idx] != code:
+                return result
+            if node < 0:
+                node_id = base_id(node)
+                if self._tail_matches(key, i, node_id):
+                    result.append(i - start + self.lens[node_id])
+                    result.append(node_id)
+                return result
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+メモリ上のユーザー辞書
+
+バイナリ辞書を作り直さずに単語を追加する. 追加する単語の文脈IDとコストは,
+辞書に登録済みの単語(参照する単語)からコピーする.
+
+  >>> ud = UserDictionary(tagger.dictionary)
+  >>> ud.add(u'igo-python', like=u'東京', pos=u'名詞,固有名詞')
+  >>> tagger = Tagger(tagger.dictionary, user_dictionary=ud)
+
+ユーザー辞書の単語IDは単語辞書の単語IDの後に続く.
+単語は文字(UTF-16)毎の辞書を入れ子にしたトライで検索される.
+"""
+import array
+import threading
+
+from igo.dictionary import ViterbiNode
+from igo.dictreader import UTF16Codec
+
+_IDS = -1
+""" トライのノードで, そのノードで終わる単語のIDのリストを格納するキー """
+
+
+def _encode(s):
+    return array.array('H', UTF16Codec.encode(s)[0])
+
+
+class UserDictionary(object):
+    """
+    メモリ上のユーザー辞書
+
+    単語の追加はロックで保護され, 解析中の他のスレッドからも行える.
+    追加された単語は以降の解析で使用される.
+    """
+    __slots__ = ['base', 'trie', 'surfaces', 'features', 'left_ids',
+                 'right_ids', 'costs', 'version', '_dictionary', '_lock']
+
+    def __init__(self, dictionary):
+        """
+        @param dictionary 参照する単語を検索する辞書(igo.dictionary.Dictionary).
+                          Taggerも指定できる
+        """
+        dictionary = getattr(dictionary, 'dictionary', dictionary)
+        self._dictionary = dictionary
+        self._lock = threading.Lock()
+        self.base = len(dictionary.wdc.costs)
+        """ 最初の単語の単語ID """
+        self.trie = {}
+        self.surfaces = []
+        self.features = []
+        self.left_ids = []
+        self.right_ids = []
+        self.costs = []
+        self.version = 0
+        """ 単語が追加される度に増える. 解析結果のキャッシュのキーに使われる """
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def __getstate__(self):
+        # the dictionary is not sent to worker processes
+        return dict((k, getattr(self, k)) for k in UserDictionary.__slots__
+                    if not k.startswith('_'))
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self._dictionary = None
+        self._lock = threading.Lock()
+
+    def template(self, like, pos=None):
+        """
+        参照する単語の単語IDを求める
+
+        @param like 参照する単語の表層形, または単語ID
+        @param pos 参照する単語の素性の接頭辞. 同じ表層形の単語が複数ある場合に
+                   素性がposで始まる最初の単語を選ぶ
+        @return 単語ID
+        """
+        wdc = self._dictionary.wdc
+        if isinstance(like, int):
+            return like
+        trie_id = wdc.trie.search(_encode(like))
+        if trie_id != -1:
+            for i in range(wdc.indices[trie_id], wdc.indices[trie_id + 1]):
+                if pos is None or wdc.feature(i).startswith(pos):
+                    return i
+        raise KeyError('no such word: %s %s' % (like, pos or ''))
+
+    def add(self, surface, like, pos=None, feature=None, cost=None):
+        """
+        単語を追加する
+
+        @param surface 表層形
+        @param like 文脈IDとコストをコピーする単語の表層形, または単語ID
+        @param pos 参照する単語の素性の接頭辞 (templateを参照)
+        @param feature 素性. None指定時は参照する単語の素性の品詞から活用形までの
+                       項目に, 原形としてsurfaceを加えたもの
+        @param cost 単語のコスト. None指定時は参照する単語のコスト.
+                    小さいほど解析結果に選ばれやすい
+        @return 追加した単語の単語ID
+        """
+        if not surface:
+            raise ValueError('empty surface')
+        wdc = self._dictionary.wdc
+        t = self.template(like, pos)
+        if feature is None:
+            fields = wdc.feature(t).split(',')
+            feature = ','.join(fields[:6] + [surface]) \
+                if len(fields) > 6 else ','.join(fields)
+        key = _encode(surface)
+        with self._lock:
+            word_id = self.base + len(self.surfaces)
+            self.surfaces.append(surface)
+            self.features.append(feature)
+            self.left_ids.append(wdc.left_ids[t])
+            self.right_ids.append(wdc.right_ids[t])
+            self.costs.append(wdc.costs[t] if cost is None else cost)
+            node = self.trie
+            for code in key:
+                child = node.get(code)
+                if child is None:
+                    child = node[code] = {}
+                node = child
+            # a new list is published at once, for lock free readers
+            node[_IDS] = node.get(_IDS, []) + [word_id]
+            self.version += 1
+        return word_id
+
+    def load(self, lines):
+        """
+        タブ区切りの行から単語を追加する
+
+        行の形式: 表層形<TAB>参照する単語[<TAB>素性]. 空行と#で始まる行は無視される.
+        参照する単語は「表層形」または「表層形/素性の接頭辞」
+
+        @param lines 行のiterable. ファイルオブジェクト等
+        @return self
+        """
+        for line in lines:
+            line = line.rstrip(u'\r\n')
+            if not line or line.startswith(u'#'):
+                continue
+            fields = line.split(u'\t')
+            if len(fields) < 2:
+                raise ValueError('invalid line: %r' % (line, ))
+            like, _, pos = fields[1].partition(u'/')
+            self.add(fields[0], like, pos or None,
+                     fields[2] if len(fields) > 2 else None)
+        return self
+
+    def commonprefix(self, text, start):
+        """
+        common-prefix検索を行う
+
+        @return (一致した長さ, 単語IDのリスト)のリスト
+        """
+        result = []
+        node = self.trie
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            ids = node.get(_IDS)
+            if ids is not None:
+                result.append((i + 1 - start, ids))
+        return result
+
+    def search(self, text, start, callback):
+        """
+        WordDic.searchと同様にtext[start:]で始まる単語をcallbackに渡す
+        """
+        base = self.base
+        for length, ids in self.commonprefix(text, start):
+            for i in ids:
+                k = i - base
+                callback(ViterbiNode(i, start, length, self.costs[k],
+                                     self.left_ids[k], self.right_ids[k],
+                                     False))
+
+    def search_lattice(self, text, start, lattice, exact=0):
+        """
+        text[start:]で始まる単語を配列ベースのラティス(igo.lattice)に追加する
+
+        @param exact 0以外の場合, 長さがexactの単語のみを追加する
+        """
+        base = self.base
+        for length, ids in self.commonprefix(text, start):
+            if exact and length != exact:
+                continue
+            for i in ids:
+                k = i - base
+                lattice.add_node(i, length, self.costs[k], self.left_ids[k],
+                                 self.right_ids[k])
+
+    def feature(self, word_id):
+        return self.features[word_id - self.base]
+
+
+class _Concat(object):
+    """
+    単語辞書とユーザー辞書の配列を単語IDで参照する
+    """
+    __slots__ = ['base', 'first', 'second']
+
+    def __init__(self, first, second, base):
+        self.first = first
+        self.second = second
+        self.base = base
+
+    def __getitem__(self, i):
+        if i < self.base:
+            return self.first[i]
+        return self.second[i - self.base]
+
+    def __len__(self):
+        return self.base + len(self.second)
+
+
+class UserWordDic(object):
+    """
+    単語辞書とユーザー辞書を合わせて, WordDicとして扱う
+    その他の属性は単語辞書のものを参照する
+    """
+    __slots__ = ['wdc', 'user', 'costs', 'left_ids', 'right_ids']
+
+    def __init__(self, wdc, user):
+        self.wdc = wdc
+        self.user = user
+        self.costs = _Concat(wdc.costs, user.costs, user.base)
+        self.left_ids = _Concat(wdc.left_ids, user.left_ids, user.base)
+        self.right_ids = _Concat(wdc.right_ids, user.right_ids, user.base)
+
+    def __getattr__(self, name):
+        return getattr(self.wdc, name)
+
+    def search(self, text, start, callback):
+        self.wdc.search(text, start, callback)
+        self.user.search(text, start, callback)
+
+    def search_from_trie(self, trie_id, start, length, isspace, callback):
+        self.wdc.search_from_trie(trie_id, start, length, isspace, callback)
+
+    def feature(self, word_id):
+        if word_id >= self.user.base:
+            return self.user.feature(word_id)
+        return self.wdc.feature(word_id)
@@ -2,7 +2,15 @@
 # encoding: utf-8
 
 import io
-from setuptools import setup
+import platform
+import sys
+from setuptools import setup, Extension
+
+# the accelerator is optional, igo falls back to pure Python without it
+ext_modules = []
+if platform.python_implementation() == 'CPython' and sys.version_info[0] > 2:
+    ext_modules.append(
+        Extension('igo._accel', ['igo/_accel.c'], optional=True))
 
 setup(
     name='igo-python',
@@ -40,4 +48,5 @@ setup(
     license='MIT',
     packages=['igo'],
     package_data={'igo': ['ipadic/*']},
+    ext_modules=ext_modules,
     entry_points={'console_scripts': ['igo = igo.parse:main']})